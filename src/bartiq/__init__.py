@@ -12,9 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from typing import TYPE_CHECKING
+
+from ._lazy import lazy_attributes
 from ._routine import Connection, Port, PortDirection, Resource, ResourceType, Routine
-from .compilation import compile_routine, evaluate
-from .symbolics import sympy_backend
+
+if TYPE_CHECKING:
+    from .compilation import compile_routine, evaluate
+    from .symbolics import sympy_backend
 
 __all__ = [
     "Routine",
@@ -27,3 +32,13 @@ __all__ = [
     "evaluate",
     "sympy_backend",
 ]
+
+# Compilation pulls in sympy, which takes a long time to import, hence it is imported only when used
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "compile_routine": ".compilation",
+        "evaluate": ".compilation",
+        "sympy_backend": ".symbolics",
+    },
+)
@@ -0,0 +1,76 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lazy loading of package attributes, used for keeping ``import bartiq`` fast."""
+
+import sys
+from importlib import import_module
+from importlib.util import find_spec
+from types import ModuleType
+from typing import Any, Callable
+
+
+class _LazyModule(ModuleType):
+    """Module whose lazy attributes aren't overwritten by its submodules of the same name.
+
+    When a submodule is imported, Python binds it to an attribute of its parent package. If the package
+    defines a lazy attribute of the same name (e.g. ``bartiq.symbolics.polynomial_backend``), the attribute
+    is instead set to what the submodule defines under this name, as if it was imported eagerly.
+    """
+
+    _lazy_attributes: dict[str, str]
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if (
+            isinstance(value, ModuleType)
+            and value.__name__ == f"{self.__name__}.{name}"
+            and self._lazy_attributes.get(name) == f".{name}"
+        ):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+def lazy_attributes(module_name: str, attributes: dict[str, str]) -> tuple[Callable[[str], Any], Callable[[], list]]:
+    """Create module-level ``__getattr__`` and ``__dir__`` functions importing attributes on first access.
+
+    See PEP 562 for details on how these functions are used by Python.
+
+    Args:
+        module_name: name of the package whose attributes are loaded lazily.
+        attributes: names of (relative) modules defining the attributes, keyed by names of the attributes.
+
+    Returns:
+        A tuple ``(__getattr__, __dir__)`` which should be assigned to the package's module-level names.
+    """
+    module = sys.modules[module_name]
+    vars(module)["_lazy_attributes"] = attributes
+    module.__class__ = _LazyModule
+
+    def __getattr__(name: str) -> Any:
+        if name not in attributes:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = getattr(import_module(attributes[name], module_name), name)
+        # Subsequent lookups won't go through __getattr__
+        setattr(module, name, value)
+        return value
+
+    def __dir__() -> list:
+        return sorted(set(vars(module)) | set(attributes))
+
+    return __getattr__, __dir__
+
+
+def is_installed(package: str) -> bool:
+    """Check if given package can be imported, without importing it."""
+    return find_spec(package) is not None
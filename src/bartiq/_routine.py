@@ -19,10 +19,31 @@
 
 from __future__ import annotations
 
+import gc
+import hashlib
+import json
 from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum
-from typing import Annotated, Any, Iterable, Optional, Sequence, TypeVar, Union, cast
+from functools import cache
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    SupportsIndex,
+    TypeVar,
+    Union,
+    cast,
+)
 
+from pydantic import (
+    AfterValidator,
+)
 from pydantic import BaseModel as _BaseModel
 from pydantic import (
     BeforeValidator,
@@ -32,10 +53,15 @@ from pydantic import (
     field_serializer,
     field_validator,
 )
-from qref.schema_v1 import NAME_PATTERN
 from typing_extensions import Self
 
+from ._traversal import post_order, pre_order
+
 T = TypeVar("T", bound="Routine")
+_Model = TypeVar("_Model", bound=_BaseModel)
+
+# Same as qref.schema_v1.NAME_PATTERN, which is not imported, since importing QREF's schema takes a long time
+NAME_PATTERN = "[A-Za-z_][A-Za-z0-9_]*"
 
 TYPE_LOOKUP = {
     int: "int",
@@ -80,6 +106,16 @@ def _deserialize_value(v: Union[dict[str, Any], Value]) -> Value:
 AnnotatedValue = Annotated[Value, BeforeValidator(_deserialize_value), PlainSerializer(_serialize_value)]
 
 
+def _enum_value(value: Union[Enum, str]) -> str:
+    return value.value if isinstance(value, Enum) else value
+
+
+# Enums are stored as their values, regardless of whether the model containing them is validated on its own
+# or as a part of another model, for which pydantic doesn't always honour use_enum_values
+AnnotatedResourceType = Annotated[ResourceType, AfterValidator(_enum_value), PlainSerializer(_enum_value)]
+AnnotatedPortDirection = Annotated[PortDirection, AfterValidator(_enum_value), PlainSerializer(_enum_value)]
+
+
 def _resolve_port(selector: str, children: dict[str, Routine], ports: dict[str, Port]):
     *child_selector, port_name = selector.split(".")
     return children[child_selector[0]].ports[port_name] if child_selector else ports[port_name]
@@ -99,21 +135,308 @@ def _parse_connection_dict(connection: dict[str, str], children: dict[str, Routi
         ) from e
 
 
-def _find_descendant(selector, children):
-    direct_child_selector, *sub_selector = selector.split(".", 1)
-    try:
-        child = children[direct_child_selector]
-        return child.find_descendant(sub_selector[0]) if sub_selector else child
-    except (KeyError, ValueError) as e:
-        raise ValueError("Child {selector} not found.") from e
-
-
 def _update_parent(children, parent: Routine) -> None:
     for child in children:
         child.parent = parent
 
 
-def _sort_children_topologically(routine: T) -> Iterable[T]:
+def _invalidating_index(method):
+    def _method(self, *args, **kwargs):
+        self.invalidate_index()
+        return method(self, *args, **kwargs)
+
+    return _method
+
+
+class _ConnectionList(list):
+    """List of connections, indexed by their source and target ports.
+
+    The index allows for finding connection starting or ending at given port in constant time.
+    It is built on the first lookup and discarded whenever the list is modified.
+    """
+
+    _by_source: Optional[dict[int, Connection]] = None
+    _by_target: Optional[dict[int, Connection]] = None
+    # Incremented on every modification, so that other data derived from connections can detect changes
+    version: int = 0
+
+    def _build_index(self) -> None:
+        by_source: dict[int, Connection] = {}
+        by_target: dict[int, Connection] = {}
+        # If there are multiple connections for a single port, the first one is indexed, like in a linear search
+        for connection in reversed(self):
+            by_source[id(connection.source)] = connection
+            by_target[id(connection.target)] = connection
+        self._by_source, self._by_target = by_source, by_target
+
+    def invalidate_index(self) -> None:
+        """Discard the index, so that it is rebuilt on the next lookup."""
+        self._by_source = self._by_target = None
+        self.version += 1
+        _invalidate_structural_hashes()
+
+    def outgoing(self, port: Port) -> Optional[Connection]:
+        """Return the connection whose source is given port, or None if there is no such connection."""
+        if self._by_source is None:
+            self._build_index()
+        return self._by_source.get(id(port))  # type: ignore[union-attr]
+
+    def incoming(self, port: Port) -> Optional[Connection]:
+        """Return the connection whose target is given port, or None if there is no such connection."""
+        if self._by_target is None:
+            self._build_index()
+        return self._by_target.get(id(port))  # type: ignore[union-attr]
+
+    def __getstate__(self):
+        # Index is keyed by ids of ports, which are different in copies
+        return None
+
+    append = _invalidating_index(list.append)
+    extend = _invalidating_index(list.extend)
+    insert = _invalidating_index(list.insert)
+    pop = _invalidating_index(list.pop)
+    remove = _invalidating_index(list.remove)
+    clear = _invalidating_index(list.clear)
+    sort = _invalidating_index(list.sort)
+    reverse = _invalidating_index(list.reverse)
+    __setitem__ = _invalidating_index(list.__setitem__)
+    __delitem__ = _invalidating_index(list.__delitem__)
+    __iadd__ = _invalidating_index(list.__iadd__)
+    __imul__ = _invalidating_index(list.__imul__)
+
+
+def _indexed_connections(routine: Routine) -> _ConnectionList:
+    # Connections may be a plain list if the routine was constructed without validation. They are
+    # replaced directly in the model's dict, as otherwise pydantic would mark them as explicitly set.
+    if not isinstance(routine.connections, _ConnectionList):
+        vars(routine)["connections"] = _ConnectionList(routine.connections)
+    return cast(_ConnectionList, routine.connections)
+
+
+# Token identifying the current structure of all routine trees. It is replaced whenever names, parents
+# or children of indexed routines change, which invalidates all the path indices built so far.
+_current_tree_token = object()
+
+
+def _invalidate_path_indices() -> None:
+    global _current_tree_token
+    _current_tree_token = object()
+
+
+def _invalidating_path_indices(method):
+    def _method(self, *args, **kwargs):
+        _invalidate_path_indices()
+        return method(self, *args, **kwargs)
+
+    return _method
+
+
+# Token identifying the current contents of all routines. It is replaced whenever any routine, port,
+# resource or connection is modified, which invalidates all the structural hashes computed so far.
+_current_contents_token = object()
+
+
+def _invalidate_structural_hashes() -> None:
+    global _current_contents_token
+    _current_contents_token = object()
+
+
+def _invalidating_structural_hashes(method):
+    def _method(self, *args, **kwargs):
+        _invalidate_structural_hashes()
+        return method(self, *args, **kwargs)
+
+    return _method
+
+
+class _TrackedDict(dict):
+    """Dictionary which invalidates structural hashes whenever it or any dictionary or list nested in it is modified.
+
+    Dictionaries and lists stored in it are replaced with their tracked counterparts.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__()
+        dict.update(self, _tracked_items(dict(*args, **kwargs)))
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        _invalidate_structural_hashes()
+        dict.__setitem__(self, key, _tracked(value))
+
+    def __ior__(self, other: Any) -> Self:  # type: ignore[misc, override]
+        self.update(other)
+        return self
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        _invalidate_structural_hashes()
+        dict.update(self, _tracked_items(dict(*args, **kwargs)))
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        _invalidate_structural_hashes()
+        return dict.setdefault(self, key, _tracked(default))
+
+    __delitem__ = _invalidating_structural_hashes(dict.__delitem__)
+    pop = _invalidating_structural_hashes(dict.pop)
+    popitem = _invalidating_structural_hashes(dict.popitem)
+    clear = _invalidating_structural_hashes(dict.clear)
+
+
+class _TrackedList(list):
+    """List which invalidates structural hashes whenever it or any dictionary or list nested in it is modified.
+
+    Dictionaries and lists stored in it are replaced with their tracked counterparts.
+    """
+
+    def __init__(self, items: Iterable[Any] = ()):
+        super().__init__(map(_tracked, items))
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        _invalidate_structural_hashes()
+        list.__setitem__(self, index, list(map(_tracked, value)) if isinstance(index, slice) else _tracked(value))
+
+    def __iadd__(self, other: Iterable[Any]) -> Self:  # type: ignore[misc, override]
+        self.extend(other)
+        return self
+
+    def append(self, value: Any) -> None:
+        _invalidate_structural_hashes()
+        list.append(self, _tracked(value))
+
+    def extend(self, values: Iterable[Any]) -> None:
+        _invalidate_structural_hashes()
+        list.extend(self, map(_tracked, values))
+
+    def insert(self, index: SupportsIndex, value: Any) -> None:
+        _invalidate_structural_hashes()
+        list.insert(self, index, _tracked(value))
+
+    pop = _invalidating_structural_hashes(list.pop)
+    remove = _invalidating_structural_hashes(list.remove)
+    clear = _invalidating_structural_hashes(list.clear)
+    sort = _invalidating_structural_hashes(list.sort)
+    reverse = _invalidating_structural_hashes(list.reverse)
+    __delitem__ = _invalidating_structural_hashes(list.__delitem__)
+    __imul__ = _invalidating_structural_hashes(list.__imul__)
+
+
+# Fields of routines holding containers that are replaced with their tracked counterparts
+_TRACKED_FIELDS = ("ports", "resources", "input_params", "local_variables", "linked_params", "meta")
+
+
+def _tracked(value: Any) -> Any:
+    # Tracked containers contain only tracked containers, hence they don't need to be converted
+    if isinstance(value, dict) and not isinstance(value, _TrackedDict):
+        return _TrackedDict(value)
+    if isinstance(value, list) and not isinstance(value, _TrackedList):
+        return _TrackedList(value)
+    return value
+
+
+def _tracked_items(items: dict[Any, Any]) -> Iterator[tuple[Any, Any]]:
+    return ((key, _tracked(value)) for key, value in items.items())
+
+
+class _ChildrenDict(_TrackedDict):
+    """Dictionary of children, which invalidates path indices and structural hashes whenever it is modified."""
+
+    __setitem__ = _invalidating_path_indices(_TrackedDict.__setitem__)
+    __delitem__ = _invalidating_path_indices(_TrackedDict.__delitem__)
+    __ior__ = _invalidating_path_indices(_TrackedDict.__ior__)
+    pop = _invalidating_path_indices(_TrackedDict.pop)
+    popitem = _invalidating_path_indices(_TrackedDict.popitem)
+    clear = _invalidating_path_indices(_TrackedDict.clear)
+    update = _invalidating_path_indices(_TrackedDict.update)
+    setdefault = _invalidating_path_indices(_TrackedDict.setdefault)
+
+
+class _PathIndex:
+    """Paths of routines in a tree, and routines at paths in that tree.
+
+    Paths are built from names of the routines (like in `Routine.absolute_path`), while selectors
+    from the keys of their parents' children dictionaries (like in `Routine.find_descendant`).
+    In correctly constructed routines both are the same, apart from the root's name.
+    Both are computed on first use, and the index is only valid as long as its token is the current one.
+    """
+
+    def __init__(self, root: Routine):
+        self.token = _current_tree_token
+        self.root = root
+        # Triples (routine, path, path excluding root name), keyed by ids of routines
+        self._paths: dict[int, tuple[Routine, str, str]] = {id(root): (root, root.name, "")}
+        # Pairs (routine, selector from the root) keyed by ids of routines, and routines keyed by their selectors
+        self._selectors: Optional[dict[int, tuple[Routine, str]]] = None
+        self._routines: Optional[dict[str, Routine]] = None
+
+        for routine in pre_order(root, lambda routine: routine.children.values()):
+            routine._path_index = self
+
+    def path(self, routine: Routine, exclude_root_name: bool) -> str:
+        """Return path of given routine from the root."""
+        if (cached := self._paths.get(id(routine))) is None or cached[0] is not routine:
+            cached = self._cache_path(routine)
+        return cached[2] if exclude_root_name else cached[1]
+
+    def _cache_path(self, routine: Routine) -> tuple[Routine, str, str]:
+        uncached = []
+        while (cached := self._paths.get(id(routine))) is None or cached[0] is not routine:
+            uncached.append(routine)
+            routine = cast(Routine, routine.parent)
+
+        _, path, relative_path = cached
+        for routine in reversed(uncached):
+            path = f"{path}.{routine.name}"
+            relative_path = f"{relative_path}.{routine.name}" if relative_path else routine.name
+            cached = self._paths[id(routine)] = (routine, path, relative_path)
+        return cached
+
+    def find(self, routine: Routine, selector: str) -> Optional[Routine]:
+        """Return descendant of given routine with given selector, or None if there's no such descendant."""
+        if self._selectors is None or self._routines is None:
+            self._index_selectors()
+        if (own := self._selectors.get(id(routine))) is None or own[0] is not routine:  # type: ignore[union-attr]
+            # Routine was attached to the tree only by setting its parent, so it isn't in the index
+            return _find_descendant_by_keys(routine, selector)
+        own_selector = own[1]
+        return self._routines.get(f"{own_selector}.{selector}" if own_selector else selector)  # type: ignore
+
+    def _index_selectors(self) -> None:
+        selectors = {id(self.root): (self.root, "")}
+        routines = {"": self.root}
+        for routine in pre_order(self.root, lambda routine: routine.children.values()):
+            selector = selectors[id(routine)][1]
+            for key, child in routine.children.items():
+                child_selector = f"{selector}.{key}" if selector else key
+                selectors[id(child)] = (child, child_selector)
+                routines[child_selector] = child
+        self._selectors, self._routines = selectors, routines
+
+
+def _find_descendant_by_keys(routine: Routine, selector: str) -> Optional[Routine]:
+    for key in selector.split("."):
+        if (child := routine.children.get(key)) is None:
+            return None
+        routine = child
+    return routine
+
+
+def _path_index(routine: Routine) -> _PathIndex:
+    if _is_indexed(routine):
+        return routine._path_index  # type: ignore[return-value]
+    root = routine
+    while root.parent is not None:
+        root = root.parent
+    return _PathIndex(root)
+
+
+def _is_indexed(routine: Routine) -> bool:
+    try:
+        index = routine._path_index
+    except AttributeError:  # Routine was copied or constructed without calling __init__
+        return False
+    return index is not None and index.token is _current_tree_token
+
+
+def _sort_children_topologically(routine: T) -> list[T]:
     """Sort children of given routine topologically.
 
     This function uses Kahn's algorithm, see:
@@ -122,13 +445,40 @@ def _sort_children_topologically(routine: T) -> Iterable[T]:
     Topological order is not unique, but guarantees that if two children a and b
     are joined by the edge a->b, then a will appear in the order before b
     (but not necessarily just before).
+
+    The order is cached in the routine, and it is only computed again if its children
+    or connections change.
     """
+    connections = _indexed_connections(routine)
+    children_ids = tuple(map(id, routine.children.values()))
+    try:
+        cached = routine._children_order
+    except AttributeError:  # Routine was copied or constructed without calling __init__
+        cached = None
+
+    if (
+        cached is not None
+        and cached.connections is connections
+        and cached.version == connections.version
+        and cached.children_ids == children_ids
+    ):
+        return cast(list[T], cached.order)
+
+    order = _topological_order(routine)
+    routine._children_order = _ChildrenOrder(connections, connections.version, children_ids, order)
+    return order
+
+
+def _topological_order(routine: T) -> list[T]:
+    # Children are identified by their ids, which, unlike their names, can't get out of sync with the
+    # keys in children dictionary, and are much cheaper to compare than routines themselves.
+    children = {id(child): child for child in routine.children.values()}
+
     # Extract connections that are relevant to children ordering, i.e. only the ones
-    # that connect two children (and not children with parent).
-    # For each such connection we only preserve the name of the source and target child,
-    # the names of children will serves as names of nodes in graph.
-    graph_edges = set(
-        (cn.source.parent.name, cn.target.parent.name)  # type: ignore
+    # that connect two children (and not children with parent). Dictionaries are used
+    # instead of sets to make the order independent of hashing.
+    graph_edges = dict.fromkeys(
+        (id(cn.source.parent), id(cn.target.parent))
         for cn in routine.connections
         if cn.source.parent is not routine and cn.target.parent is not routine
     )
@@ -139,13 +489,14 @@ def _sort_children_topologically(routine: T) -> Iterable[T]:
 
     # Also, construct adjacency list, this will help us to virtually "remove"
     # edges and make some nodes dangle!
-    adjacencies = defaultdict(set)
+    adjacencies: dict[int, list[int]] = defaultdict(list)
 
     for source, target in graph_edges:
-        adjacencies[source].add(target)
+        adjacencies[source].append(target)
 
     # Find dangling nodes, i.e. ones that don't have any incoming edge.
-    dangling_nodes = [name for name in routine.children if in_degrees[name] == 0]
+    dangling_nodes = [node for node in children if in_degrees[node] == 0]
+    order: list[T] = []
 
     # Proceed while there are any dangling nodes
     while dangling_nodes:
@@ -160,8 +511,8 @@ def _sort_children_topologically(routine: T) -> Iterable[T]:
             # and hence we add it to the list of dangling nodes.
             if in_degrees[dst] == 0:
                 dangling_nodes.append(dst)
-        # Finally, yield child corresponding to current node and move to the next one.
-        yield cast(T, routine.children[current_node])
+        # Finally, add child corresponding to current node and move to the next one.
+        order.append(cast(T, children[current_node]))
 
     # If there was an edge that we didn't "remove", it must mean there was a cycle.
     # We have to raise an error because the ordering we found so far is
@@ -169,6 +520,42 @@ def _sort_children_topologically(routine: T) -> Iterable[T]:
     if any(deg > 0 for deg in in_degrees.values()):
         raise ValueError(f"A cycle occurred while sorting children of routine {routine.name}.")
 
+    return order
+
+
+def _compute_structural_hash(root: Routine) -> str:
+    if (cached := _cached_structural_hash(root)) is not None:
+        return cached
+    # Subtrees whose hashes are up to date are skipped
+    for routine in post_order(root, _children_without_structural_hash):
+        contents = routine.model_dump(exclude={"children"})
+        contents["children"] = {name: _cached_structural_hash(child) for name, child in routine.children.items()}
+        digest = hashlib.sha256(json.dumps(contents, sort_keys=True, default=str).encode()).hexdigest()
+        routine._structural_hash = (_current_contents_token, digest)
+    return cast(str, _cached_structural_hash(root))
+
+
+def _cached_structural_hash(routine: Routine) -> Optional[str]:
+    try:
+        cached = routine._structural_hash
+    except AttributeError:  # Routine was copied or constructed without calling __init__
+        return None
+    return cached[1] if cached is not None and cached[0] is _current_contents_token else None
+
+
+def _children_without_structural_hash(routine: Routine) -> list[Routine]:
+    return [child for child in routine.children.values() if _cached_structural_hash(child) is None]
+
+
+@dataclass(frozen=True)
+class _ChildrenOrder:
+    """Topological order of routine's children, together with the state of the routine it was computed for."""
+
+    connections: _ConnectionList
+    version: int
+    children_ids: tuple[int, ...]
+    order: list
+
 
 class BaseModel(_BaseModel):
     """Base class for all our models.
@@ -181,6 +568,8 @@ class BaseModel(_BaseModel):
         "arbitrary_types_allowed": True,
         "use_enum_values": True,
         "extra": "forbid",
+        # Validators are built on first use, which keeps importing bartiq fast
+        "defer_build": True,
     }
 
 
@@ -215,35 +604,95 @@ class Routine(BaseModel):
 
     name: _Name
     type: Optional[str] = None
-    ports: dict[str, Port] = Field(default_factory=dict)
+    ports: dict[str, Port] = Field(default_factory=_TrackedDict)
     parent: Optional[Self] = Field(exclude=True, default=None)
-    children: dict[str, Routine] = Field(default_factory=dict)
-    connections: list[Connection] = Field(default_factory=list)
-    resources: dict[str, Resource] = Field(default_factory=dict)
-    input_params: Sequence[Symbol] = Field(default_factory=list)
-    local_variables: dict[str, str] = Field(default_factory=dict)
-    linked_params: dict[Symbol, list[tuple[str, Symbol]]] = Field(default_factory=dict)
-    meta: Optional[dict[str, Any]] = Field(default_factory=dict)
+    children: dict[str, Routine] = Field(default_factory=_ChildrenDict)
+    connections: list[Connection] = Field(default_factory=_ConnectionList)
+    resources: dict[str, Resource] = Field(default_factory=_TrackedDict)
+    input_params: Sequence[Symbol] = Field(default_factory=_TrackedList)
+    local_variables: dict[str, str] = Field(default_factory=_TrackedDict)
+    linked_params: dict[Symbol, list[tuple[str, Symbol]]] = Field(default_factory=_TrackedDict)
+    meta: Optional[dict[str, Any]] = Field(default_factory=_TrackedDict)
+
+    # Caches derived from structure of the routine. They are kept in slots instead of private attributes,
+    # as slots are much faster to access, and aren't copied together with the routine.
+    __slots__ = ("_children_order", "_path_index", "_structural_hash")
 
     def __init__(self, **data: Any):
         sanitized_data = {k: v for k, v in data.items() if v != [] and v != {}}
         super().__init__(**sanitized_data)
+        self._children_order: Optional[_ChildrenOrder] = None
+        self._path_index: Optional[_PathIndex] = None
+        self._structural_hash: Optional[tuple[object, str]] = None
         _update_parent(self.ports.values(), self)
         _update_parent(self.connections, self)
         _update_parent(self.children.values(), self)
         _update_parent(self.resources.values(), self)
 
+    @classmethod
+    def from_trusted_dict(cls, data: dict[str, Any]) -> Self:
+        """Create a routine from a dictionary describing it, skipping the validation.
+
+        This is much faster than passing the same data to the constructor, and is meant for data that is
+        known to be valid, like the one produced by `model_dump` or loaded from a file that was written by bartiq.
+        Since no checks are performed, invalid data results in routines that are broken in unpredictable ways.
+
+        Args:
+            data: Dictionary describing the routine and all its descendants, in the same format as for
+                the constructor, except that connections have to be given as dictionaries.
+
+        Returns:
+            Routine described by the data, equal to the one that would be created by the constructor.
+        """
+        # Routines are constructed bottom-up, so that constructed children are ready when their parent is constructed
+        constructed: dict[int, Self] = {}
+        with _gc_paused():
+            for routine_data in post_order(data, _children_data):
+                children: dict[str, Routine] = {
+                    name: constructed.pop(id(child)) for name, child in routine_data.get("children", {}).items()
+                }
+                constructed[id(routine_data)] = _construct_routine(cls, routine_data, children)
+        return constructed[id(data)]
+
     def __repr__(self):
         return f'<{self.__class__.__name__} name="{self.name}">'
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "connections" and not isinstance(value, _ConnectionList):
+            value = _ConnectionList(value)
+        elif name == "children" and not isinstance(value, _ChildrenDict):
+            value = _ChildrenDict(value)
+        elif name in _TRACKED_FIELDS:
+            value = _tracked(value)
+        # Paths of routines which haven't been indexed yet can't get out of date
+        if name in ("name", "parent", "children") and _is_indexed(self):
+            _invalidate_path_indices()
+        # Parent is not a part of the routine's contents, and caches are kept in private attributes
+        if name != "parent" and not name.startswith("_"):
+            _invalidate_structural_hashes()
+        super().__setattr__(name, value)
+
     def __eq__(self, other: Any):
-        return isinstance(other, Routine) and self.model_dump() == other.model_dump()
+        return isinstance(other, Routine) and (self is other or self.structural_hash() == other.structural_hash())
+
+    def structural_hash(self) -> str:
+        """Return a hash of the contents of this routine and all its descendants.
+
+        Routines have the same hashes if and only if they are equal, i.e. all their fields other than parent
+        are the same. Hashes of all the subtrees are computed bottom-up from their own fields and hashes of their
+        children, and are cached until any routine is modified. Hence, once computed, they can be used for cheap
+        comparison of routines and as keys identifying them.
+
+        Note:
+            Dictionaries and lists assigned to the fields of routines and ports, including the ones nested in
+            them, are replaced with their copies, whose modifications are detected. Modifications of other mutable
+            objects stored in `meta`, as well as of the original dictionaries and lists, aren't detected.
+        """
+        return _compute_structural_hash(self)
 
     def walk(self) -> Iterable[Self]:
         """Iterates through all the ancestry, deep-first."""
-        for child in _sort_children_topologically(self):
-            yield from child.walk()
-        yield self
+        return post_order(self, _sort_children_topologically)
 
     @property
     def input_ports(self) -> dict[str, Port]:
@@ -295,9 +744,29 @@ class Routine(BaseModel):
             for connection in v
         ]
 
+    @field_validator("connections")
+    @classmethod
+    def _index_connections(cls, v) -> list[Connection]:
+        return _ConnectionList(v)
+
+    @field_validator("children")
+    @classmethod
+    def _track_children(cls, v) -> dict[str, Routine]:
+        return _ChildrenDict(v)
+
+    @field_validator(*_TRACKED_FIELDS)
+    @classmethod
+    def _track_contents(cls, v) -> Any:
+        return _tracked(v)
+
     @field_serializer("connections")
     def _serialize_connections(self, connections):
-        return [connection.model_dump() for connection in sorted(connections, key=Connection.model_dump_json)]
+        # Connections are sorted by selectors of their ports, which gives the same order as sorting their JSON dumps
+        serialized = [
+            {"source": _port_selector(connection.source, self), "target": _port_selector(connection.target, self)}
+            for connection in connections
+        ]
+        return sorted(serialized, key=lambda connection: (connection["source"], connection["target"]))
 
     @field_serializer("input_params")
     def _serialize_input_params(self, input_params):
@@ -320,8 +789,9 @@ class Routine(BaseModel):
         """
         if selector == "":
             return self
-        else:
-            return _find_descendant(selector, self.children)
+        if (descendant := _path_index(self).find(self, selector)) is None:
+            raise ValueError(f"Child {selector} not found.")
+        return descendant
 
     def relative_path_from(self, ancestor: Optional[Routine], exclude_root_name: bool = False) -> str:
         """Return relative path to the ancestor.
@@ -336,17 +806,17 @@ class Routine(BaseModel):
         Raises:
             ValueError: If ancestor is not, in fact, an ancestor of self.
         """
-
-        # For root node return an empty string
-        if self.parent is None and ancestor is None and exclude_root_name:
-            return ""
-        if self.parent is ancestor:
-            return self.name
-        else:
-            try:
-                return f"{self.parent.relative_path_from(ancestor, exclude_root_name=exclude_root_name)}.{self.name}"  # type: ignore # noqa: E501
-            except (ValueError, AttributeError) as e:
-                raise ValueError("Ancestor not found.") from e
+        names = []
+        routine = self
+        while routine.parent is not ancestor:
+            if routine.parent is None:
+                raise ValueError("Ancestor not found.")
+            names.append(routine.name)
+            routine = routine.parent
+
+        # Name of the root is replaced by an empty string
+        names.append("" if routine.parent is None and exclude_root_name else routine.name)
+        return ".".join(reversed(names))
 
     def absolute_path(self, exclude_root_name: bool = False) -> str:
         """Returns a path from root.
@@ -354,10 +824,7 @@ class Routine(BaseModel):
         Args:
             exclude_root_name: If true, excludes name of root from the path. Default: False
         """
-        if self.parent is None and exclude_root_name:
-            return ""
-        else:
-            return self.relative_path_from(None, exclude_root_name=exclude_root_name).removeprefix(".")
+        return _path_index(self).path(self, exclude_root_name)
 
     def _repr_markdown_(self):
         from .integrations.latex import routine_to_latex
@@ -365,6 +832,105 @@ class Routine(BaseModel):
         return routine_to_latex(self)
 
 
+def _children_data(data: dict[str, Any]) -> Iterable[dict[str, Any]]:
+    return data.get("children", {}).values()
+
+
+def _construct_routine(cls: type[T], data: dict[str, Any], children: dict[str, Routine]) -> T:
+    # Like in the constructor, empty collections are skipped, so that they aren't marked as explicitly set.
+    # All the collections are copied, so that the routine can be modified without affecting the data.
+    fields = {name: value for name, value in data.items() if name in cls.model_fields and value != [] and value != {}}
+    fields.pop("parent", None)
+    ports = _TrackedDict((name, _construct_port(port)) for name, port in fields.get("ports", {}).items())
+    if "ports" in fields:
+        fields["ports"] = ports
+    if "children" in fields:
+        fields["children"] = _ChildrenDict(children)
+    if "connections" in fields:
+        fields["connections"] = _ConnectionList(
+            _construct_model(
+                Connection,
+                {
+                    "source": _resolve_port(connection["source"], children, ports),
+                    "target": _resolve_port(connection["target"], children, ports),
+                },
+            )
+            for connection in fields["connections"]
+        )
+    if "resources" in fields:
+        fields["resources"] = _TrackedDict(
+            (name, _construct_resource(resource)) for name, resource in fields["resources"].items()
+        )
+    if "input_params" in fields:
+        fields["input_params"] = _TrackedList(fields["input_params"])
+    if "local_variables" in fields:
+        fields["local_variables"] = _TrackedDict(fields["local_variables"])
+    if "linked_params" in fields:
+        fields["linked_params"] = _TrackedDict(
+            (source, [tuple(target) for target in targets]) for source, targets in fields["linked_params"].items()
+        )
+    if fields.get("meta") is not None:
+        fields["meta"] = _TrackedDict(fields["meta"])
+
+    routine = _construct_model(cls, fields)
+    routine._children_order = None
+    routine._path_index = None
+    routine._structural_hash = None
+    for items in (routine.ports.values(), routine.connections, routine.children.values(), routine.resources.values()):
+        for item in items:
+            # Parents are set directly, as there's nothing to invalidate in newly constructed objects
+            vars(item)["parent"] = routine
+    return routine
+
+
+def _construct_port(data: dict[str, Any]) -> Port:
+    fields = {**data, "direction": PortDirection(data["direction"]).value, "size": _deserialize_value(data["size"])}
+    if fields.get("meta") is not None:
+        fields["meta"] = _TrackedDict(fields["meta"])
+    return _construct_model(Port, fields)
+
+
+def _construct_resource(data: dict[str, Any]) -> Resource:
+    return _construct_model(
+        Resource, {**data, "type": ResourceType(data["type"]).value, "value": _deserialize_value(data["value"])}
+    )
+
+
+@cache
+def _defaults(cls: type[_BaseModel]) -> dict[str, Callable[[], Any]]:
+    return {name: _default_factory(field.default_factory, field.default) for name, field in cls.model_fields.items()}
+
+
+def _default_factory(factory: Optional[Callable[[], Any]], default: Any) -> Callable[[], Any]:
+    # Default values of all the fields in our models are immutable, unless they are created by factories
+    return factory if factory is not None else lambda: default
+
+
+@contextmanager
+def _gc_paused() -> Iterator[None]:
+    # Constructing large trees allocates lots of objects, which triggers many passes of the cyclic
+    # garbage collector. None of them can free anything, as all the objects are still referenced.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _construct_model(cls: type[_Model], fields: dict[str, Any]) -> _Model:
+    # Equivalent of cls.model_construct(**fields) for models without aliases, extra fields and private
+    # attributes, which is several times faster, as it doesn't look for aliases of fields that were given.
+    model = cls.__new__(cls)
+    values = {name: fields[name] if name in fields else default() for name, default in _defaults(cls).items()}
+    object.__setattr__(model, "__dict__", values)
+    object.__setattr__(model, "__pydantic_fields_set__", set(fields))
+    object.__setattr__(model, "__pydantic_extra__", None)
+    object.__setattr__(model, "__pydantic_private__", None)
+    return model
+
+
 class Resource(BaseModel):
     """Resource associated with a routine.
 
@@ -376,13 +942,18 @@ class Resource(BaseModel):
     """
 
     name: _Name
-    type: ResourceType
+    type: AnnotatedResourceType
     parent: Optional[Routine] = Field(exclude=True, default=None)
     value: AnnotatedValue
 
     def __repr__(self):
         return f'<{self.__class__.__name__} name="{self.name}" value="{self.value}">'
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name != "parent":
+            _invalidate_structural_hashes()
+        super().__setattr__(name, value)
+
 
 class Port(BaseModel):
     """Class representing a port.
@@ -398,15 +969,27 @@ class Port(BaseModel):
 
     name: _Name
     parent: Optional[Routine] = Field(exclude=True, default=None)
-    direction: PortDirection
+    direction: AnnotatedPortDirection
     size: Optional[AnnotatedValue]
-    meta: Optional[dict[str, Any]] = Field(default_factory=dict)
+    meta: Optional[dict[str, Any]] = Field(default_factory=_TrackedDict)
 
     def __repr__(self):
         parent_name = "none" if self.parent is None else self.parent.name
         size_value = "None" if self.size is None else f'"{self.size}"'
         return f"{self.__class__.__name__}({parent_name}.#{self.name}, size={size_value}, {self.direction})"
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "meta":
+            value = _tracked(value)
+        if name != "parent":
+            _invalidate_structural_hashes()
+        super().__setattr__(name, value)
+
+    @field_validator("meta")
+    @classmethod
+    def _track_meta(cls, v) -> Optional[dict[str, Any]]:
+        return _tracked(v)
+
     def absolute_path(self, exclude_root_name: bool = False) -> str:
         """Returns a path from root.
 
@@ -414,10 +997,8 @@ class Port(BaseModel):
             exclude_root_name: If true, excludes name of root from the path. Default: False
         """
         assert self.parent is not None
-        if self.parent.absolute_path(exclude_root_name=exclude_root_name) == "":
-            return f"#{self.name}"
-        else:
-            return f"{self.parent.absolute_path(exclude_root_name=exclude_root_name)}.#{self.name}"
+        parent_path = self.parent.absolute_path(exclude_root_name=exclude_root_name)
+        return f"{parent_path}.#{self.name}" if parent_path else f"#{self.name}"
 
 
 class Connection(BaseModel):
@@ -440,6 +1021,16 @@ class Connection(BaseModel):
         parent_name = "none" if self.parent is None else self.parent.name
         return f"{self.__class__.__name__}({parent_name}.#{self.source.name} -> {parent_name}.#{self.target.name})"
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in ("source", "target") and self.parent is not None:
+            _indexed_connections(self.parent).invalidate_index()
+
     @field_serializer("source", "target")
     def _serialize_port(self, port):
-        return port.name if port.parent is self.parent else f"{port.parent.name}.{port.name}"
+        return _port_selector(port, self.parent)
+
+
+def _port_selector(port: Port, routine: Optional[Routine]) -> str:
+    # Selector of the port as used in connections of given routine
+    return port.name if port.parent is routine else f"{port.parent.name}.{port.name}"  # type: ignore[union-attr]
@@ -0,0 +1,53 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Iterative traversals of hierarchical structures, like routines.
+
+The traversals don't use recursion, and hence work for hierarchies of any depth.
+Each of them takes a function returning children of given node, which makes them
+usable also for structures other than routines (e.g. QREF's routines), and for
+visiting children in a specific order.
+"""
+
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_EXHAUSTED = object()
+
+
+def pre_order(root: T, children: Callable[[T], Iterable[T]]) -> Iterator[T]:
+    """Iterate over the hierarchy depth-first, visiting each node before its children.
+
+    Children of a node are obtained only after the node has been visited, so they can
+    be modified by the code processing the node.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(children(node))))
+
+
+def post_order(root: T, children: Callable[[T], Iterable[T]]) -> Iterator[T]:
+    """Iterate over the hierarchy depth-first, visiting each node after all its children."""
+    stack = [(root, iter(children(root)))]
+    while stack:
+        node, remaining_children = stack[-1]
+        child = next(remaining_children, _EXHAUSTED)
+        if child is _EXHAUSTED:
+            stack.pop()
+            yield node
+        else:
+            stack.append((child, iter(children(child))))  # type: ignore[arg-type]
@@ -12,7 +12,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ._compile import compile_routine
-from ._evaluate import evaluate
+from typing import TYPE_CHECKING
 
-__all__ = ["compile_routine", "evaluate"]
+from .._lazy import is_installed, lazy_attributes
+
+if TYPE_CHECKING:
+    from ._cache import CompilationCache, PersistentCompilationCache
+    from ._compile import compile_routine
+    from ._estimator import Estimator, compile_estimator
+    from ._evaluate import EvaluationPlan, evaluate
+    from ._evaluate_grid import evaluate_grid
+
+_LAZY_ATTRIBUTES = {
+    "compile_routine": "._compile",
+    "evaluate": "._evaluate",
+    "EvaluationPlan": "._evaluate",
+    "compile_estimator": "._estimator",
+    "Estimator": "._estimator",
+    "CompilationCache": "._cache",
+    "PersistentCompilationCache": "._cache",
+    "evaluate_grid": "._evaluate_grid",
+}
+
+# evaluate_grid requires NumPy, which is an optional dependency. Accessing it without NumPy raises an error
+# explaining how to install it, but it's not exported, so that star imports work regardless.
+__all__ = [name for name in _LAZY_ATTRIBUTES if name != "evaluate_grid" or is_installed("numpy")]
+
+# Compilation relies on sympy, which takes a long time to import, hence it is imported only when used
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
@@ -0,0 +1,374 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import annotations
+
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Generic, Optional, Union
+
+import sympy
+
+from .. import Resource, ResourceType, Routine
+from ..precompilation._core import PrecompilationStage
+from ..symbolics.backend import SymbolicBackend, T_expr
+from ._symbolic_function import SymbolicFunction
+from .types import FunctionsMap
+
+try:
+    _BARTIQ_VERSION: Optional[str] = version("bartiq")
+except PackageNotFoundError:
+    _BARTIQ_VERSION = None
+
+
+class UncacheableSettingsError(ValueError):
+    """Raised when compilation settings include functions which can't be reliably identified in a cache key."""
+
+
+@dataclass(frozen=True)
+class CompiledRoutineData:
+    """Data written into a single routine by the compilation process.
+
+    Attributes:
+        input_params: Input parameters of the compiled routine.
+        port_sizes: Compiled sizes of the ports, keyed by port name.
+        resources: Compiled resources, keyed by resource name, as pairs (type, value).
+        linked_params: Parameter links which survived compilation.
+    """
+
+    input_params: tuple[str, ...]
+    port_sizes: dict[str, Any]
+    resources: dict[str, tuple[str, Any]]
+    linked_params: dict[str, list[tuple[str, str]]]
+
+    @classmethod
+    def from_routine(cls, routine: Routine) -> CompiledRoutineData:
+        """Capture the compiled state of given routine (without its children)."""
+        return cls(
+            input_params=tuple(routine.input_params),
+            port_sizes={name: port.size for name, port in routine.ports.items()},
+            resources={
+                name: (ResourceType(resource.type).value, resource.value)
+                for name, resource in routine.resources.items()
+            },
+            linked_params={param: list(links) for param, links in routine.linked_params.items()},
+        )
+
+    def apply_to(self, routine: Routine) -> None:
+        """Overwrite fields of given (uncompiled) routine with the compiled data."""
+        routine.input_params = list(self.input_params)
+        for name, size in self.port_sizes.items():
+            routine.ports[name].size = size
+        routine.resources = {
+            name: Resource(name=name.split(".")[-1], type=ResourceType(type), value=value, parent=routine)
+            for name, (type, value) in self.resources.items()
+        }
+        routine.linked_params = {param: list(links) for param, links in self.linked_params.items()}
+        routine.local_variables = {}
+
+
+@dataclass(frozen=True)
+class CacheEntry(Generic[T_expr]):
+    """Result of compiling a single routine, as stored in the compilation cache.
+
+    Attributes:
+        function: Symbolic function of the routine, in global namespace, exactly as it is
+            consumed by the routine's parent during compilation.
+        data: Compiled data of the routine itself.
+    """
+
+    function: Optional[SymbolicFunction[T_expr]]
+    data: CompiledRoutineData
+
+
+@dataclass(frozen=True)
+class ProgramCacheEntry:
+    """Result of compiling a whole program, as stored in the compilation cache.
+
+    Attributes:
+        compiled_routine: Serialized compiled routine, as returned by `model_dump`.
+    """
+
+    compiled_routine: dict[str, Any]
+
+
+class CompilationCache:
+    """In-memory store of compiled routines, enabling incremental recompilation.
+
+    Passing the same cache to consecutive calls of `compile_routine` makes each subsequent
+    call reuse every subtree that didn't change since it was last compiled. Hence, after
+    editing a single leaf, only this leaf and its ancestors are compiled again.
+
+    Additionally, the result of compiling the whole program is stored under a hash of the
+    uncompiled routine and all the compilation settings, so that compiling an unchanged program
+    skips even the precompilation and verification.
+
+    Entries of subtrees are keyed by a hash of the precompiled subtree, its location in the program,
+    compilation settings and the parts of the whole program which can influence compilation
+    of distant routines (ports, connections and parameters). As a consequence, changing
+    resources only invalidates the edited routine and its ancestors, while changes to
+    ports, connections or parameters invalidate the whole program.
+
+    Attributes:
+        hits: Number of routines reused from the cache.
+        misses: Number of routines which had to be compiled.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, Union[CacheEntry, ProgramCacheEntry]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Union[CacheEntry, ProgramCacheEntry, None]:
+        """Return entry stored under given key, or None if there is no such entry."""
+        return self._entries.get(key)
+
+    def put(self, key: str, entry: Union[CacheEntry, ProgramCacheEntry]) -> None:
+        """Store an entry under given key."""
+        self._entries[key] = entry
+
+    def clear(self) -> None:
+        """Remove all entries and reset statistics."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class PersistentCompilationCache(CompilationCache):
+    """Compilation cache storing its entries on disk, so that they can be shared between processes and sessions.
+
+    Each entry is pickled to a separate file in the cache directory. Whenever the total size of
+    the entries exceeds `max_size`, least recently used entries are evicted.
+
+    Warning:
+        Entries are unpickled when read, so the cache directory shouldn't be writable by untrusted parties.
+
+    Args:
+        directory: Directory in which the entries are stored. It is created if it doesn't exist.
+        max_size: Maximum total size of the entries, in bytes. Defaults to 1 GiB.
+    """
+
+    def __init__(self, directory: Union[str, os.PathLike], max_size: int = 2**30) -> None:
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._size: Optional[int] = None
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def __len__(self) -> int:
+        return len(self._entry_paths())
+
+    def get(self, key: str) -> Union[CacheEntry, ProgramCacheEntry, None]:
+        """Return entry stored under given key, or None if there is no such entry."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            # Bumping modification time marks the entry as recently used
+            os.utime(path)
+            return pickle.loads(data)
+        # Entries written by other versions of bartiq may refer to classes which were moved, renamed or changed
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError):
+            return None
+
+    def put(self, key: str, entry: Union[CacheEntry, ProgramCacheEntry]) -> None:
+        """Store an entry under given key, evicting least recently used entries if needed."""
+        data = pickle.dumps(entry)
+        # Writing to a temporary file first ensures that other processes never read partially written entries
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            file.write(data)
+        os.replace(file.name, self._path(key))
+
+        if self._size is None:
+            self._size = sum(_file_size(path) for path in self._entry_paths())
+        else:
+            self._size += len(data)
+        if self._size > self.max_size:
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove all entries and reset statistics."""
+        for path in self._entry_paths():
+            path.unlink(missing_ok=True)
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def _entry_paths(self) -> list[Path]:
+        return list(self.directory.glob("*.pkl"))
+
+    def _evict(self) -> None:
+        """Remove least recently used entries, until their total size drops below the maximum size."""
+        entries = []
+        for path in self._entry_paths():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Entry was removed in the meantime by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self._size -= size
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def compute_program_key(
+    routine: Routine,
+    backend: SymbolicBackend,
+    precompilation_stages: Optional[list[PrecompilationStage]],
+    global_functions: Optional[list[str]],
+    functions_map: Optional[FunctionsMap],
+    skip_verification: bool,
+) -> str:
+    """Compute cache key of the whole uncompiled program, together with all the compilation settings.
+
+    Raises:
+        UncacheableSettingsError: If any of the functions used for compilation can't be identified by its import path.
+    """
+    return _digest(
+        {
+            "settings": _settings_digest(backend, global_functions, functions_map),
+            "precompilation_stages": (
+                None if precompilation_stages is None else [_importable_name(stage) for stage in precompilation_stages]
+            ),
+            "skip_verification": skip_verification,
+            "routine": routine.structural_hash(),
+        }
+    )
+
+
+def compute_subtree_keys(
+    routine: Routine,
+    backend: SymbolicBackend,
+    global_functions: Optional[list[str]],
+    functions_map: Optional[FunctionsMap],
+) -> dict[int, str]:
+    """Compute cache keys of all subtrees of a precompiled routine.
+
+    The keys are computed bottom-up, so that each routine is serialized only once.
+
+    Returns:
+        Dictionary mapping ids of routines to their keys.
+
+    Raises:
+        UncacheableSettingsError: If any of the functions used for compilation can't be identified by its import path.
+    """
+    settings = _settings_digest(backend, global_functions, functions_map)
+    subroutines = list(routine.walk())
+    own_fields = {id(subroutine): _own_fields(subroutine) for subroutine in subroutines}
+    context = _context_digest(subroutines, own_fields)
+
+    keys: dict[int, str] = {}
+    for subroutine in subroutines:
+        keys[id(subroutine)] = _digest(
+            {
+                "settings": settings,
+                "context": context,
+                "path": subroutine.absolute_path(),
+                "routine": own_fields[id(subroutine)],
+                "children": {name: keys[id(child)] for name, child in subroutine.children.items()},
+            }
+        )
+    return keys
+
+
+def _settings_digest(
+    backend: SymbolicBackend, global_functions: Optional[list[str]], functions_map: Optional[FunctionsMap]
+) -> str:
+    parse = getattr(backend, "parse", None)
+    return _digest(
+        {
+            "versions": {"bartiq": _BARTIQ_VERSION, "sympy": sympy.__version__},
+            "backend": [_importable_name(type(backend)), None if parse is None else _importable_name(parse)],
+            "global_functions": sorted(global_functions or []),
+            "functions_map": {name: _importable_name(func) for name, func in sorted((functions_map or {}).items())},
+        }
+    )
+
+
+def _context_digest(subroutines: list[Routine], own_fields: dict[int, dict[str, Any]]) -> str:
+    """Digest of the parts of the program through which routines can influence each other's compilation.
+
+    Routines interact with routines outside their subtree only through register sizes and
+    parameter links. Resources are omitted, unless they can leak into a register size
+    through local variables.
+    """
+    skeleton = []
+    for subroutine in subroutines:
+        fields = own_fields[id(subroutine)]
+        if not any("." in str(value) for value in subroutine.local_variables.values()):
+            fields = {name: value for name, value in fields.items() if name != "resources"}
+        skeleton.append((subroutine.absolute_path(), fields))
+    return _digest(skeleton)
+
+
+def _own_fields(routine: Routine) -> dict[str, Any]:
+    return routine.model_dump(exclude={"children", "symbolic_function"})
+
+
+def _importable_name(obj: Any) -> str:
+    """Return the import path of given function or class, verifying that it refers back to the very same object.
+
+    Lambdas, nested functions, partials and other callable objects can't be identified by their names,
+    as different objects share the same name and their behaviour may depend on captured state.
+    """
+    module_name = getattr(obj, "__module__", None)
+    qualname = getattr(obj, "__qualname__", None)
+    if module_name is not None and qualname is not None and "<" not in qualname:
+        try:
+            resolved = importlib.import_module(module_name)
+            for name in qualname.split("."):
+                resolved = getattr(resolved, name)
+        except (ImportError, AttributeError):
+            pass
+        else:
+            if resolved is obj:
+                return f"{module_name}.{qualname}"
+    raise UncacheableSettingsError(
+        f"{obj!r} can't be identified by its import path, hence compilation results depending on it can't be cached."
+    )
+
+
+def _digest(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
@@ -13,9 +13,13 @@
 # limitations under the License.
 
 import warnings
-from typing import Any, Optional, cast, overload
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Generic, Iterable, Optional, cast, overload
 
 from .. import Port, Routine
+from .._routine import _sort_children_topologically
+from .._traversal import post_order
 from ..errors import BartiqCompilationError
 from ..precompilation._core import PrecompilationStage, precompile
 from ..routing import get_port_source, get_port_target, join_paths
@@ -23,7 +27,18 @@ from ..symbolics import sympy_backend
 from ..symbolics.backend import SymbolicBackend, T_expr
 from ..symbolics.variables import DependentVariable
 from ..verification import verify_compiled_routine, verify_uncompiled_routine
+from ._cache import (
+    CacheEntry,
+    CompilationCache,
+    CompiledRoutineData,
+    ProgramCacheEntry,
+    UncacheableSettingsError,
+    compute_program_key,
+    compute_subtree_keys,
+)
+from ._instancing import Instance, InstanceFinder, zip_subtrees
 from ._symbolic_function import (
+    RoutineUpdate,
     RoutineWithFunction,
     SymbolicFunction,
     compile_functions,
@@ -45,6 +60,8 @@ def compile_routine(
     global_functions: Optional[list[str]] = None,
     functions_map: Optional[FunctionsMap] = None,
     skip_verification: bool = False,
+    cache: Optional[CompilationCache] = None,
+    workers: Optional[int] = None,
 ) -> Routine:
     pass  # pragma: no cover
 
@@ -58,6 +75,8 @@ def compile_routine(
     global_functions: Optional[list[str]] = None,
     functions_map: Optional[FunctionsMap] = None,
     skip_verification: bool = False,
+    cache: Optional[CompilationCache] = None,
+    workers: Optional[int] = None,
 ) -> Routine:
     pass  # pragma: no cover
 
@@ -70,6 +89,8 @@ def compile_routine(
     global_functions=None,
     functions_map=None,
     skip_verification: bool = False,
+    cache=None,
+    workers=None,
 ):
     """Compile estimates for given uncompiled Routine.
 
@@ -82,8 +103,19 @@ def compile_routine(
         global_functions: functions in the cost expressions which we don't want to have namespaced.
         functions_map: a dictionary which specifies non-standard functions which need to applied during compilation.
         skip_verification: if True, skips routine verification before and after compilation.
+        cache: a compilation cache enabling incremental compilation. Subtrees found in the cache are not compiled
+            again, and all the newly compiled subtrees are added to it. Use `PersistentCompilationCache` to
+            share compilation results between processes. If `None`, the cache is not used. The cache is also
+            not used (and a warning is issued) if the precompilation stages, the functions in `functions_map`
+            or the backend's parse function can't be imported by name, as is the case e.g. for lambdas.
+            When compiling with a cache, the passed routine is never modified by precompilation.
+        workers: number of worker processes used for compiling independent subtrees in parallel. If `None`,
+            the routine is compiled in the current process. When using workers, the backend and all the functions
+            in `functions_map` have to be picklable (e.g. lambdas are not).
     """
-    return _compile_routine(routine, backend, precompilation_stages, global_functions, functions_map, skip_verification)
+    return _compile_routine(
+        routine, backend, precompilation_stages, global_functions, functions_map, skip_verification, cache, workers
+    )
 
 
 def _compile_routine(
@@ -93,7 +125,29 @@ def _compile_routine(
     global_functions: Optional[list[str]] = None,
     functions_map: Optional[FunctionsMap] = None,
     skip_verification: bool = False,
+    cache: Optional[CompilationCache] = None,
+    workers: Optional[int] = None,
 ):
+    program_key = None
+    if cache is not None:
+        try:
+            program_key = compute_program_key(
+                routine, backend, precompilation_stages, global_functions, functions_map, skip_verification
+            )
+        except UncacheableSettingsError as e:
+            warnings.warn(f"Compilation cache is not used. {e}")
+            cache = None
+    if cache is not None:
+        assert program_key is not None
+        program_entry = cache.get(program_key)
+        if isinstance(program_entry, ProgramCacheEntry):
+            compiled_routine = Routine.from_trusted_dict(program_entry.compiled_routine)
+            cache.hits += sum(1 for _ in compiled_routine.walk())
+            return compiled_routine
+        # Precompilation modifies the routine in place, which mustn't be visible to the caller,
+        # as it would be skipped the next time the same program is found in the cache
+        routine = Routine.from_trusted_dict(routine.model_dump())
+
     precompile(routine, precompilation_stages=precompilation_stages, backend=backend)
     if not skip_verification:
         verification_result = verify_uncompiled_routine(routine, backend=backend)
@@ -103,11 +157,22 @@ def _compile_routine(
                 f"Found the following issues with the provided routine before the compilation started: {problems}",
             )
 
+    routine_with_functions = RoutineWithFunction.from_routine(routine)
+    keys: dict[int, str] = {}
+    reused: dict[int, CacheEntry[T_expr]] = {}
+    if cache is not None:
+        keys = compute_subtree_keys(routine_with_functions, backend, global_functions, functions_map)
+        reused = _find_reusable_subtrees(routine_with_functions, keys, cache)
+
     # NOTE: This step must be completed BEFORE we start to compile the functions, as parents must be allowed to
     # update their childrens' functions (to support parameter inheritance).
-    routine_with_functions = _add_function_to_routine(routine, global_functions, backend)
+    instances = _add_function_to_routine(routine_with_functions, global_functions, backend, reused)
 
-    compiled_routine_with_funcs = _compile_routine_with_functions(routine_with_functions, functions_map, backend)
+    compiled_routine_with_funcs = _compile_routine_with_functions(
+        routine_with_functions, functions_map, backend, reused, instances, workers
+    )
+    if cache is not None:
+        _update_cache(compiled_routine_with_funcs, keys, reused, cache)
 
     compiled_routine = compiled_routine_with_funcs.to_routine()
     compiled_routine = _remove_children_costs(compiled_routine)
@@ -120,21 +185,185 @@ def _compile_routine(
             )
         # if len(verification_result.problems) != 0:
         #     breakpoint()
+    if cache is not None:
+        assert program_key is not None
+        cache.put(program_key, ProgramCacheEntry(compiled_routine.model_dump()))
     return compiled_routine
 
 
+def _find_reusable_subtrees(
+    routine: RoutineWithFunction[T_expr], keys: dict[int, str], cache: CompilationCache
+) -> dict[int, CacheEntry[T_expr]]:
+    """Find subtrees of the routine which can be reused from the cache.
+
+    Returns:
+        Dictionary mapping ids of all routines in reusable subtrees to their cache entries.
+        Subtrees are considered reusable only if the cache contains entries for all their routines.
+    """
+    reused: dict[int, CacheEntry[T_expr]] = {}
+    for subroutine in routine.walk():
+        if not all(id(child) in reused for child in subroutine.children.values()):
+            continue
+        entry = cache.get(keys[id(subroutine)])
+        if isinstance(entry, CacheEntry):
+            reused[id(subroutine)] = entry
+    return reused
+
+
+def _update_cache(
+    routine: RoutineWithFunction[T_expr],
+    keys: dict[int, str],
+    reused: dict[int, CacheEntry[T_expr]],
+    cache: CompilationCache,
+) -> None:
+    """Store all the routines compiled in this run in the cache."""
+    for subroutine in routine.walk():
+        if id(subroutine) in reused:
+            cache.hits += 1
+        else:
+            cache.misses += 1
+            entry = CacheEntry(subroutine.symbolic_function, CompiledRoutineData.from_routine(subroutine))
+            cache.put(keys[id(subroutine)], entry)
+
+
+def _walk_skipping_reused(
+    routine: RoutineWithFunction[T_expr], reused: dict[int, CacheEntry[T_expr]]
+) -> Iterable[RoutineWithFunction[T_expr]]:
+    """Iterates through the routine like `Routine.walk`, but doesn't descend into reused subtrees."""
+    return post_order(
+        routine, lambda subroutine: () if id(subroutine) in reused else _sort_children_topologically(subroutine)
+    )
+
+
 def _add_function_to_routine(
-    routine: Routine,
+    routine_with_functions: RoutineWithFunction[T_expr],
     global_functions: Optional[list[str]],
     backend: SymbolicBackend[T_expr],
-) -> RoutineWithFunction[T_expr]:
-    """Converts each routine to a symbolic function."""
-    routine_with_functions = RoutineWithFunction.from_routine(routine)
+    reused: dict[int, CacheEntry[T_expr]],
+) -> dict[int, tuple[Instance, RoutineWithFunction[T_expr]]]:
+    """Converts each routine to a symbolic function.
+
+    Subtrees which are instances of previously processed ones (see `InstanceFinder`) are skipped, as
+    their functions are obtained during compilation by renaming the functions of their counterparts.
+
+    Returns:
+        Dictionary mapping ids of all routines in the subtrees of instances to pairs (instance, counterpart),
+        where counterpart is the corresponding routine in the subtree of the instance's representative.
+    """
+    # NOTE: Structure of the subtrees has to be captured up front, as adding functions removes parameter links.
+    instance_finder = InstanceFinder(routine_with_functions, reused)
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]] = {}
+
+    matches: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]] = {}
+
+    def _children_to_visit(routine: RoutineWithFunction[T_expr]) -> Iterable[RoutineWithFunction[T_expr]]:
+        # Neither reused routines nor instances are descended into
+        if id(routine) in reused:
+            return ()
+        match = instance_finder.match(routine)
+        if match is not None:
+            matches[id(routine)] = match
+            return ()
+        return _sort_children_topologically(routine)
+
+    for routine in post_order(routine_with_functions, _children_to_visit):
+        if id(routine) in reused:
+            routine.symbolic_function = reused[id(routine)].function
+            _replay_constant_register_sizes_pushed_out(
+                routine, lambda source: _reused_register_size(source, reused), backend
+            )
+        elif id(routine) in matches:
+            _add_instance(routine, *matches.pop(id(routine)), instances, backend)
+        else:
+            routine.symbolic_function = _map_routine_to_function(routine, global_functions, backend)
 
-    for subroutine in routine_with_functions.walk():
-        subroutine.symbolic_function = _map_routine_to_function(subroutine, global_functions, backend)
+    return instances
+
+
+def _add_instance(
+    routine: RoutineWithFunction[T_expr],
+    instance: Instance,
+    representative: RoutineWithFunction[T_expr],
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]],
+    backend: SymbolicBackend[T_expr],
+) -> None:
+    """Prepares subtree of an instance for compilation, without converting its routines to functions.
+
+    Routines of the instance are left in the same state as their counterparts in the representative,
+    i.e. with constant register sizes propagated into their ports and parameter links removed.
+    """
+    for subroutine, counterpart in zip_subtrees(routine, representative):
+        instances[id(subroutine)] = (instance, counterpart)
+        if subroutine.is_leaf:
+            for port_name, port in subroutine.ports.items():
+                port.size = counterpart.ports[port_name].size
+        else:
+            subroutine.linked_params = {}
+
+    _replay_constant_register_sizes_pushed_out(
+        routine, lambda source: _instance_register_size(source, instance, instances), backend
+    )
 
-    return routine_with_functions
+
+def _reused_register_size(port: Port, reused: dict[int, CacheEntry[T_expr]]) -> Optional[DependentVariable[T_expr]]:
+    """Returns the register size of given port of a leaf reused from the cache."""
+    if id(port.parent) not in reused:
+        return None
+    source_function = reused[id(port.parent)].function
+    assert source_function is not None
+    return source_function.outputs.get(port.absolute_path(exclude_root_name=True))
+
+
+def _instance_register_size(
+    port: Port, instance: Instance, instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]]
+) -> Optional[DependentVariable[T_expr]]:
+    """Returns the register size of given port of a leaf in an instance, as found in the counterpart's function."""
+    if id(port.parent) not in instances or instances[id(port.parent)][0] is not instance:
+        return None
+    counterpart = cast(RoutineWithFunction[T_expr], port.parent)
+    # Counterpart can be in an instance itself, if the representative contains nested instances
+    while id(counterpart) in instances:
+        _, counterpart = instances[id(counterpart)]
+    assert counterpart.symbolic_function is not None
+    return counterpart.symbolic_function.outputs.get(counterpart.ports[port.name].absolute_path(exclude_root_name=True))
+
+
+def _replay_constant_register_sizes_pushed_out(
+    routine: RoutineWithFunction[T_expr],
+    source_register_size: Callable[[Port], Optional[DependentVariable[T_expr]]],
+    backend: SymbolicBackend[T_expr],
+) -> None:
+    """Propagates constant register sizes from leaves of a subtree to leaves outside of it.
+
+    When compiled from scratch, this happens when pushing out output register sizes of leaves
+    (see `_push_out_output_register_size_params`). Since leaves of subtrees reused from the cache
+    or being instances of other subtrees are never mapped to functions, it has to be done separately.
+
+    Args:
+        routine: Root of the subtree.
+        source_register_size: Returns the register size of an output port of the subtree's leaf,
+            as found in the (global) function of the leaf.
+        backend: Backend used for manipulating symbolic expressions.
+    """
+    if routine.is_root:
+        return
+
+    for port in routine.output_ports.values():
+        source_port = get_port_source(port)
+        source_routine = source_port.parent
+        assert source_routine is not None
+        if not source_routine.is_leaf:
+            continue
+        source_register_size_variable = source_register_size(source_port)
+        target_port = get_port_target(port)
+        assert target_port.parent is not None
+        if (
+            source_register_size_variable is not None
+            and backend.is_constant_int(source_register_size_variable.expression)
+            and target_port.parent.is_leaf
+        ):
+            assert source_register_size_variable.value is not None
+            _set_target_input_port_size_to_constant_value(target_port, source_register_size_variable.value, backend)
 
 
 def _map_routine_to_function(
@@ -358,14 +587,7 @@ def _push_out_output_register_size_params(
 
         # If the current port's register size is a constant, then we need to propagate that to the target ports
         if backend.is_constant_int(source_register_size_variable.expression) and target_routine.is_leaf:
-            target_function = to_symbolic_function(target_routine, backend)
-            # NOTE: due to the walk order, the target function's variables are still be local
-            target_function_input = f"#{target_port.name}"
-            source_register_size = source_register_size_variable.value
-            new_target_function = set_input_port_size_to_constant_value(
-                target_function, target_function_input, source_register_size, backend
-            )
-            update_routine_with_symbolic_function(target_routine, new_target_function)
+            _set_target_input_port_size_to_constant_value(target_port, source_register_size_variable.value, backend)
 
         # Otherwise, rename the source register size to match its target
         else:
@@ -382,6 +604,19 @@ def _push_out_output_register_size_params(
     return new_function
 
 
+def _set_target_input_port_size_to_constant_value(
+    target_port: Port, value: Number, backend: SymbolicBackend[T_expr]
+) -> None:
+    """Sets the size of the input port of a leaf to a constant, updating the leaf in place."""
+    target_routine = target_port.parent
+    assert target_routine is not None
+    target_function = to_symbolic_function(target_routine, backend)
+    # NOTE: due to the walk order, the target function's variables are still be local
+    target_function_input = f"#{target_port.name}"
+    new_target_function = set_input_port_size_to_constant_value(target_function, target_function_input, value, backend)
+    update_routine_with_symbolic_function(target_routine, new_target_function)
+
+
 def _resolve_target_param(target: Port) -> str:
     """Resolves the register size of some target port."""
     target_routine = target.parent
@@ -421,9 +656,11 @@ def _pass_on_inherited_params(routine: RoutineWithFunction[T_expr]) -> None:
             # inheritor has already inherited a param from it, then we need to propagate this renaming downwards.
             # The cast below will become redundant when pydantic starts supporting typing.Self
             # See: https://github.com/pydantic/pydantic/pull/9023
+            # Descendants of subtrees reused from the compilation cache have no functions, but the function
+            # of their root already has the renaming applied, so we don't need to treat them specially.
             for descendant in cast(RoutineWithFunction[T_expr], inheritor).walk():
-                assert descendant.symbolic_function is not None
-                descendant.symbolic_function = rename_variables(descendant.symbolic_function, param_map)
+                if descendant.symbolic_function is not None:
+                    descendant.symbolic_function = rename_variables(descendant.symbolic_function, param_map)
     routine.linked_params = {}
 
 
@@ -431,15 +668,18 @@ def _compile_routine_with_functions(
     routine: RoutineWithFunction[T_expr],
     functions_map: Optional[FunctionsMap],
     backend: SymbolicBackend[T_expr],
+    reused: dict[int, CacheEntry[T_expr]],
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]],
+    workers: Optional[int],
 ) -> RoutineWithFunction[T_expr]:
     """Compiles a routine using symbolic function."""
     # Deal with leaf root edge case
-    if routine.is_leaf:
+    if routine.is_leaf and id(routine) not in reused:
         assert routine.symbolic_function is not None
         symbolic_function = define_expression_functions(routine.symbolic_function, functions_map)
         update_routine_with_symbolic_function(routine, symbolic_function)
     else:
-        routine = _compile_routine_non_leaf_root(routine, functions_map, backend)
+        routine = _compile_routine_non_leaf_root(routine, functions_map, backend, reused, instances, workers)
 
     routine.symbolic_function = None
     for subroutine in routine.walk():
@@ -452,34 +692,398 @@ def _compile_routine_non_leaf_root(
     routine: RoutineWithFunction[T_expr],
     functions_map: Optional[FunctionsMap],
     backend: SymbolicBackend[T_expr],
+    reused: dict[int, CacheEntry[T_expr]],
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]],
+    workers: Optional[int],
 ) -> RoutineWithFunction[T_expr]:
-    """Walks over the routine and compiles all the symbolic functions."""
-    for subroutine in routine.walk():
-        if subroutine.is_leaf:
-            compiled_function = _compile_function_to_routine_leaf_non_root(subroutine)
+    """Walks over the routine and compiles all the symbolic functions.
+
+    Routines in instances are compiled by renaming the results of their counterparts, instead of
+    compiling them from scratch.
+    """
+    subroutines = []
+    for subroutine in _walk_skipping_reused(routine, reused):
+        if id(subroutine) in reused:
+            _restore_reused_subtree(subroutine, reused)
         else:
-            compiled_function = _compile_function_to_routine_non_leaf_non_root(subroutine, backend)
+            subroutines.append(subroutine)
 
-        if functions_map:
-            compiled_function = define_expression_functions(compiled_function, functions_map, strict=False)
-        update_routine_with_symbolic_function(subroutine, compiled_function)
+    if workers is None or workers == 1:
+        result = _execute_compilation_task(_make_compilation_task(subroutines, functions_map, backend, instances, {}))
+        _apply_compilation_result(result, subroutines)
+    elif subroutines:
+        _compile_in_parallel(subroutines, functions_map, backend, reused, workers, instances)
     return routine
 
 
-def _compile_function_to_routine_leaf_non_root(
+def _restore_reused_subtree(routine: RoutineWithFunction[T_expr], reused: dict[int, CacheEntry[T_expr]]) -> None:
+    """Updates all routines in reused subtree with their compiled data."""
+    for subroutine in routine.walk():
+        reused[id(subroutine)].data.apply_to(subroutine)
+
+
+@dataclass(frozen=True)
+class _CompilationStep(Generic[T_expr]):
+    """Everything needed to compile the function of a single routine, without access to the routine itself.
+
+    Attributes:
+        path: Path of the routine, excluding root name. It is also the namespace of its function.
+        is_leaf: Whether the routine is a leaf.
+        function: Global function of the routine, as assigned before the compilation. None for routines
+            in instances, whose global functions are obtained from their counterparts.
+        children: Paths of the routine's children, in walk order.
+        rename_maps: Variable maps undoing pulling in and pushing out of register sizes, applied in order.
+        port_endpoints: Triples (routine path, port name, port size) describing internal endpoints
+            of the routine's ports, needed for inferring missing register sizes. Sizes are recorded
+            at the time the step is created, so endpoints compiled later need to be looked up separately.
+        instance: Instance containing the routine, if the routine should be compiled by renaming
+            the results of its counterpart in the instance's representative.
+        is_counterpart: Whether other routines are compiled by renaming the results of this one.
+    """
+
+    path: str
+    is_leaf: bool
+    function: Optional[SymbolicFunction[T_expr]]
+    children: list[str]
+    rename_maps: list[dict[str, str]]
+    port_endpoints: dict[str, tuple[str, str, Any]]
+    instance: Optional[Instance] = None
+    is_counterpart: bool = False
+
+
+@dataclass(frozen=True)
+class _CompiledCounterpart(Generic[T_expr]):
+    """Results of compiling a routine, needed for compiling its counterparts in instances.
+
+    Attributes:
+        local_function: Compiled local function of the routine, before defining expression functions.
+        update: Update of the compiled routine.
+    """
+
+    local_function: SymbolicFunction[T_expr]
+    update: RoutineUpdate
+
+
+@dataclass(frozen=True)
+class _CompilationTask(Generic[T_expr]):
+    """A batch of compilation steps, which can be executed in a separate process.
+
+    Attributes:
+        steps: Steps to execute. Children are always compiled before their parents.
+        children_functions: Global functions of children and counterparts compiled outside of this task,
+            keyed by their paths.
+        counterparts: Results of counterparts compiled outside of this task, keyed by their paths.
+        functions_map: Functions map, as passed to `compile_routine`.
+        backend: Backend used for manipulating symbolic expressions.
+    """
+
+    steps: list[_CompilationStep[T_expr]]
+    children_functions: dict[str, SymbolicFunction[T_expr]]
+    counterparts: dict[str, _CompiledCounterpart[T_expr]]
+    functions_map: Optional[FunctionsMap]
+    backend: SymbolicBackend[T_expr]
+
+
+@dataclass(frozen=True)
+class _CompilationResult(Generic[T_expr]):
+    """Outcome of a compilation task.
+
+    Attributes:
+        updates: Updates of compiled routines, keyed by their paths.
+        functions: Global functions of non-leaf routines and routines in instances, keyed by their paths.
+        counterparts: Results of compiled counterparts, keyed by their paths.
+    """
+
+    updates: dict[str, RoutineUpdate]
+    functions: dict[str, SymbolicFunction[T_expr]]
+    counterparts: dict[str, _CompiledCounterpart[T_expr]]
+
+
+def _make_compilation_task(
+    subroutines: list[RoutineWithFunction[T_expr]],
+    functions_map: Optional[FunctionsMap],
+    backend: SymbolicBackend[T_expr],
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]],
+    counterparts: dict[str, _CompiledCounterpart[T_expr]],
+) -> _CompilationTask[T_expr]:
+    """Prepares a task compiling given subroutines, which have to be listed in walk order.
+
+    Args:
+        subroutines: Subroutines to compile.
+        functions_map: Functions map, as passed to `compile_routine`.
+        backend: Backend used for manipulating symbolic expressions.
+        instances: Pairs (instance, counterpart) for routines in the subtrees of instances.
+        counterparts: Results of all the counterparts compiled so far, keyed by their paths.
+    """
+    counterpart_ids = {id(counterpart) for _, counterpart in instances.values()}
+    steps = [_make_compilation_step(subroutine, instances, counterpart_ids) for subroutine in subroutines]
+    paths = {step.path for step in steps}
+    children_functions = {}
+    task_counterparts = {}
+    for subroutine, step in zip(subroutines, steps):
+        if step.instance is not None:
+            _, counterpart = instances[id(subroutine)]
+            counterpart_path = step.instance.representative_path(step.path)
+            if counterpart_path not in paths:
+                assert counterpart.symbolic_function is not None
+                children_functions[counterpart_path] = counterpart.symbolic_function
+                task_counterparts[counterpart_path] = counterparts[counterpart_path]
+            continue
+        for child in subroutine.children.values():
+            child_path = child.absolute_path(exclude_root_name=True)
+            if child_path not in paths:
+                assert child.symbolic_function is not None
+                children_functions[child_path] = child.symbolic_function
+    return _CompilationTask(steps, children_functions, task_counterparts, functions_map, backend)
+
+
+def _make_compilation_step(
     routine: RoutineWithFunction[T_expr],
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]],
+    counterpart_ids: set[int],
+) -> _CompilationStep[T_expr]:
+    path = routine.absolute_path(exclude_root_name=True)
+    instance = instances[id(routine)][0] if id(routine) in instances else None
+    is_counterpart = id(routine) in counterpart_ids
+    if routine.is_leaf:
+        # Undo the output register pushing out and input register pulling in to produce a valid routine
+        return _CompilationStep(
+            path,
+            True,
+            routine.symbolic_function,
+            [],
+            [
+                _undo_push_out_output_register_size_params_map(routine),
+                _undo_pull_in_input_register_size_params_leaf_map(routine),
+            ],
+            {},
+            instance,
+            is_counterpart,
+        )
+
+    port_endpoints = {}
+    for port in routine.ports.values():
+        endpoint = _get_internal_port_endpoint(port)
+        assert endpoint.parent is not None
+        port_endpoints[port.name] = (
+            endpoint.parent.absolute_path(exclude_root_name=True),
+            endpoint.name,
+            endpoint.size,
+        )
+
+    # First, make sure the function is in terms of the routines's register input params and not its childrens'.
+    # Next, undo the pushing out of output register size parameter needed for function compilation.
+    return _CompilationStep(
+        path,
+        False,
+        routine.symbolic_function,
+        [child.absolute_path(exclude_root_name=True) for child in get_children_in_walk_order(routine)],
+        [
+            _undo_pull_in_input_register_size_params_non_leaf_map(routine),
+            _undo_push_out_output_register_size_params_map(routine),
+        ],
+        port_endpoints,
+        instance,
+        is_counterpart,
+    )
+
+
+def _execute_compilation_task(task: _CompilationTask[T_expr]) -> _CompilationResult[T_expr]:
+    """Executes all the steps of given compilation task.
+
+    This function doesn't need access to the routine, and hence can be run in a worker process.
+    """
+    functions = dict(task.children_functions)
+    counterparts = dict(task.counterparts)
+    updates: dict[str, RoutineUpdate] = {}
+    for step in task.steps:
+        if step.instance is not None:
+            functions[step.path] = step.instance.instantiate(functions[step.instance.representative_path(step.path)])
+        elif step.is_leaf:
+            assert step.function is not None
+            functions[step.path] = step.function
+        else:
+            functions[step.path] = _merge_children_functions(step, functions)
+
+        compiled = None
+        if step.instance is not None:
+            counterpart = counterparts[step.instance.representative_path(step.path)]
+            # If renaming doesn't change the counterpart's local function, the routine compiles to the same data
+            if step.instance.preserves(counterpart.local_function):
+                compiled = counterpart
+        if compiled is None:
+            compiled = _compile_step(step, functions[step.path], updates, task)
+
+        updates[step.path] = compiled.update
+        if step.is_counterpart:
+            counterparts[step.path] = compiled
+
+    return _CompilationResult(
+        updates,
+        {step.path: functions[step.path] for step in task.steps if not step.is_leaf or step.instance is not None},
+        {step.path: counterparts[step.path] for step in task.steps if step.is_counterpart},
+    )
+
+
+def _compile_step(
+    step: _CompilationStep[T_expr],
+    global_function: SymbolicFunction[T_expr],
+    updates: dict[str, RoutineUpdate],
+    task: _CompilationTask[T_expr],
+) -> _CompiledCounterpart[T_expr]:
+    """Compiles a single routine, given its global function."""
+    if step.is_leaf:
+        local_function = _compile_function_leaf_non_root(step, global_function)
+    else:
+        local_function = _compile_function_non_leaf(step, global_function, updates, task.backend)
+
+    compiled_function = local_function
+    if task.functions_map:
+        compiled_function = define_expression_functions(compiled_function, task.functions_map, strict=False)
+    return _CompiledCounterpart(local_function, RoutineUpdate.from_function(compiled_function))
+
+
+def _apply_compilation_result(
+    result: _CompilationResult[T_expr], subroutines: Iterable[RoutineWithFunction[T_expr]]
+) -> None:
+    """Updates given subroutines with the results of compilation task they were compiled in."""
+    for subroutine in subroutines:
+        path = subroutine.absolute_path(exclude_root_name=True)
+        result.updates[path].apply_to(subroutine)
+        if path in result.functions:
+            subroutine.symbolic_function = result.functions[path]
+
+
+def _compile_in_parallel(
+    subroutines: list[RoutineWithFunction[T_expr]],
+    functions_map: Optional[FunctionsMap],
+    backend: SymbolicBackend[T_expr],
+    reused: dict[int, CacheEntry[T_expr]],
+    workers: int,
+    instances: dict[int, tuple[Instance, RoutineWithFunction[T_expr]]],
+) -> None:
+    """Compiles given subroutines in a pool of worker processes.
+
+    Each task sent to the pool compiles either a batch of small sibling subtrees, or merges children
+    of a single larger routine. The latter is submitted as soon as all the tasks compiling the children
+    (and counterparts, for routines in instances) have finished.
+    """
+    groups = _group_subroutines_into_tasks(subroutines, reused, workers)
+    group_of = {id(subroutine): index for index, group in enumerate(groups) for subroutine in group}
+
+    # Each group can only be compiled once all the groups containing children of its routines are done.
+    dependencies: list[set[int]] = [set() for _ in groups]
+    dependents: list[set[int]] = [set() for _ in groups]
+    for index, group in enumerate(groups):
+        for subroutine in group:
+            # NOTE: Children are needed even for routines in instances, for inferring missing register sizes
+            prerequisites = list(subroutine.children.values())
+            if id(subroutine) in instances:
+                prerequisites.append(instances[id(subroutine)][1])
+            for prerequisite in prerequisites:
+                if id(prerequisite) in group_of and group_of[id(prerequisite)] != index:
+                    dependencies[index].add(group_of[id(prerequisite)])
+                    dependents[group_of[id(prerequisite)]].add(index)
+
+    counterparts: dict[str, _CompiledCounterpart[T_expr]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: dict[Future, int] = {}
+
+        def _submit(index: int) -> None:
+            task = _make_compilation_task(groups[index], functions_map, backend, instances, counterparts)
+            pending[executor.submit(_execute_compilation_task, task)] = index
+
+        for index in range(len(groups)):
+            if not dependencies[index]:
+                _submit(index)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                result = future.result()
+                _apply_compilation_result(result, groups[index])
+                counterparts.update(result.counterparts)
+                for dependent in dependents[index]:
+                    dependencies[dependent].remove(index)
+                    if not dependencies[dependent]:
+                        _submit(dependent)
+
+
+def _group_subroutines_into_tasks(
+    subroutines: list[RoutineWithFunction[T_expr]],
+    reused: dict[int, CacheEntry[T_expr]],
+    workers: int,
+) -> list[list[RoutineWithFunction[T_expr]]]:
+    """Splits subroutines (given in walk order) into groups compiled by separate tasks.
+
+    Subtrees not larger than a threshold are compiled in one task, batched together with their
+    small siblings. Larger subtrees are split further, and the merge of their root's children
+    becomes a separate task. Concatenating the groups yields the walk order, hence each routine
+    can only depend on routines in its own or preceding groups (which is needed e.g. for instances).
+    """
+    subtree_sizes: dict[int, int] = {}
+    for subroutine in subroutines:
+        subtree_sizes[id(subroutine)] = 1 + sum(
+            subtree_sizes[id(child)] for child in subroutine.children.values() if id(child) not in reused
+        )
+    # Few tasks per worker are enough to balance the load, while keeping the communication overhead low
+    threshold = max(1, len(subroutines) // (4 * workers))
+
+    groups: list[list[RoutineWithFunction[T_expr]]] = []
+
+    def _split(routine: RoutineWithFunction[T_expr]) -> None:
+        batch: list[RoutineWithFunction[T_expr]] = []
+        batch_size = 0
+        for child in _sort_children_topologically(routine):
+            if id(child) in reused:
+                continue
+            if subtree_sizes[id(child)] > threshold:
+                if batch:
+                    groups.append(batch)
+                    batch, batch_size = [], 0
+                _split(child)
+                continue
+            if batch and batch_size + subtree_sizes[id(child)] > threshold:
+                groups.append(batch)
+                batch, batch_size = [], 0
+            batch.extend(
+                subroutine for subroutine in _walk_skipping_reused(child, reused) if id(subroutine) not in reused
+            )
+            batch_size += subtree_sizes[id(child)]
+        if batch:
+            groups.append(batch)
+        groups.append([routine])
+
+    _split(subroutines[-1])
+    return groups
+
+
+def _merge_children_functions(
+    step: _CompilationStep[T_expr], functions: dict[str, SymbolicFunction[T_expr]]
+) -> SymbolicFunction[T_expr]:
+    """Compiles functions of a non-leaf routine's children and its own function into its new global function."""
+    assert step.function is not None
+    subfunctions = [functions[child] for child in step.children]
+
+    # Compile the functions to a single function for the current routine
+    new_function = compile_functions([*subfunctions, step.function])
+
+    # Deal with outputs associated with constant-sized registers.
+    # NOTE: Constant-sized ports are stored as output values, so these are added to compiled function during compilation
+    return _remove_constant_register_sizes_non_leaf_non_root(step.path, new_function)
+
+
+def _compile_function_leaf_non_root(
+    step: _CompilationStep[T_expr], global_function: SymbolicFunction[T_expr]
 ) -> SymbolicFunction[T_expr]:
     """Compiles a symbolic function for a leaf, which is not a root."""
-    # Undo the output register pushing out and input register pulling in to produce a valid routine
-    assert routine.symbolic_function is not None
-    local_function = _undo_push_out_output_register_size_params(routine.symbolic_function, routine)
-    local_function = _undo_pull_in_input_register_size_params_leaf(local_function, routine)
+    local_function = global_function
+    for rename_map in step.rename_maps:
+        local_function = rename_variables(local_function, rename_map)
 
     # Remove the global path namespace to make routine ignorant of higher structure
-    namespace = routine.absolute_path(exclude_root_name=True)
-    local_function = _remove_function_namespace(local_function, namespace)
-
-    return local_function
+    return _remove_function_namespace(local_function, step.path)
 
 
 def _remove_function_namespace(function: SymbolicFunction[T_expr], namespace: str) -> SymbolicFunction[T_expr]:
@@ -499,55 +1103,38 @@ def _remove_function_namespace(function: SymbolicFunction[T_expr], namespace: st
     return rename_variables(function, namespace_map)
 
 
-def _compile_function_to_routine_non_leaf_non_root(
-    routine: RoutineWithFunction[T_expr], backend: SymbolicBackend[T_expr]
+def _compile_function_non_leaf(
+    step: _CompilationStep[T_expr],
+    global_function: SymbolicFunction[T_expr],
+    updates: dict[str, RoutineUpdate],
+    backend: SymbolicBackend[T_expr],
 ) -> SymbolicFunction[T_expr]:
-    """Compiles a non-leaf's symbolic function."""
-    # Grab the functions to be compiled
-
-    function = routine.symbolic_function
-
-    subfunctions = [child.symbolic_function for child in get_children_in_walk_order(routine)]
-
-    # Compile the functions to a single function for the current routine
-    all_functions = cast(list[SymbolicFunction[T_expr]], [*subfunctions, function])
-    new_function = compile_functions(all_functions)
-
-    # Deal with outputs associated with constant-sized registers.
-    # NOTE: Constant-sized ports are stored as output values, so these are added to compiled function during compilation
-    new_function = _remove_constant_register_sizes_non_leaf_non_root(routine, new_function)
-
-    # Update routine with the function
-    routine.symbolic_function = new_function
-
-    # First, make sure the function is in terms of the routines's register input params and not its childrens'
-    new_function = _undo_pull_in_input_register_size_params_non_leaf(new_function, routine)
-
-    # Next, undo the pushing out of output register size parameter needed for function compilation
-    new_function = _undo_push_out_output_register_size_params(new_function, routine)
+    """Compiles a non-leaf's symbolic function, given its merged global function."""
+    # First, undo pulling in and pushing out of register sizes
+    new_function = global_function
+    for rename_map in step.rename_maps:
+        new_function = rename_variables(new_function, rename_map)
 
     # Next, remove any global parameter namespaces to ensure the function is locally consistent.
-    namespace = routine.absolute_path(exclude_root_name=True)
-    new_function = _remove_function_namespace(new_function, namespace)
+    new_function = _remove_function_namespace(new_function, step.path)
 
     # Lastly, go find the sizes of any constant-sized registers which weren't included in the compilation
-    new_function = _infer_missing_register_sizes(new_function, routine, backend)
-    return new_function
+    return _infer_missing_register_sizes(new_function, step, updates, backend)
 
 
 def _remove_constant_register_sizes_non_leaf_non_root(
-    routine: Routine, function: SymbolicFunction[T_expr]
+    path: str, function: SymbolicFunction[T_expr]
 ) -> SymbolicFunction[T_expr]:
     """Removes any constant register sizes associated with subroutine."""
     # First, go through and drop all function outputs associated with constant subroutine register sizes.
     new_outputs = {}
     for output_symbol, output_variable in function.outputs.items():
-        path, name = _split_local_path(str(output_symbol))
+        output_path, name = _split_local_path(str(output_symbol))
 
         # Case 1: It's a constant register size
         if name.startswith("#") and output_variable.is_constant_int:
             # Case 1.1: It's a constant register size for the current routine => keep
-            if path == routine.absolute_path(exclude_root_name=True):
+            if output_path == path:
                 new_outputs[output_symbol] = output_variable
 
             # Case 1.2: It's a constant register size for another routine => ignore
@@ -561,10 +1148,8 @@ def _remove_constant_register_sizes_non_leaf_non_root(
     return SymbolicFunction(function.inputs, new_outputs)
 
 
-def _undo_pull_in_input_register_size_params_leaf(
-    function: SymbolicFunction[T_expr], routine: Routine
-) -> SymbolicFunction[T_expr]:
-    """Renames the input register size params of any inputs connected to the parent with the parent's size param."""
+def _undo_pull_in_input_register_size_params_leaf_map(routine: Routine) -> dict[str, str]:
+    """Maps the input register size params of any inputs connected to the parent to the parent's size param."""
     param_map = {}
     for input_port in routine.input_ports.values():
         source_port = get_port_source(input_port)
@@ -581,16 +1166,14 @@ def _undo_pull_in_input_register_size_params_leaf(
         parent_param = join_paths(input_port.absolute_path(exclude_root_name=True), source_param)
         param_map[child_param] = parent_param
 
-    return rename_variables(function, param_map)
+    return param_map
 
 
-def _undo_pull_in_input_register_size_params_non_leaf(
-    function: SymbolicFunction[T_expr], routine: Routine
-) -> SymbolicFunction[T_expr]:
-    """Renames the input register size params for any input connected to the parent with the parent's size param."""
+def _undo_pull_in_input_register_size_params_non_leaf_map(routine: Routine) -> dict[str, str]:
+    """Maps the input register size params for any input connected to the parent to the parent's size param."""
     # Deal with root edge case
     if routine.is_root:
-        return function
+        return {}
 
     param_map = {}
     for input_port in routine.input_ports.values():
@@ -618,18 +1201,14 @@ def _undo_pull_in_input_register_size_params_non_leaf(
 
         param_map[child_param] = parent_param
 
-    new_function = rename_variables(function, param_map)
-    return new_function
+    return param_map
 
 
-def _undo_push_out_output_register_size_params(
-    function: SymbolicFunction[T_expr],
-    routine: RoutineWithFunction[T_expr],
-) -> SymbolicFunction[T_expr]:
-    """Renames the register size parameters for output ports to match their targets."""
+def _undo_push_out_output_register_size_params_map(routine: Routine) -> dict[str, str]:
+    """Maps the register size parameters of output ports' targets back to the output ports."""
     # Deal with root edge case
     if routine.is_root:
-        return function
+        return {}
 
     # Define parameter map
     param_map = {}
@@ -641,31 +1220,32 @@ def _undo_push_out_output_register_size_params(
         )
         param_map[new_param] = source.absolute_path(exclude_root_name=True)
 
-    # Return function with renamed parameters
-    return rename_variables(function, param_map)
+    return param_map
 
 
 def _infer_missing_register_sizes(
     function: SymbolicFunction[T_expr],
-    routine: RoutineWithFunction[T_expr],
+    step: _CompilationStep[T_expr],
+    updates: dict[str, RoutineUpdate],
     backend: SymbolicBackend[T_expr],
 ) -> SymbolicFunction[T_expr]:
     """Goes and routes out any missing register sizes (which should be associated with constant register sizes)."""
     known_register_sizes = _extract_known_register_sizes(function)
     new_outputs = {**function.outputs}
-    for port in routine.ports.values():
+    for port_name, (endpoint_path, endpoint_name, endpoint_size) in step.port_endpoints.items():
         # Skip if we've already got an expression for the size in the function
-        if port.name in known_register_sizes:
+        if port_name in known_register_sizes:
             continue
 
         # Otherwise, go find what the size should be, check it's a constant, and add it to the function's outputs
-        port_endpoint = _get_internal_port_endpoint(port)
-        if is_constant_int(port_endpoint.size):
-            assert port_endpoint.size  # To satisfy typechecker
-            new_output_symbol = f"#{port.name}"
+        if endpoint_path in updates:
+            endpoint_size = updates[endpoint_path].port_size(endpoint_name, endpoint_size)
+        if is_constant_int(endpoint_size):
+            assert endpoint_size  # To satisfy typechecker
+            new_output_symbol = f"#{port_name}"
             new_outputs[new_output_symbol] = DependentVariable(
                 new_output_symbol,
-                backend.as_expression(port_endpoint.size),
+                backend.as_expression(endpoint_size),
                 backend=backend,
             )
     return SymbolicFunction(function.inputs, new_outputs)
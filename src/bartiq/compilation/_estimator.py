@@ -0,0 +1,239 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compilation of resource expressions into plain Python code.
+
+Estimators generated here evaluate resources of a compiled routine without any symbolic
+manipulation: expressions are translated into Python source once, with common subexpressions
+eliminated, and the resulting function only uses the `math` module.
+"""
+
+from __future__ import annotations
+
+import os
+import textwrap
+from itertools import count
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from sympy import Expr, Symbol, cse
+from sympy.printing.pycode import PythonCodePrinter
+
+from .. import Routine
+from ..errors import BartiqCompilationError
+from ..symbolics import sympy_backend
+from ..symbolics.sympy_backends import _substitute_free_symbols
+from ._utilities import is_single_parameter
+from .types import FunctionsMap, Number
+
+# Bartiq's special functions which have no counterpart in the standard library.
+# They are included in the generated source, so that it is self-contained.
+_HELPERS_SOURCE = """\
+def _round(x, ndigits=0):
+    return round(x, int(ndigits))
+
+
+def _multiplicity(p, n):
+    p, n = int(p), int(n)
+    if p < 2:
+        raise ValueError(f"Expected p > 1 in multiplicity(p, n), got {p}.")
+    if n == 0:
+        return math.inf
+    count = 0
+    while n % p == 0:
+        n //= p
+        count += 1
+    return count
+"""
+
+
+class _EstimatorCodePrinter(PythonCodePrinter):
+    """Python code printer aware of bartiq's special functions."""
+
+    def __init__(self, function_names: dict[str, str]):
+        super().__init__(
+            {
+                "strict": True,
+                "fully_qualified_modules": True,
+                "user_functions": {"Round": "_round", "multiplicity": "_multiplicity", **function_names},
+            }
+        )
+
+    def _print_Product(self, expr):
+        (index, start, end) = expr.limits[0]
+        return "(math.prod({} for {} in range({}, {}+1)))".format(
+            self._print(expr.function), self._print(index), self._print(start), self._print(end)
+        )
+
+
+class Estimator:
+    """Numeric estimator of resources of a compiled routine.
+
+    Estimator holds Python source of a function computing all the resources and output register
+    sizes of the routine, which is compiled when the estimator is created or unpickled. Calling
+    the estimator doesn't involve any symbolic manipulation.
+
+    Estimators are created with `compile_estimator`, and can be pickled as long as all the functions
+    in their `functions_map` can.
+
+    Attributes:
+        source: Source of the Python module defining the `_estimate` function.
+        inputs: Names of the parameters the estimator has to be called with.
+        outputs: Names of the returned values, i.e. names of resources and names of output
+            ports prefixed with "#".
+        functions_map: User-defined functions used by the generated code.
+    """
+
+    def __init__(self, source: str, inputs: tuple[str, ...], outputs: tuple[str, ...], functions_map: FunctionsMap):
+        self.source = source
+        self.inputs = inputs
+        self.outputs = outputs
+        self.functions_map = functions_map
+        namespace: dict[str, Any] = {}
+        exec(compile(source, "<bartiq-estimator>", "exec"), namespace)
+        self._estimate: Callable[..., tuple] = namespace["_estimate"]
+
+    def __call__(self, **params: Number) -> dict[str, Number]:
+        """Compute values of resources and output register sizes for given values of the input parameters."""
+        try:
+            values = self._estimate(params, self.functions_map)
+        except KeyError as e:
+            raise BartiqCompilationError(
+                f"No value was given for parameter {e.args[0]}; the estimator requires {list(self.inputs)}."
+            ) from e
+        return dict(zip(self.outputs, values))
+
+    def to_module_source(self) -> str:
+        """Return source of a standalone Python module exposing this estimator as a plain `estimate` function.
+
+        The module doesn't import bartiq, sympy nor pydantic. Functions from `functions_map` are imported
+        from the modules they are defined in, hence they have to be defined at the module level.
+
+        Raises:
+            BartiqCompilationError: If some function from `functions_map` cannot be imported.
+        """
+        imports = []
+        functions = []
+        for i, (name, function) in enumerate(sorted(self.functions_map.items())):
+            module = getattr(function, "__module__", None)
+            qualname = getattr(function, "__qualname__", "<unknown>")
+            if module in (None, "__main__") or "<" in qualname:
+                raise BartiqCompilationError(
+                    f"Cannot import function {qualname} used as {name}; only functions defined at the module level "
+                    "of an importable module can be used in generated modules."
+                )
+            imports.append(f"import {module} as _module_{i}")
+            functions.append(f"    {name!r}: _module_{i}.{qualname},")
+
+        return "\n".join(
+            [
+                '"""Resource estimator generated by bartiq. Do not edit.',
+                "",
+                f"Inputs: {', '.join(self.inputs) or '-'}",
+                f"Outputs: {', '.join(self.outputs) or '-'}",
+                '"""',
+                self.source,
+                *imports,
+                "",
+                f"INPUTS = {self.inputs!r}",
+                f"OUTPUTS = {self.outputs!r}",
+                "_FUNCTIONS_MAP = {",
+                *functions,
+                "}",
+                "",
+                "",
+                "def estimate(**params):",
+                '    """Compute values of resources and output register sizes for given values of the inputs."""',
+                "    return dict(zip(OUTPUTS, _estimate(params, _FUNCTIONS_MAP)))",
+                "",
+            ]
+        )
+
+    def save_module(self, path: Union[str, os.PathLike]) -> None:
+        """Write source of a standalone Python module exposing this estimator to given path.
+
+        See `to_module_source` for details.
+        """
+        Path(path).write_text(self.to_module_source())
+
+    def __reduce__(self):
+        return (Estimator, (self.source, self.inputs, self.outputs, self.functions_map))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(inputs={list(self.inputs)}, outputs={list(self.outputs)})"
+
+
+def compile_estimator(routine: Routine, *, functions_map: Optional[FunctionsMap] = None) -> Estimator:
+    """Turn resources and output register sizes of a compiled routine into a numeric estimator.
+
+    Args:
+        routine: Routine to create the estimator for. Note: this must have been compiled already.
+        functions_map: A dictionary with string keys and callable functions as values. If any of the resources
+            contains a function matching the key in this dict, it will be replaced by calling corresponding value.
+
+    Returns:
+        Estimator computing all the resources and sizes of output ports of the routine.
+
+    Raises:
+        BartiqCompilationError: If an expression contains an undefined function, or a function which cannot be
+            translated into Python code.
+    """
+    functions_map = functions_map or {}
+    outputs: list[str] = []
+    expressions: list[Expr] = []
+    for name, resource in routine.resources.items():
+        outputs.append(name)
+        expressions.append(sympy_backend.as_expression(resource.value))
+    for name, port in routine.output_ports.items():
+        if port.size is not None:
+            outputs.append(f"#{name}")
+            expressions.append(sympy_backend.as_expression(port.size))
+
+    port_sizes = [str(port.size) for port in routine.input_ports.values() if is_single_parameter(str(port.size))]
+    inputs = tuple(dict.fromkeys([*routine.input_params, *port_sizes]))
+    used_functions = {name for expression in expressions for name in sympy_backend.functions_in(expression)}
+    if undefined := sorted(used_functions.difference(functions_map)):
+        raise BartiqCompilationError(f"Cannot compile estimator, since functions {undefined} are not defined.")
+
+    source = _generate_source(inputs, expressions, sorted(used_functions))
+    return Estimator(source, inputs, tuple(outputs), {name: functions_map[name] for name in used_functions})
+
+
+def _generate_source(inputs: tuple[str, ...], expressions: list[Expr], functions: list[str]) -> str:
+    # Parameters and functions are referred to by generated names, since their names
+    # are not necessarily valid Python identifiers (e.g. "a.N" or "a.f").
+    variables = {Symbol(name): Symbol(f"_input_{i}") for i, name in enumerate(inputs)}
+    function_names = {name: f"_function_{i}" for i, name in enumerate(functions)}
+    printer = _EstimatorCodePrinter(function_names)
+
+    expressions = [_substitute_free_symbols(expression, variables) for expression in expressions]
+    if unknown := {symbol for expression in expressions for symbol in expression.free_symbols} - set(
+        variables.values()
+    ):
+        raise BartiqCompilationError(
+            f"Cannot compile estimator, since expressions depend on unknown {sorted(map(str, unknown))}."
+        )
+
+    replacements, reduced_expressions = cse(expressions, symbols=(Symbol(f"_x{i}") for i in count()))
+    lines = [f"{variable} = params[{name!r}]" for name, variable in zip(inputs, variables.values())]
+    lines += [f"{function_names[name]} = functions_map[{name!r}]" for name in functions]
+    try:
+        lines += [f"{symbol} = {printer.doprint(expression)}" for symbol, expression in replacements]
+        values = [printer.doprint(expression) for expression in reduced_expressions]
+    except NotImplementedError as e:
+        raise BartiqCompilationError(f"Cannot compile estimator: {e}") from e
+    lines.append(f"return ({''.join(value + ', ' for value in values)})")
+
+    body = textwrap.indent("\n".join(lines), "    ")
+    return f"import builtins\nimport math\n\n\n{_HELPERS_SOURCE}\n\ndef _estimate(params, functions_map):\n{body}\n"
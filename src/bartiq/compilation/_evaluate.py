@@ -12,21 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import annotations
+
 from collections import defaultdict
-from dataclasses import dataclass
-from typing import Optional, Union, overload
+from dataclasses import dataclass, replace
+from typing import Any, Generic, Optional, Union, overload
 
 from .. import Port, PortDirection, Routine
 from ..errors import BartiqCompilationError
 from ..routing import get_route
 from ..symbolics import sympy_backend
 from ..symbolics.backend import SymbolicBackend, T_expr
-from ._compile import set_input_port_size_to_constant_value
+from ..symbolics.variables import DependentVariable, substitute_expressions_in_all
+from ._compile import _split_local_path
 from ._symbolic_function import (
+    RoutineUpdate,
+    SymbolicFunction,
     define_expression_functions,
-    evaluate_function_at,
     to_symbolic_function,
-    update_routine_with_symbolic_function,
 )
 from ._utilities import (
     is_non_negative_int,
@@ -109,13 +112,166 @@ def _evaluate(
     backend: SymbolicBackend[T_expr],
     functions_map: Optional[FunctionsMap],
 ) -> Routine:
-    # We do this to ensure we don't mutate the input object.
-    evaluated_routine = Routine(**routine.model_dump())
-    parsed_assignments = _parse_assignments(evaluated_routine, assignments, backend)
-    for parsed_assignment in parsed_assignments:
-        _evaluate_over_assignment(evaluated_routine, parsed_assignment, backend, functions_map)
+    return EvaluationPlan(routine, backend=backend, functions_map=functions_map).evaluate(assignments)
+
+
+class EvaluationPlan(Generic[T_expr]):
+    """Evaluation of a compiled routine, prepared once for evaluating it with many different assignments.
+
+    Calling `evaluate` repeatedly on the same routine parses all of its expressions and recomputes
+    routes of the registers on each call. The plan does that at most once per subroutine, and
+    reuses the results in all the subsequent evaluations:
 
-    return evaluated_routine
+    ```python
+    plan = EvaluationPlan(compiled_routine)
+    for n in range(1, 100):
+        evaluated_routine = plan.evaluate([f"N={n}"])
+    ```
+
+    The plan stores a copy of the routine, hence modifying the routine after creating the plan
+    doesn't affect the results.
+
+    Args:
+        routine: Routine to evaluate. Note: this must have been compiled already.
+        backend: A backend used for manipulating symbolic expressions.
+        functions_map: A dictionary with string keys and callable functions as values. If any of the routines contains
+            a function matching the key in this dict, it will be replaced by calling corresponding value of this dict.
+    """
+
+    def __init__(
+        self,
+        routine: Routine,
+        *,
+        backend: SymbolicBackend[T_expr] = sympy_backend,
+        functions_map: Optional[FunctionsMap] = None,
+    ):
+        self.backend = backend
+        self.functions_map = functions_map
+        self._routine_data = routine.model_dump()
+        self._routine = Routine.from_trusted_dict(self._routine_data)
+        self._subroutines = [(subroutine.absolute_path(), subroutine) for subroutine in self._routine.walk()]
+        # Functions and routes are prepared lazily, so that only the routines affected by assignments are parsed
+        self._functions: dict[str, SymbolicFunction[T_expr]] = {}
+        self._routes: dict[str, list[tuple[str, _RegisterSizeAssignment]]] = {}
+
+    def evaluate(self, assignments: list[str]) -> Routine:
+        """Evaluates the routine over a series of variable assignments.
+
+        Args:
+            assignments: A list of variable assignments, such as ``['x = 10', 'y = 3.141']``.
+
+        Returns:
+            A new routine with variables assigned to the desired values.
+        """
+        parsed_assignments = _parse_assignments(self._routine, assignments, self.backend)
+        state = _EvaluationState(self)
+        self._evaluate_over_assignments(state, parsed_assignments)
+
+        # We do this to ensure we don't mutate the routine stored in the plan.
+        evaluated_routine = Routine.from_trusted_dict(self._routine_data)
+        for subroutine in evaluated_routine.walk():
+            if (update := state.update(subroutine.absolute_path())) is not None:
+                update.apply_to(subroutine)
+        return evaluated_routine
+
+    def _prepared_function(self, path: str, routine: Routine) -> SymbolicFunction[T_expr]:
+        if (function := self._functions.get(path)) is None:
+            function = to_symbolic_function(routine, self.backend)
+            function = define_expression_functions(function, self.functions_map, strict=False)
+            self._functions[path] = function
+        return function
+
+    def _evaluate_over_assignments(self, state: _EvaluationState[T_expr], assignments: list[Assignment]) -> None:
+        # Without any assignments nothing changes, including the sizes of the registers
+        if not assignments:
+            return
+
+        # First, check that all the assignments are to numbers
+        for assignment in assignments:
+            if not isinstance(assignment.value, NUMBER_TYPES):
+                raise BartiqCompilationError(
+                    "Can only evaluate variables to numbers; "
+                    f"attempted assignment {assignment.variable} = {assignment.value}"
+                )
+
+        variables = {
+            assignment.variable: assignment.value
+            for assignment in assignments
+            if isinstance(assignment, _VariableAssignment)
+        }
+
+        # A map from routine path to register size assignments
+        register_sizes: RegisterSizeAssignmentMap = defaultdict(list)
+
+        # Register size assignments happen at the root, and at the downstream ports
+        for assignment in assignments:
+            if isinstance(assignment, _RegisterSizeAssignment):
+                register_sizes[self._routine.absolute_path()].append(assignment)
+                source_port = self._routine.ports[assignment.register]
+                for target_path, size_assignment in self._downstream_register_sizes(source_port, assignment.value):
+                    register_sizes[target_path].append(size_assignment)
+
+        # Walk over the estimate once, and evaluate each subroutine over all the assignments relevant to it.
+        # Since children are visited in topological order, each subroutine is visited only after all the
+        # upstream subroutines have propagated their register sizes to it.
+        for path, subroutine in self._subroutines:
+            _evaluate_routine_over_assignments(state, path, subroutine, variables, register_sizes.pop(path, []))
+
+            # Propagate forwards any constant output register sizes
+            for port in subroutine.output_ports.values():
+                size_str = str(state.port_size(path, port))
+                if is_number_string(size_str):
+                    size_value = parse_value(size_str)
+                    assert is_non_negative_int(size_value)
+                    for target_path, size_assignment in self._downstream_register_sizes(port, size_value):
+                        register_sizes[target_path].append(size_assignment)
+
+        assert not register_sizes, f"Shouldn't have any more register sizes left to evaluate; found {register_sizes}"
+
+    def _downstream_register_sizes(self, source_port: Port, value: Number) -> list[tuple[str, _RegisterSizeAssignment]]:
+        """Register size assignments of the ports downstream of given port, paired with paths of their routines."""
+        path = source_port.absolute_path()
+        if (route := self._routes.get(path)) is None:
+            route = self._routes[path] = [
+                (target_path, assignment)
+                for target_path, assignments in _get_downstream_register_size_assignments(source_port, 0).items()
+                for assignment in assignments
+            ]
+        return [(target_path, replace(assignment, value=value)) for target_path, assignment in route]
+
+
+class _EvaluationState(Generic[T_expr]):
+    """Functions of the routines affected by the assignments evaluated so far, during a single evaluation."""
+
+    def __init__(self, plan: EvaluationPlan[T_expr]):
+        self.plan = plan
+        self.backend = plan.backend
+        self._functions: dict[str, SymbolicFunction[T_expr]] = {}
+        self._updates: dict[str, RoutineUpdate] = {}
+
+    def function(self, path: str, routine: Routine) -> SymbolicFunction[T_expr]:
+        """Current function of given routine."""
+        if (function := self._functions.get(path)) is None:
+            function = self.plan._prepared_function(path, routine)
+        return function
+
+    def set_function(self, path: str, function: SymbolicFunction[T_expr]) -> None:
+        """Replace current function of given routine."""
+        self._functions[path] = function
+        self._updates.pop(path, None)
+
+    def update(self, path: str) -> Optional[RoutineUpdate]:
+        """Update of given routine corresponding to its current function, or None if the routine is unaffected."""
+        if path not in self._functions:
+            return None
+        if (update := self._updates.get(path)) is None:
+            update = self._updates[path] = RoutineUpdate.from_function(self._functions[path])
+        return update
+
+    def port_size(self, path: str, port: Port) -> Any:
+        """Size of given port, with the assignments evaluated so far applied."""
+        update = self.update(path)
+        return port.size if update is None else update.port_size(port.name, port.size)
 
 
 def _parse_assignments(
@@ -171,52 +327,6 @@ def _get_input_register_size_per_register(routine: Routine) -> dict[str, list[st
     return size_to_registers_map
 
 
-def _evaluate_over_assignment(
-    routine: Routine,
-    assignment: Assignment,
-    backend: SymbolicBackend[T_expr],
-    functions_map: Optional[FunctionsMap] = None,
-) -> None:
-    # A map from routine path to register size assignments
-    register_sizes: RegisterSizeAssignmentMap = defaultdict(list)
-
-    # Creates register size assignments for the register sizes of downstream ports from the initial assignment
-    if isinstance(assignment, _RegisterSizeAssignment):
-        source_port = routine.ports[assignment.register]
-        downstream_size_assignments = _get_downstream_register_size_assignments(source_port, assignment.value)
-        register_sizes.update(downstream_size_assignments)
-
-    # Walk over the estimate and evaluate each subroutine over the assignment
-    for subroutine in routine.walk():
-        # Compile a list of assignments that includes the assignments relevant to the current routine
-        subroutine_assignments: list[Assignment] = []
-        if isinstance(assignment, _VariableAssignment):
-            subroutine_assignments.append(assignment)
-
-        # Register size assignments only need to happen at the root
-        if isinstance(assignment, _RegisterSizeAssignment) and subroutine.is_root:
-            subroutine_assignments.append(assignment)
-
-        # Check for any register size assignments that have been propagated from upstream ports
-        if subroutine.absolute_path() in register_sizes:
-            subroutine_assignments.extend(register_sizes.pop(subroutine.absolute_path()))
-
-        # Compute the new routine
-        evaluated_routine = _evaluate_routine(subroutine, subroutine_assignments, backend, functions_map)
-
-        # Propagate forwards any constant output register sizes
-        routine_downstream_register_size_assignments = _propagate_forward_constant_output_register_sizes(
-            evaluated_routine
-        )
-        for (
-            path,
-            downstream_assignments,
-        ) in routine_downstream_register_size_assignments.items():
-            register_sizes[path].extend(downstream_assignments)
-
-    assert not register_sizes, f"Shouldn't have any more register sizes left to evaluate; found {register_sizes}"
-
-
 def _get_downstream_register_size_assignments(source_port: Port, value: Number) -> RegisterSizeAssignmentMap:
     register_sizes = defaultdict(list)
 
@@ -235,94 +345,83 @@ def _get_downstream_register_size_assignments(source_port: Port, value: Number)
     return register_sizes
 
 
-def _propagate_forward_constant_output_register_sizes(
+def _evaluate_routine_over_assignments(
+    state: _EvaluationState[T_expr],
+    path: str,
     routine: Routine,
-) -> RegisterSizeAssignmentMap:
-    register_sizes: RegisterSizeAssignmentMap = defaultdict(list)
-
-    for port in routine.output_ports.values():
-        size_str = str(port.size)
-        if is_number_string(size_str):
-            size_value = parse_value(size_str)
-            assert is_non_negative_int(size_value)
-            downstream_size_assignments = _get_downstream_register_size_assignments(port, size_value)
-            register_sizes.update(downstream_size_assignments)
-
-    return register_sizes
-
+    variables: dict[str, Number],
+    register_sizes: list[_RegisterSizeAssignment],
+) -> None:
+    """Evaluates a routine over all the variable and register size assignments relevant to it at once.
 
-def _evaluate_routine(
-    routine: Routine,
-    assignments: list[Assignment],
-    backend: SymbolicBackend[T_expr],
-    functions_map: Optional[FunctionsMap] = None,
-) -> Routine:
-    for assignment in assignments:
-        routine = _evaluate_routine_over_assignment(routine, assignment, backend, functions_map)
-    return routine
+    All the assigned values are collected into a single substitution, which is then applied to each
+    output of the routine's function only once.
+    """
+    # Deal with case when routine doesn't reference any of the input variables
+    local_variables = {variable: value for variable, value in variables.items() if variable in routine.input_params}
+    if not local_variables and not register_sizes:
+        return
+
+    backend = state.backend
+    old_function = state.function(path, routine)
+    substitution = {
+        variable: backend.as_expression(value)
+        for variable, value in local_variables.items()
+        if variable in old_function.inputs
+    }
+    # Constant sizes of the input ports, which are outputs of the new function
+    port_sizes: dict[str, Number] = {}
+
+    for assignment in register_sizes:
+        port_path = f"#{assignment.register}"
+        remaining_inputs = [symbol for symbol in old_function.inputs if symbol not in substitution]
+        port_param = next(
+            (param for input_path, param in map(_split_local_path, remaining_inputs) if input_path == port_path), None
+        )
+        if port_param is not None:
+            # If a given variable is present in more than one port, all of them are set
+            for symbol in remaining_inputs:
+                input_path, param = _split_local_path(symbol)
+                if param == port_param:
+                    substitution[symbol] = backend.as_expression(assignment.value)
+                    port_sizes[input_path] = assignment.value
+        else:
+            # The port size is already constant, so check that the values match
+            _check_constant_port_size(old_function, port_path, assignment.value, port_sizes, substitution)
+
+    if not substitution:
+        return
+
+    new_function = SymbolicFunction(
+        [input for symbol, input in old_function.inputs.items() if symbol not in substitution],
+        [
+            *(
+                DependentVariable(symbol=port_path, expression=backend.as_expression(value), backend=backend)
+                for port_path, value in port_sizes.items()
+            ),
+            *substitute_expressions_in_all(old_function.outputs.values(), substitution),
+        ],
+    )
+    state.set_function(path, new_function)
 
 
-def _evaluate_routine_over_assignment(
-    routine: Routine,
-    assignment: Assignment,
-    backend: SymbolicBackend[T_expr],
-    functions_map: Optional[FunctionsMap] = None,
-) -> Routine:
-    """Dispatches operation assignment based upon the assignment type."""
-    # First, check that the assignment is to a number
-    if not isinstance(assignment.value, NUMBER_TYPES):
+def _check_constant_port_size(
+    function: SymbolicFunction[T_expr],
+    port_path: str,
+    value: Number,
+    port_sizes: dict[str, Number],
+    substitution: dict[str, T_expr],
+) -> None:
+    if port_path in port_sizes:
+        port_value = port_sizes[port_path]
+    else:
+        output = function.outputs.get(port_path)
+        # Shouldn't be possible that function doesn't know anything about that port whatsoever
+        assert output is not None, f"Expected function {function} to reference {port_path}, but it doesn't."
+        port_value = output.substitute_expressions(substitution).value
+        assert port_value is not None, f"Expected function {function} to reference {port_path}, but it doesn't."
+    if int(port_value) != int(value):
         raise BartiqCompilationError(
-            f"Can only evaluate variables to numbers; attempted assignment {assignment.variable} = {assignment.value}"
+            "Failed to set constant register size value because port already has a different constant size; "
+            f"register {port_path} has size {value}, but attempted to assign {port_value}."
         )
-    # Evaluate assignment based on type
-    if isinstance(assignment, _VariableAssignment):
-        routine = _evaluate_routine_over_assignment_input_variable(routine, assignment, backend, functions_map)
-    if isinstance(assignment, _RegisterSizeAssignment):
-        assert assignment.direction == PortDirection.input
-        routine = _evaluate_routine_over_assignment_input_register_size(routine, assignment, backend, functions_map)
-
-    return routine
-
-
-def _evaluate_routine_over_assignment_input_variable(
-    routine: Routine,
-    assignment: _VariableAssignment,
-    backend: SymbolicBackend[T_expr],
-    functions_map: Optional[FunctionsMap] = None,
-) -> Routine:
-    """Evaluates a routine over a single input variable assignment."""
-    variable = assignment.variable
-    value = assignment.value
-
-    # Deal with case when routine doesn't reference input variable
-    if variable not in routine.input_params:
-        return routine
-
-    # Parse the routine and the assignment
-    old_function = to_symbolic_function(routine, backend)
-
-    # Evaluate function over assignment and substitute any user-provided functions
-    new_function = define_expression_functions(old_function, functions_map, strict=False)
-    new_function = evaluate_function_at(new_function, variable, value, backend)
-
-    update_routine_with_symbolic_function(routine, new_function)
-    return routine
-
-
-def _evaluate_routine_over_assignment_input_register_size(
-    routine: Routine,
-    assignment: _RegisterSizeAssignment,
-    backend: SymbolicBackend[T_expr],
-    functions_map: Optional[FunctionsMap] = None,
-) -> Routine:
-    """Evaluates a routine over a single input register size assignment."""
-    register = f"#{assignment.register}"
-    value = assignment.value
-
-    old_function = to_symbolic_function(routine, backend)
-
-    new_function = define_expression_functions(old_function, functions_map)
-    new_function = set_input_port_size_to_constant_value(new_function, register, value, backend)
-
-    update_routine_with_symbolic_function(routine, new_function)
-    return routine
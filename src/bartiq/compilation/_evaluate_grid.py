@@ -0,0 +1,223 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Evaluation of compiled routines over whole grids of parameter values at once.
+
+Instead of substituting values into expressions, as `evaluate` does, each distinct expression
+is converted into a NumPy function only once, and then called with arrays of values.
+"""
+
+from collections import defaultdict
+from functools import reduce
+from typing import Any, Callable, Optional, Union
+
+try:
+    import numpy as np
+    from numpy.typing import ArrayLike, NDArray
+except ImportError as error:
+    raise ImportError(
+        'evaluate_grid requires NumPy, which can be installed with: pip install "bartiq[grid]"'
+    ) from error
+
+from sympy import Expr, lambdify
+from sympy import multiplicity as sympy_multiplicity
+
+from .. import PortDirection, Routine
+from ..errors import BartiqCompilationError
+from ..routing import get_route
+from ..symbolics import sympy_backend
+from ._evaluate import _get_input_register_size_per_register
+from ._utilities import is_number_string
+from .types import FunctionsMap
+
+ResourceGrid = dict[str, dict[str, NDArray[Any]]]
+
+
+def _round(x, ndigits=0):
+    return np.round(x, int(ndigits))
+
+
+def _maximum(*args):
+    return reduce(np.maximum, args)
+
+
+def _minimum(*args):
+    return reduce(np.minimum, args)
+
+
+_multiplicity = np.vectorize(lambda p, n: sympy_multiplicity(int(p), int(n)), otypes=[int])
+
+
+# Vectorized counterparts of bartiq's special functions. Remaining functions (e.g. better_prod)
+# are evaluated by the parser already, and the rest is translated to NumPy by sympy itself.
+_NUMPY_FUNCTIONS: dict[str, Callable] = {
+    "Round": _round,
+    "multiplicity": _multiplicity,
+    "Max": _maximum,
+    "Min": _minimum,
+}
+
+
+def evaluate_grid(
+    routine: Routine,
+    assignments: dict[str, ArrayLike],
+    *,
+    functions_map: Optional[FunctionsMap] = None,
+) -> ResourceGrid:
+    """Evaluate resources of a compiled routine over arrays of values of its parameters.
+
+    The arrays are broadcast against each other, following NumPy rules. Hence, passing arrays of
+    equal shapes evaluates the resources at a batch of points, while evaluating them over a
+    Cartesian product of values can be done e.g. with `numpy.meshgrid`.
+
+    Each distinct expression is converted into a NumPy function only once, which makes this
+    function much faster than calling `evaluate` for each point separately.
+
+    Args:
+        routine: Routine to evaluate. Note: this must have been compiled already.
+        assignments: A dictionary mapping input parameters (or sizes of input registers) of
+            the routine to their values, e.g. ``{"x": np.arange(10), "y": 3.141}``.
+        functions_map: A dictionary with string keys and callable functions as values. If any of the routines contains
+            a function matching the key in this dict, it will be replaced by calling corresponding value of this dict.
+            Functions which don't accept NumPy arrays are called separately for each point of the grid.
+
+    Returns:
+        A dictionary mapping absolute paths of the routines to dictionaries of arrays with values of their resources.
+        All the arrays have the broadcast shape of the values in `assignments`.
+
+    Raises:
+        BartiqCompilationError: If an unknown variable is assigned, or a resource depends on a variable
+            which has not been assigned.
+    """
+    values = np.broadcast_arrays(*(np.asarray(value) for value in assignments.values()))
+    shape = values[0].shape if values else ()
+    evaluator = _GridEvaluator(shape, functions_map or {})
+
+    size_to_registers_map = _get_input_register_size_per_register(routine)
+    variables: dict[str, NDArray[Any]] = {}
+    # A map from routine path to values of sizes of its registers
+    register_sizes: dict[str, dict[str, NDArray[Any]]] = defaultdict(dict)
+    for variable, value in zip(assignments, values):
+        if variable not in routine.input_params and variable not in size_to_registers_map:
+            all_params = list(routine.input_params) + list(size_to_registers_map.keys())
+            raise BartiqCompilationError(f"Cannot set unknown variable {variable}; known variables are {all_params}.")
+        if variable in routine.input_params:
+            variables[variable] = value
+        for register in size_to_registers_map.get(variable, []):
+            register_sizes[routine.absolute_path()][variable] = value
+            _propagate_register_size(routine.ports[register], value, register_sizes)
+
+    results: ResourceGrid = {}
+    for subroutine in routine.walk():
+        path = subroutine.absolute_path()
+        local_values = {
+            **{param: variables[param] for param in subroutine.input_params if param in variables},
+            **register_sizes.pop(path, {}),
+        }
+        results[path] = {
+            name: evaluator.evaluate(resource.value, local_values, f"resource {name} of {path}")
+            for name, resource in subroutine.resources.items()
+        }
+
+        # Output register sizes have to be propagated forward, as they are sizes of the downstream input registers
+        for port in subroutine.output_ports.values():
+            if port.size is None or is_number_string(str(port.size)):
+                continue
+            expression = evaluator.parse(port.size)
+            if set(map(str, expression.free_symbols)).issubset(local_values):
+                size = evaluator.evaluate(port.size, local_values, f"size of port {port.name} of {path}")
+                _propagate_register_size(port, size, register_sizes)
+
+    return results
+
+
+def _propagate_register_size(
+    source_port, value: NDArray[Any], register_sizes: dict[str, dict[str, NDArray[Any]]]
+) -> None:
+    for target_port in get_route(source_port, forward=True)[1:]:
+        # Outputs are skipped, since their sizes are defined by their own expressions
+        if target_port.direction == PortDirection.output or is_number_string(str(target_port.size)):
+            continue
+        assert target_port.parent is not None
+        register_sizes[target_port.parent.absolute_path()][str(target_port.size)] = value
+
+
+class _GridEvaluator:
+    """Evaluates expressions over arrays, converting each distinct expression into a NumPy function only once."""
+
+    def __init__(self, shape: tuple[int, ...], functions_map: FunctionsMap):
+        self.shape = shape
+        self.functions_map = functions_map
+        self._expressions: dict[str, Expr] = {}
+        self._functions: dict[tuple[str, tuple[str, ...]], Callable] = {}
+
+    def parse(self, value: Union[str, int, float]) -> Expr:
+        key = str(value)
+        if (expression := self._expressions.get(key)) is None:
+            expression = self._expressions[key] = sympy_backend.as_expression(value)
+        return expression
+
+    def evaluate(self, value: Union[str, int, float], local_values: dict[str, NDArray[Any]], what: str) -> NDArray:
+        expression = self.parse(value)
+        symbols = tuple(sorted(map(str, expression.free_symbols)))
+        if missing := [symbol for symbol in symbols if symbol not in local_values]:
+            raise BartiqCompilationError(f"Cannot evaluate {what}, since no values were assigned to {missing}.")
+        if undefined := [name for name in sympy_backend.functions_in(expression) if name not in self.functions_map]:
+            raise BartiqCompilationError(f"Cannot evaluate {what}, since functions {undefined} are not defined.")
+
+        key = (str(value), symbols)
+        if (function := self._functions.get(key)) is None:
+            function = self._functions[key] = self._lambdify(symbols, expression)
+        result = function(*(local_values[symbol] for symbol in symbols))
+        return np.broadcast_to(result, self.shape) if np.ndim(result) == 0 else result
+
+    def _lambdify(self, symbols: tuple[str, ...], expression: Expr) -> Callable:
+        # Names of user-defined functions are often paths (e.g. "a.f"), which are not valid Python identifiers
+        namespace = dict(_NUMPY_FUNCTIONS)
+        renamed_expression = expression
+        for i, name in enumerate(set(sympy_backend.functions_in(expression))):
+            renamed_expression = sympy_backend.rename_function(renamed_expression, name, f"_function_{i}")
+            namespace[f"_function_{i}"] = self.functions_map[name]
+        try:
+            vectorized: Optional[Callable] = lambdify(symbols, renamed_expression, modules=[namespace, "numpy"])
+        except NotImplementedError:
+            # Some expressions (e.g. products with symbolic bounds) can't be translated to NumPy at all
+            vectorized = None
+        elementwise: Optional[Callable] = None
+
+        def _value_at(*point):
+            # Used for expressions which can't be translated to Python code at all
+            value = sympy_backend.substitute_all(expression, dict(zip(symbols, point)))
+            for name in set(sympy_backend.functions_in(value)):
+                value = sympy_backend.define_function(value, name, self.functions_map[name])
+            return sympy_backend.value_of(value.doit())
+
+        def _evaluate(*args):
+            nonlocal elementwise
+            if vectorized is not None:
+                try:
+                    return vectorized(*args)
+                except (TypeError, ValueError, NameError, AttributeError):
+                    pass
+            # Expressions using functions which don't accept arrays (e.g. sums with symbolic bounds or
+            # user-defined functions with conditions) are evaluated point by point.
+            if elementwise is None:
+                if vectorized is None:
+                    elementwise = np.vectorize(_value_at)
+                else:
+                    scalar = lambdify(symbols, renamed_expression, modules=[namespace, "sympy"])
+                    elementwise = np.vectorize(lambda *point: sympy_backend.value_of(scalar(*point)))
+            return elementwise(*args)
+
+        return _evaluate
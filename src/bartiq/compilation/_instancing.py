@@ -0,0 +1,306 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compile-once instancing of structurally identical subroutines.
+
+Programs often contain many copies of the same block, which differ only by their names and
+by what they are connected to. Once expressed in the global namespace, functions of such copies
+differ only by renaming: symbols in the copy's namespace are renamed from the namespace of the
+representative, and symbols through which the copy interacts with the rest of the program
+(called "slots" below) are renamed from the corresponding symbols of the representative. Slots are:
+
+- ancestor parameters inherited by the parameters of the block's root,
+- parameters of the root's input ports pulled in by the block's leaves,
+- parameters of the input ports targeted by the block's outputs.
+
+Hence, instead of merging functions of the copy's children, its global function can be obtained
+by renaming the global function of the representative. Moreover, unless the local functions of the
+representative's routines reference any renamed symbols, routines of the copy are compiled to exactly
+the same data as their counterparts in the representative.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional, TypeVar, Union, cast
+
+from .. import Port, Routine
+from ..routing import get_port_source, get_port_target, join_paths
+from ..symbolics.backend import T_expr
+from ._cache import _digest, _own_fields
+from ._symbolic_function import SymbolicFunction, rename_functions
+from ._utilities import is_constant_int, is_single_parameter
+
+T_routine = TypeVar("T_routine", bound=Routine)
+
+# Slots are either global symbols, or tuples describing values which are not symbols
+_Slot = Union[str, tuple[Any, ...]]
+
+
+@dataclass(frozen=True)
+class Instance:
+    """A non-leaf subroutine whose global function is a renamed global function of a structurally identical one.
+
+    Attributes:
+        path: Path of the instance, excluding root name.
+        representative: Path of the representative subroutine, excluding root name.
+        slot_map: Map from the representative's slot symbols to the instance's ones. Only slots
+            which differ between the two are included.
+        same_port_sizes: Whether input ports connected to the root have the same sizes (e.g. `N`) as
+            in the representative. Since routines name their register sizes after these, their local
+            functions can't be the same as in the representative otherwise.
+    """
+
+    path: str
+    representative: str
+    slot_map: dict[str, str]
+    same_port_sizes: bool
+
+    def representative_path(self, path: str) -> str:
+        """Returns path of the representative's descendant corresponding to given descendant of the instance."""
+        return self.representative + path.removeprefix(self.path)
+
+    def preserves(self, function: SymbolicFunction) -> bool:
+        """Checks if instantiating given local function of the representative's descendant wouldn't change it."""
+        if not self.same_port_sizes:
+            return False
+        prefix = f"{self.representative}."
+        return not any(
+            symbol in self.slot_map or symbol.startswith(prefix) for symbol in _symbols_in(function)
+        ) and not any(
+            name.startswith(prefix) for output in function.outputs.values() for name in output.expression_functions
+        )
+
+    def instantiate(self, function: SymbolicFunction[T_expr]) -> SymbolicFunction[T_expr]:
+        """Converts the global function of the representative into the global function of the instance."""
+        prefix = f"{self.representative}."
+        variable_map = {}
+        for symbol in _symbols_in(function):
+            if symbol in self.slot_map:
+                variable_map[symbol] = self.slot_map[symbol]
+            elif symbol.startswith(prefix):
+                variable_map[symbol] = join_paths(self.path, symbol.removeprefix(prefix))
+        function_map = {
+            name: join_paths(self.path, name.removeprefix(prefix))
+            for output in function.outputs.values()
+            for name in output.expression_functions
+            if name.startswith(prefix)
+        }
+        return _rename_variables_simultaneously(rename_functions(function, function_map), variable_map)
+
+
+class InstanceFinder:
+    """Finds subroutines which can be compiled as instances of other ones.
+
+    Structure of the subtrees, as well as parameter links, are captured from the precompiled routine,
+    before the functions are assigned, because assigning functions removes the links. Subroutines are
+    then matched while the functions are assigned, right before their subtrees are processed. At this point,
+    all the constant register sizes propagated into the subtree from the outside are already known.
+
+    Args:
+        routine: The precompiled routine.
+        skipped: Ids of subroutines which shouldn't be considered, e.g. because they are reused from the cache.
+            Subtrees containing such subroutines are not considered either.
+    """
+
+    def __init__(self, routine: Routine, skipped: Iterable[int]):
+        self._keys = _compute_structure_keys(routine, set(skipped))
+        self._inherited_params = _resolve_inherited_params(routine)
+        self._representatives: dict[str, list[tuple[Routine, list[_Slot], list[Any]]]] = defaultdict(list)
+
+    def match(self, routine: T_routine) -> Optional[tuple[Instance, T_routine]]:
+        """Returns a pair (instance, representative) if given routine is an instance of a previously matched one.
+
+        Otherwise, the routine becomes a representative of the routines matched later. Routines have to be
+        matched in walk order, and the subtree of each representative has to be processed before its instances
+        are matched.
+        """
+        key = self._keys.get(id(routine))
+        if key is None:
+            return None
+
+        # Leaves of the subtree have to be identical, including the register sizes propagated into them
+        key = _digest([key, *(_own_fields(leaf) | {"name": None} for leaf in routine.walk() if leaf.is_leaf)])
+        slots = _slots(routine, self._inherited_params[id(routine)])
+        port_sizes = [_root_port_size(port) for port in routine.input_ports.values()]
+        for representative, representative_slots, representative_port_sizes in self._representatives[key]:
+            slot_map = _match_slots(representative_slots, slots)
+            if slot_map is not None:
+                instance = Instance(
+                    routine.absolute_path(exclude_root_name=True),
+                    representative.absolute_path(exclude_root_name=True),
+                    slot_map,
+                    port_sizes == representative_port_sizes,
+                )
+                return instance, cast(T_routine, representative)
+
+        self._representatives[key].append((routine, slots, port_sizes))
+        return None
+
+
+def zip_subtrees(routine: T_routine, counterpart: T_routine) -> Iterable[tuple[T_routine, T_routine]]:
+    """Iterates over pairs of corresponding routines in the subtrees of two structurally identical routines."""
+    stack = [(routine, counterpart)]
+    while stack:
+        routine, counterpart = stack.pop()
+        yield routine, counterpart
+        stack.extend(
+            (cast(T_routine, child), cast(T_routine, counterpart.children[name]))
+            for name, child in routine.children.items()
+        )
+
+
+def _compute_structure_keys(routine: Routine, skipped: set[int]) -> dict[int, str]:
+    """Computes name-independent keys of non-root non-leaf subtrees, which occur in the routine more than once."""
+    keys: dict[int, str] = {}
+    contains_skipped: dict[int, bool] = {}
+    candidates = []
+    for subroutine in routine.walk():
+        keys[id(subroutine)] = _digest(
+            {
+                "routine": _own_fields(subroutine) | {"name": None},
+                "children": {name: keys[id(child)] for name, child in subroutine.children.items()},
+            }
+        )
+        contains_skipped[id(subroutine)] = id(subroutine) in skipped or any(
+            contains_skipped[id(child)] for child in subroutine.children.values()
+        )
+        if not (subroutine.is_leaf or subroutine.is_root or contains_skipped[id(subroutine)]):
+            candidates.append(subroutine)
+
+    counts: dict[str, int] = defaultdict(int)
+    for subroutine in candidates:
+        counts[keys[id(subroutine)]] += 1
+    return {id(subroutine): keys[id(subroutine)] for subroutine in candidates if counts[keys[id(subroutine)]] > 1}
+
+
+def _resolve_inherited_params(routine: Routine) -> dict[int, dict[str, str]]:
+    """Finds global symbols of the ancestors' parameters inherited by each subroutine's parameters."""
+    inherited_params: dict[int, dict[str, str]] = defaultdict(dict)
+    stack = [routine]
+    while stack:
+        subroutine = stack.pop()
+        path = subroutine.absolute_path(exclude_root_name=True)
+        for param, links in subroutine.linked_params.items():
+            symbol = inherited_params[id(subroutine)].get(param, join_paths(path, param) if path else param)
+            for inheritor_path, inheritor_param in links:
+                if inheritor_path in subroutine.children:
+                    inherited_params[id(subroutine.children[inheritor_path])][inheritor_param] = symbol
+        stack.extend(subroutine.children.values())
+    return inherited_params
+
+
+def _slots(routine: Routine, inherited_params: dict[str, str]) -> list[_Slot]:
+    """Lists values of the slots through which given subroutine interacts with the rest of the program."""
+    slots: list[_Slot] = [inherited_params.get(param, ("own",)) for param in routine.input_params]
+
+    for port in routine.input_ports.values():
+        source = get_port_source(port)
+        assert source.parent is not None
+        if source.parent.is_root and is_single_parameter(source.size):
+            slots.append(join_paths(source.absolute_path(exclude_root_name=True), str(source.size)))
+        elif source.parent.is_root:
+            slots.append(("root", source.size))
+        else:
+            slots.append(("leaf",))
+
+    for port in routine.output_ports.values():
+        target = get_port_target(port)
+        assert target.parent is not None
+        if target.parent.is_root:
+            slots.append(target.absolute_path(exclude_root_name=True))
+        elif target.size is None or is_constant_int(target.size):
+            slots.append(("leaf", target.size))
+        else:
+            slots.append(join_paths(target.absolute_path(exclude_root_name=True), str(target.size)))
+    return slots
+
+
+def _root_port_size(port: Port) -> Any:
+    source = get_port_source(port)
+    assert source.parent is not None
+    return source.size if source.parent.is_root else None
+
+
+def _match_slots(representative_slots: list[_Slot], slots: list[_Slot]) -> Optional[dict[str, str]]:
+    """Maps slot symbols of the representative to the ones of the instance, or returns None if they don't match.
+
+    Slots match if their non-symbolic values are equal, and their symbols can be mapped one-to-one.
+    """
+    slot_map: dict[str, str] = {}
+    inverse_slot_map: dict[str, str] = {}
+    for representative_slot, slot in zip(representative_slots, slots):
+        if isinstance(representative_slot, str) and isinstance(slot, str):
+            if slot_map.setdefault(representative_slot, slot) != slot:
+                return None
+            if inverse_slot_map.setdefault(slot, representative_slot) != representative_slot:
+                return None
+        elif representative_slot != slot:
+            return None
+    return {symbol: new_symbol for symbol, new_symbol in slot_map.items() if symbol != new_symbol}
+
+
+def _symbols_in(function: SymbolicFunction) -> set[str]:
+    symbols = set(function.inputs) | set(function.outputs)
+    for output in function.outputs.values():
+        symbols.update(output.expression_variables)
+    return symbols
+
+
+def _rename_variables_simultaneously(
+    function: SymbolicFunction[T_expr], variable_map: dict[str, str]
+) -> SymbolicFunction[T_expr]:
+    """Renames variables as if all the renames happened at once.
+
+    Substitutions are applied one after another, so each symbol has to be renamed before
+    any other symbol is renamed to it. If it is impossible (e.g. for swaps), symbols are
+    renamed to temporary ones first.
+    """
+    ordered_map: dict[str, str] = {}
+    remaining = dict(variable_map)
+    while remaining:
+        ready = {symbol: new_symbol for symbol, new_symbol in remaining.items() if new_symbol not in remaining}
+        if not ready:
+            temporary_map = {symbol: f"__instance_{index}" for index, symbol in enumerate(remaining)}
+            final_map = {temporary_map[symbol]: new_symbol for symbol, new_symbol in remaining.items()}
+            function = _rename_variables_in_order(function, ordered_map | temporary_map)
+            return _rename_variables_in_order(function, final_map)
+        ordered_map.update(ready)
+        for symbol in ready:
+            del remaining[symbol]
+    return _rename_variables_in_order(function, ordered_map)
+
+
+def _rename_variables_in_order(
+    function: SymbolicFunction[T_expr], variable_map: dict[str, str]
+) -> SymbolicFunction[T_expr]:
+    """Renames variables, assuming no symbol is renamed to a symbol which is renamed later."""
+    if not variable_map:
+        return function
+    new_inputs = [
+        variable.rename_symbol(variable_map.get(symbol, symbol)) for symbol, variable in function.inputs.items()
+    ]
+    new_outputs = []
+    substitution_map: dict[str, Any] = {}
+    for symbol, output in function.outputs.items():
+        if not substitution_map:
+            substitution_map = {
+                old_symbol: output.backend.as_expression(new_symbol) for old_symbol, new_symbol in variable_map.items()
+            }
+        new_output = output.substitute_expressions(substitution_map)
+        if symbol in variable_map:
+            new_output = new_output.rename_symbol(variable_map[symbol])
+        new_outputs.append(new_output)
+    return SymbolicFunction(new_inputs, new_outputs)
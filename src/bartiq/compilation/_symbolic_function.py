@@ -14,15 +14,22 @@
 
 from __future__ import annotations
 
+from dataclasses import dataclass
 from typing import Any, Generic, Optional, TypeVar, Union
 
 from pydantic import Field
 
 from .. import Port, Resource, ResourceType, Routine
+from .._routine import _ChildrenDict
 from ..errors import BartiqCompilationError
 from ..symbolics.backend import SymbolicBackend, T_expr
 from ..symbolics.utilities import infer_subresources
-from ..symbolics.variables import DependentVariable, IndependentVariable
+from ..symbolics.variables import (
+    DependentVariable,
+    IndependentVariable,
+    serialize_evaluated_expressions,
+    substitute_expressions_in_all,
+)
 from ._utilities import is_constant_int, is_single_parameter, split_equation
 from .types import FunctionsMap, Number
 
@@ -137,9 +144,10 @@ def compile_functions(functions: list[SymbolicFunction[T_expr]]) -> SymbolicFunc
     referenced by a later function becomes an output of the compiled function. Similarly, inputs which do not share
     a name with the output of a previous function becomes an input of the compiled function.
 
-    Compilation is thus performed iteratively, with each function in the list merged into the function produced from
-    the compilation of all previous functions. Hence, functions must be ordered such that any function that requires
-    an input from the output of a previous function must come after it in the ``functions`` list.
+    Compilation is performed in a single pass over the functions, during which every intermediate variable is
+    substituted, as a native expression, into the outputs of the function consuming it. Since intermediate
+    variables are resolved in the order of the functions, functions must be ordered such that any function that
+    requires an input from the output of a previous function must come after it in the ``functions`` list.
 
     Args:
         functions: The symbolic functions to be merged into a single function.
@@ -148,10 +156,51 @@ def compile_functions(functions: list[SymbolicFunction[T_expr]]) -> SymbolicFunc
     Returns:
         :func:`SymbolicFunction`: A single function.
     """
-    compiled_function = SymbolicFunction[T_expr]([], {})
-    for function in functions:
-        compiled_function = _merge_functions(compiled_function, function)
-    return compiled_function
+    inputs: dict[str, IndependentVariable] = {}
+    # Outputs which haven't been consumed yet, expressed in terms of the compiled function's inputs,
+    # together with the index of the function which defined them.
+    outputs: dict[str, DependentVariable[T_expr]] = {}
+    output_origins: dict[str, int] = {}
+
+    for index, function in enumerate(functions):
+        # Check that no outputs of the function are already inputs of the compiled function
+        for output_symbol in function.outputs.keys():
+            if output_symbol in inputs:
+                raise BartiqCompilationError(
+                    "Target function outputs must not reference base function inputs when merging; "
+                    f"found reuse of symbol {output_symbol} in {inputs}."
+                )
+
+        # Inputs that are outputs of previous functions define substitutions. Otherwise add them as new inputs.
+        substitution_map = {}
+        for input_symbol, input_variable in function.inputs.items():
+            if input_symbol in outputs:
+                substitution_map[input_symbol] = outputs.pop(input_symbol).expression
+                del output_origins[input_symbol]
+            else:
+                inputs[input_symbol] = input_variable
+
+        new_output_variables = substitute_expressions_in_all(function.outputs.values(), substitution_map)
+        for output_symbol, new_output_variable in zip(function.outputs, new_output_variables):
+
+            # Check new output doesn't clash with those already added
+            if output_symbol in outputs:
+                old_output_variable = outputs.pop(output_symbol)
+                if old_output_variable != new_output_variable:
+                    raise BartiqCompilationError(
+                        "Merging functions may only have same outputs if the outputs share the same expression; "
+                        f"found conflict {old_output_variable} and {new_output_variable}."
+                        "Perhaps size of a port should be derived (i.e. set to None), "
+                        "but it's already set to some value."
+                    )
+                new_output_variable = old_output_variable
+
+            outputs[output_symbol] = new_output_variable
+            output_origins[output_symbol] = index
+
+    # Outputs of later functions come first, as if the functions were merged one by one
+    sorted_outputs = sorted(outputs.items(), key=lambda item: -output_origins[item[0]])
+    return SymbolicFunction(inputs, dict(sorted_outputs))
 
 
 def _parse_input_expressions(inputs: list[str]) -> list[IndependentVariable]:
@@ -170,44 +219,7 @@ def _merge_functions(
     function_1: SymbolicFunction[T_expr], function_2: SymbolicFunction[T_expr]
 ) -> SymbolicFunction[T_expr]:
     """Merges a target function (2) into a base function (1)."""
-    # Check that no outputs in function 2 are already inputs of function 1
-    for output_2 in function_2.outputs.keys():
-        if output_2 in function_1.inputs:
-            raise BartiqCompilationError(
-                "Target function outputs must not reference base function inputs when merging; "
-                f"found reuse of symbol {output_2} in {function_1.inputs}."
-            )
-
-    inputs_new = function_1.inputs.copy()
-    outputs_new = function_2.outputs.copy()
-    outputs_1 = function_1.outputs.copy()
-    inputs_2 = function_2.inputs
-
-    # Inputs for function 2 that are outputs from function 1 define substitutions. Otherwise add them as new inputs.
-    for input_2_symbol, input_2_variable in inputs_2.items():
-        if input_2_symbol in outputs_1:
-            output_1_expression = str(outputs_1.pop(input_2_symbol).expression)
-            outputs_new = {
-                output_symbol: output_variable.substitute(input_2_symbol, output_1_expression)
-                for output_symbol, output_variable in outputs_new.items()
-            }
-        else:
-            inputs_new[input_2_symbol] = input_2_variable
-
-    # Check remaining outputs don't clash with those already added, and if not add them as well
-    for output_1_symbol, output_1_variable in outputs_1.items():
-        if output_1_symbol in outputs_new:
-            outputs_new_variable = outputs_new[output_1_symbol]
-            if output_1_variable != outputs_new_variable:
-                raise BartiqCompilationError(
-                    "Merging functions may only have same outputs if the outputs share the same expression; "
-                    f"found conflict {output_1_variable} and {outputs_new_variable}."
-                    "Perhaps size of a port should be derived (i.e. set to None), but it's already set to some value."
-                )
-
-        outputs_new[output_1_symbol] = output_1_variable
-
-    return SymbolicFunction(inputs_new, outputs_new)
+    return compile_functions([function_1, function_2])
 
 
 def _verify_symbolic_function(function: SymbolicFunction) -> None:
@@ -470,12 +482,17 @@ def define_expression_functions(
     return SymbolicFunction(function.inputs, new_outputs)
 
 
+# Routine's validators are built on first use, but they have to be complete before the model is extended,
+# because types referenced by Routine aren't visible in this module
+Routine.model_rebuild()
+
+
 class RoutineWithFunction(Routine, Generic[T_expr]):
     """Extension of the Routine class, which includes information about SymbolicFunciton for each subroutine."""
 
     symbolic_function: Optional[SymbolicFunction[T_expr]] = None
     parent: Optional[RoutineWithFunction[T_expr]] = Field(exclude=True, default=None)
-    children: dict[str, RoutineWithFunction] = Field(default_factory=dict)  # type: ignore
+    children: dict[str, RoutineWithFunction] = Field(default_factory=_ChildrenDict)  # type: ignore
 
     def __init__(self, **data: Any):
         super().__init__(**data)
@@ -483,13 +500,13 @@ class RoutineWithFunction(Routine, Generic[T_expr]):
     @classmethod
     def from_routine(cls, routine: Routine) -> RoutineWithFunction:
         """Transforms Routine object into RoutineWithFunction."""
-        return cls(**routine.model_dump())
+        return cls.from_trusted_dict(routine.model_dump())
 
     def to_routine(self) -> Routine:
         """Generates Routine object, which doesn't include the information about symbolic functions."""
         serialized_dict = self.model_dump()
         sanitized_dict = _delete_key(serialized_dict, "symbolic_function")
-        return Routine(**sanitized_dict)
+        return Routine.from_trusted_dict(sanitized_dict)
 
 
 def _delete_key(dictionary, key_to_delete):
@@ -672,31 +689,68 @@ def _substitute_local_parameters(output_variable, local_params):
 
 def update_routine_with_symbolic_function(routine: Routine, function: SymbolicFunction) -> None:
     """This function modifies a Routine in place and updates its fields with information from a given function."""
-    input_params, input_register_sizes_from_inputs = _parse_function_inputs(function)
-    costs, registers_sizes_from_outputs = _parse_function_outputs(function, input_register_sizes_from_inputs)
-    routine.input_params = sorted(input_params)
-    linked_params_to_remove = set(routine.linked_params.keys()) - set(input_params)
-    for param in linked_params_to_remove:
-        del routine.linked_params[param]
-
-    for port_name, port_size in input_register_sizes_from_inputs.items():
-        routine.input_ports[port_name].size = str(port_size)
-    for port_name, port_size in registers_sizes_from_outputs.items():
-        target_port = routine.ports[port_name]
-        if target_port.direction == "input":
-            if not is_constant_int(port_size):
-                raise BartiqCompilationError(
-                    "Only constant-sized input register sizes supported in function outputs; " f"found {port_size}."
-                )
-        target_port.size = str(port_size)
-    for cost in costs:
-        lhs, rhs = split_equation(cost)
-        if lhs in routine.resources:
-            routine.resources[lhs].value = rhs
-        else:
-            raw_name = lhs.split(".")[-1]
-            type = ResourceType.other
-            routine.resources[lhs] = Resource(name=raw_name, value=rhs, parent=routine, type=type)
+    RoutineUpdate.from_function(function).apply_to(routine)
+
+
+@dataclass(frozen=True)
+class RoutineUpdate:
+    """Changes to the fields of a routine, as described by a (local) symbolic function.
+
+    Computing the update doesn't require access to the routine, which allows for
+    computing it in one process and applying it in another.
+
+    Attributes:
+        input_params: Input parameters of the routine.
+        input_register_sizes: Sizes of the input registers, inferred from function inputs.
+        register_sizes: Sizes of the registers, inferred from function outputs.
+        costs: Cost equations, in the form "name = value".
+    """
+
+    input_params: list[str]
+    input_register_sizes: dict[str, Any]
+    register_sizes: dict[str, Any]
+    costs: list[str]
+
+    @classmethod
+    def from_function(cls, function: SymbolicFunction) -> RoutineUpdate:
+        """Parses symbolic function into routine update."""
+        input_params, input_register_sizes = _parse_function_inputs(function)
+        costs, register_sizes = _parse_function_outputs(function, input_register_sizes)
+        return cls(sorted(input_params), input_register_sizes, register_sizes, costs)
+
+    def port_size(self, port_name: str, default: Any) -> Any:
+        """Size of given port after applying the update, or default if the update doesn't change it."""
+        if port_name in self.register_sizes:
+            return str(self.register_sizes[port_name])
+        if port_name in self.input_register_sizes:
+            return str(self.input_register_sizes[port_name])
+        return default
+
+    def apply_to(self, routine: Routine) -> None:
+        """Modifies a Routine in place, updating its fields."""
+        routine.input_params = list(self.input_params)
+        linked_params_to_remove = set(routine.linked_params.keys()) - set(self.input_params)
+        for param in linked_params_to_remove:
+            del routine.linked_params[param]
+
+        for port_name, port_size in self.input_register_sizes.items():
+            routine.input_ports[port_name].size = str(port_size)
+        for port_name, port_size in self.register_sizes.items():
+            target_port = routine.ports[port_name]
+            if target_port.direction == "input":
+                if not is_constant_int(port_size):
+                    raise BartiqCompilationError(
+                        "Only constant-sized input register sizes supported in function outputs; " f"found {port_size}."
+                    )
+            target_port.size = str(port_size)
+        for cost in self.costs:
+            lhs, rhs = split_equation(cost)
+            if lhs in routine.resources:
+                routine.resources[lhs].value = rhs
+            else:
+                raw_name = lhs.split(".")[-1]
+                type = ResourceType.other
+                routine.resources[lhs] = Resource(name=raw_name, value=rhs, parent=routine, type=type)
 
 
 def _parse_function_inputs(function):
@@ -727,27 +781,40 @@ def _parse_function_outputs(function, input_register_sizes_from_inputs):
     costs = []
     register_sizes = {}
 
-    input_register_reparams = {
-        f"#{register}.{size}": size for register, size in input_register_sizes_from_inputs.items()
-    }
+    outputs = dict(function.outputs)
+    if outputs and input_register_sizes_from_inputs:
+        backend = next(iter(outputs.values())).backend
+        input_register_reparams = {
+            f"#{register}.{size}": backend.as_expression(str(size))
+            for register, size in input_register_sizes_from_inputs.items()
+        }
+        outputs = dict(zip(outputs, substitute_expressions_in_all(outputs.values(), input_register_reparams)))
+
+    # Expressions which can't be evaluated to numbers are serialized all at once
+    unevaluated_symbols = [
+        output_symbol
+        for output_symbol, output_variable in outputs.items()
+        if type(output_variable) is DependentVariable
+        and (output_symbol.startswith("#") or output_variable.value is None)
+    ]
+    evaluated_expressions = dict(
+        zip(unevaluated_symbols, serialize_evaluated_expressions(outputs[symbol] for symbol in unevaluated_symbols))
+    )
 
-    for output_symbol, output_variable in function.outputs.items():
-        output_variable = output_variable.substitute_series(input_register_reparams)
+    for output_symbol, output_variable in outputs.items():
         if output_symbol.startswith("#"):
             output_register = output_symbol.removeprefix("#")
             if type(output_variable) is IndependentVariable:
                 register_sizes[output_register] = output_variable.value
             elif type(output_variable) is DependentVariable:
-                register_sizes[output_register] = output_variable.evaluated_expression
+                register_sizes[output_register] = evaluated_expressions[output_symbol]
             else:
                 raise TypeError(
                     "Invalid type. Expected either IndependentVariable or DependentVariable, "
                     f"got {type(output_variable)}"
                 )
         else:
-            cost_value = (
-                output_variable.evaluated_expression if output_variable.value is None else output_variable.value
-            )
+            cost_value = evaluated_expressions.get(output_symbol, output_variable.value)
 
             costs.append(f"{output_symbol} = {cost_value}")
 
@@ -16,6 +16,7 @@ import ast
 from typing import Any, TypeVar
 
 from .. import Routine
+from .._routine import _sort_children_topologically
 from ..errors import BartiqCompilationError
 from .types import NUMBER_TYPES, Number
 
@@ -87,7 +88,7 @@ def is_constant_int(expression: Any) -> bool:
 
 def get_children_in_walk_order(routine: T) -> list[T]:
     """Returns routine children in walk order."""
-    return [op for op in routine.walk() if op in routine.children.values()]
+    return list(_sort_children_topologically(routine))
 
 
 def parse_value(value_str: str) -> Number:
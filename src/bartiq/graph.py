@@ -0,0 +1,542 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compact, read-only representation of routines, suitable for programs with millions of subroutines.
+
+`RoutineGraph` stores the whole hierarchy in a handful of flat integer arrays instead of
+a tree of pydantic models. Routines, ports, resources and connections are identified by their
+integer indices, and all strings and values are interned in shared tables.
+
+Routines are numbered in breadth-first order, with the root having index 0. Thanks to that,
+children of each routine occupy a contiguous range of indices, and the same holds for ports,
+resources, connections and parameters of each routine (in a so-called CSR layout, in which
+items of routine i are the ones between offsets[i] and offsets[i + 1]).
+"""
+
+from __future__ import annotations
+
+import sys
+from array import array
+from collections import Counter, defaultdict
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from ._routine import PortDirection, ResourceType, Routine, _deserialize_value
+from ._traversal import post_order, pre_order
+
+Value = Union[int, float, str, None]
+
+_INDEX = "q"
+_CODE = "b"
+_NONE = -1
+
+_DIRECTIONS = list(PortDirection)
+_RESOURCE_TYPES = list(ResourceType)
+
+
+class _Interner:
+    """Table assigning consecutive indices to distinct values."""
+
+    def __init__(self) -> None:
+        self.values: list[Any] = []
+        self._indices: dict[tuple[type, Any], int] = {}
+
+    def __call__(self, value: Any) -> int:
+        # Type is a part of the key, as otherwise e.g. 1 and 1.0 would be considered the same
+        key = (type(value), value)
+        if (index := self._indices.get(key)) is None:
+            index = self._indices[key] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+def _offsets(counts: Iterable[int], start: int = 0) -> array:
+    offsets = array(_INDEX, [start])
+    total = start
+    for count in counts:
+        total += count
+        offsets.append(total)
+    return offsets
+
+
+class RoutineGraph:
+    """Compact, read-only representation of a routine and all its descendants.
+
+    Graphs are created from routines with `RoutineGraph.from_routine`, and can be converted back
+    with `RoutineGraph.to_routine`. Programs too large to be loaded as routines can be converted
+    directly from dictionaries describing them (e.g. loaded from JSON) with `RoutineGraph.from_dict`,
+    or from QREF with `bartiq.integrations.qref_to_routine_graph`. Graphs don't support modifications.
+
+    Routines, ports, resources and connections are referred to by their indices. Connections are
+    pairs of indices of their source and target ports.
+    """
+
+    def __init__(
+        self,
+        strings: list[str],
+        values: list[Value],
+        names: array,
+        types: array,
+        parents: array,
+        child_offsets: array,
+        port_offsets: array,
+        port_names: array,
+        port_directions: array,
+        port_sizes: array,
+        resource_offsets: array,
+        resource_names: array,
+        resource_types: array,
+        resource_values: array,
+        connection_offsets: array,
+        connection_sources: array,
+        connection_targets: array,
+        input_param_offsets: array,
+        input_params: array,
+        local_variable_offsets: array,
+        local_variable_names: array,
+        local_variable_values: array,
+        linked_param_offsets: array,
+        linked_param_sources: array,
+        linked_param_paths: array,
+        linked_param_targets: array,
+        meta: dict[int, dict[str, Any]],
+    ):
+        self._strings = strings
+        self._values = values
+        self._names = names
+        self._types = types
+        self._parents = parents
+        self._child_offsets = child_offsets
+        self._port_offsets = port_offsets
+        self._port_names = port_names
+        self._port_directions = port_directions
+        self._port_sizes = port_sizes
+        self._resource_offsets = resource_offsets
+        self._resource_names = resource_names
+        self._resource_types = resource_types
+        self._resource_values = resource_values
+        self._connection_offsets = connection_offsets
+        self._connection_sources = connection_sources
+        self._connection_targets = connection_targets
+        self._input_param_offsets = input_param_offsets
+        self._input_params = input_params
+        self._local_variable_offsets = local_variable_offsets
+        self._local_variable_names = local_variable_names
+        self._local_variable_values = local_variable_values
+        self._linked_param_offsets = linked_param_offsets
+        self._linked_param_sources = linked_param_sources
+        self._linked_param_paths = linked_param_paths
+        self._linked_param_targets = linked_param_targets
+        self._meta = meta
+        self._port_parents = array(_INDEX, bytes(array(_INDEX).itemsize * self.port_count))
+        for routine in range(len(self)):
+            for port in self.ports(routine):
+                self._port_parents[port] = routine
+        self._next_ports, self._previous_ports = self._index_routes()
+
+    @classmethod
+    def from_routine(cls, root: Routine) -> RoutineGraph:
+        """Create a graph representing given routine and all its descendants.
+
+        Note:
+            Children are identified by their names, which should match the keys in their parents'
+            children dictionaries (as they do in all correctly constructed routines).
+        """
+        strings, values = _Interner(), _Interner()
+
+        routines = [root]
+        # Breadth-first order makes children of each routine consecutive
+        for routine in routines:
+            routines.extend(routine.children.values())
+        routine_indices = {id(routine): index for index, routine in enumerate(routines)}
+
+        ports = [port for routine in routines for port in routine.ports.values()]
+        port_indices = {id(port): index for index, port in enumerate(ports)}
+        resources = [resource for routine in routines for resource in routine.resources.values()]
+        connections = [connection for routine in routines for connection in routine.connections]
+        local_variables = [item for routine in routines for item in routine.local_variables.items()]
+        linked_params = [
+            (source, path, target)
+            for routine in routines
+            for source, targets in routine.linked_params.items()
+            for path, target in targets
+        ]
+
+        return cls(
+            strings=strings.values,
+            values=values.values,
+            names=array(_INDEX, [strings(routine.name) for routine in routines]),
+            types=array(_INDEX, [_NONE if routine.type is None else strings(routine.type) for routine in routines]),
+            parents=array(_INDEX, [routine_indices[id(r.parent)] if r is not root else _NONE for r in routines]),
+            child_offsets=_offsets((len(routine.children) for routine in routines), start=1),
+            port_offsets=_offsets(len(routine.ports) for routine in routines),
+            port_names=array(_INDEX, [strings(port.name) for port in ports]),
+            port_directions=array(_CODE, [_DIRECTIONS.index(PortDirection(port.direction)) for port in ports]),
+            port_sizes=array(_INDEX, [values(port.size) for port in ports]),
+            resource_offsets=_offsets(len(routine.resources) for routine in routines),
+            resource_names=array(_INDEX, [strings(resource.name) for resource in resources]),
+            resource_types=array(_CODE, [_RESOURCE_TYPES.index(ResourceType(r.type)) for r in resources]),
+            resource_values=array(_INDEX, [values(resource.value) for resource in resources]),
+            connection_offsets=_offsets(len(routine.connections) for routine in routines),
+            connection_sources=array(_INDEX, [port_indices[id(connection.source)] for connection in connections]),
+            connection_targets=array(_INDEX, [port_indices[id(connection.target)] for connection in connections]),
+            input_param_offsets=_offsets(len(routine.input_params) for routine in routines),
+            input_params=array(_INDEX, [strings(param) for routine in routines for param in routine.input_params]),
+            local_variable_offsets=_offsets(len(routine.local_variables) for routine in routines),
+            local_variable_names=array(_INDEX, [strings(name) for name, _ in local_variables]),
+            local_variable_values=array(_INDEX, [strings(value) for _, value in local_variables]),
+            linked_param_offsets=_offsets(
+                sum(len(targets) for targets in routine.linked_params.values()) for routine in routines
+            ),
+            linked_param_sources=array(_INDEX, [strings(source) for source, _, _ in linked_params]),
+            linked_param_paths=array(_INDEX, [strings(path) for _, path, _ in linked_params]),
+            linked_param_targets=array(_INDEX, [strings(target) for _, _, target in linked_params]),
+            meta={index: routine.meta for index, routine in enumerate(routines) if routine.meta},
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> RoutineGraph:
+        """Create a graph from a dictionary describing a routine and all its descendants, without creating routines.
+
+        Hence, the memory used for creating the graph is proportional to the size of the data rather than
+        to the size of the corresponding `Routine` objects. The data isn't validated.
+
+        Args:
+            data: Dictionary in the same format as for `Routine.from_trusted_dict`, e.g. the one returned by
+                `Routine.model_dump` or read with `json.load` from a file written by `bartiq.serialization.dump_json`.
+        """
+        strings, values = _Interner(), _Interner()
+
+        routines = [data]
+        # Breadth-first order makes children of each routine consecutive
+        for routine in routines:
+            routines.extend(routine.get("children", {}).values())
+        child_offsets = _offsets((len(routine.get("children", {})) for routine in routines), start=1)
+        port_offsets = _offsets(len(routine.get("ports", {})) for routine in routines)
+
+        # Positions of children and ports of routines among their siblings, computed only for routines with connections
+        positions: dict[tuple[int, str], dict[str, int]] = {}
+
+        def _position(routine: int, field: str, name: str) -> int:
+            if (field_positions := positions.get((routine, field))) is None:
+                field_positions = positions[routine, field] = {key: i for i, key in enumerate(routines[routine][field])}
+            return field_positions[name]
+
+        def _port_index(selector: str, routine: int) -> int:
+            child_name, _, port_name = selector.rpartition(".")
+            if child_name:
+                routine = child_offsets[routine] + _position(routine, "children", child_name)
+            return port_offsets[routine] + _position(routine, "ports", port_name)
+
+        parents = array(_INDEX, [_NONE])
+        for index in range(len(routines)):
+            parents.extend([index] * (child_offsets[index + 1] - child_offsets[index]))
+        ports = [port for routine in routines for port in routine.get("ports", {}).values()]
+        resources = [resource for routine in routines for resource in routine.get("resources", {}).values()]
+        connections = [
+            (_port_index(connection["source"], index), _port_index(connection["target"], index))
+            for index, routine in enumerate(routines)
+            for connection in routine.get("connections", [])
+        ]
+        local_variables = [item for routine in routines for item in routine.get("local_variables", {}).items()]
+        linked_params = [
+            (source, path, target)
+            for routine in routines
+            for source, targets in routine.get("linked_params", {}).items()
+            for path, target in targets
+        ]
+
+        return cls(
+            strings=strings.values,
+            values=values.values,
+            names=array(_INDEX, [strings(routine["name"]) for routine in routines]),
+            types=array(
+                _INDEX, [_NONE if routine.get("type") is None else strings(routine["type"]) for routine in routines]
+            ),
+            parents=parents,
+            child_offsets=child_offsets,
+            port_offsets=port_offsets,
+            port_names=array(_INDEX, [strings(port["name"]) for port in ports]),
+            port_directions=array(_CODE, [_DIRECTIONS.index(PortDirection(port["direction"])) for port in ports]),
+            port_sizes=array(_INDEX, [values(_deserialize_value(port["size"])) for port in ports]),
+            resource_offsets=_offsets(len(routine.get("resources", {})) for routine in routines),
+            resource_names=array(_INDEX, [strings(resource["name"]) for resource in resources]),
+            resource_types=array(_CODE, [_RESOURCE_TYPES.index(ResourceType(r["type"])) for r in resources]),
+            resource_values=array(_INDEX, [values(_deserialize_value(resource["value"])) for resource in resources]),
+            connection_offsets=_offsets(len(routine.get("connections", [])) for routine in routines),
+            connection_sources=array(_INDEX, [source for source, _ in connections]),
+            connection_targets=array(_INDEX, [target for _, target in connections]),
+            input_param_offsets=_offsets(len(routine.get("input_params", [])) for routine in routines),
+            input_params=array(
+                _INDEX, [strings(param) for routine in routines for param in routine.get("input_params", [])]
+            ),
+            local_variable_offsets=_offsets(len(routine.get("local_variables", {})) for routine in routines),
+            local_variable_names=array(_INDEX, [strings(name) for name, _ in local_variables]),
+            local_variable_values=array(_INDEX, [strings(value) for _, value in local_variables]),
+            linked_param_offsets=_offsets(
+                sum(len(targets) for targets in routine.get("linked_params", {}).values()) for routine in routines
+            ),
+            linked_param_sources=array(_INDEX, [strings(source) for source, _, _ in linked_params]),
+            linked_param_paths=array(_INDEX, [strings(path) for _, path, _ in linked_params]),
+            linked_param_targets=array(_INDEX, [strings(target) for _, _, target in linked_params]),
+            meta={index: dict(routine["meta"]) for index, routine in enumerate(routines) if routine.get("meta")},
+        )
+
+    def to_routine(self, routine: int = 0) -> Routine:
+        """Convert routine with given index, together with all its descendants, to a `Routine` object."""
+        converted: dict[int, Routine] = {}
+        for index in post_order(routine, self.children):
+            converted[index] = Routine(
+                name=self.name(index),
+                type=self.type(index),
+                ports={
+                    self.port_name(port): {
+                        "name": self.port_name(port),
+                        "direction": self.port_direction(port),
+                        "size": self.port_size(port),
+                    }
+                    for port in self.ports(index)
+                },
+                children={self.name(child): converted.pop(child) for child in self.children(index)},
+                connections=[
+                    {"source": self._port_selector(source, index), "target": self._port_selector(target, index)}
+                    for source, target in self.connections(index)
+                ],
+                resources={
+                    name: {"name": name, "type": resource_type, "value": value}
+                    for name, (resource_type, value) in self.resources(index).items()
+                },
+                input_params=self.input_params(index),
+                local_variables=self.local_variables(index),
+                linked_params=self.linked_params(index),
+                meta=self.meta(index),
+            )
+        return converted[routine]
+
+    def __len__(self) -> int:
+        """Number of routines in the graph."""
+        return len(self._names)
+
+    @property
+    def port_count(self) -> int:
+        """Number of ports of all routines in the graph."""
+        return len(self._port_names)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the graph, in bytes, including its string and value tables."""
+        arrays = [value for value in vars(self).values() if isinstance(value, array)]
+        return (
+            sum(sys.getsizeof(a) for a in arrays)
+            + sum(sys.getsizeof(table) + sum(map(sys.getsizeof, table)) for table in (self._strings, self._values))
+            + sys.getsizeof(self._meta)
+        )
+
+    def name(self, routine: int) -> str:
+        """Name of given routine."""
+        return self._strings[self._names[routine]]
+
+    def type(self, routine: int) -> Optional[str]:
+        """Type of given routine."""
+        return None if (type_ := self._types[routine]) == _NONE else self._strings[type_]
+
+    def parent(self, routine: int) -> Optional[int]:
+        """Index of the parent of given routine, or None if it is the root."""
+        return None if (parent := self._parents[routine]) == _NONE else parent
+
+    def children(self, routine: int) -> range:
+        """Indices of children of given routine."""
+        return range(self._child_offsets[routine], self._child_offsets[routine + 1])
+
+    def is_leaf(self, routine: int) -> bool:
+        """Return True if given routine has no children."""
+        return self._child_offsets[routine] == self._child_offsets[routine + 1]
+
+    def ports(self, routine: int) -> range:
+        """Indices of ports of given routine."""
+        return range(self._port_offsets[routine], self._port_offsets[routine + 1])
+
+    def port(self, routine: int, name: str) -> int:
+        """Index of the port of given routine with given name.
+
+        Raises:
+            KeyError: If the routine doesn't have such a port.
+        """
+        for port in self.ports(routine):
+            if self.port_name(port) == name:
+                return port
+        raise KeyError(f"Routine {self.path(routine)} has no port {name}.")
+
+    def port_name(self, port: int) -> str:
+        """Name of given port."""
+        return self._strings[self._port_names[port]]
+
+    def port_direction(self, port: int) -> str:
+        """Direction of given port."""
+        return _DIRECTIONS[self._port_directions[port]].value
+
+    def port_size(self, port: int) -> Value:
+        """Size of given port."""
+        return self._values[self._port_sizes[port]]
+
+    def port_parent(self, port: int) -> int:
+        """Index of the routine given port belongs to."""
+        return self._port_parents[port]
+
+    def resources(self, routine: int) -> dict[str, tuple[str, Value]]:
+        """Resources of given routine, as pairs (type, value) keyed by the resources' names."""
+        return {
+            self._strings[self._resource_names[resource]]: (
+                _RESOURCE_TYPES[self._resource_types[resource]].value,
+                self._values[self._resource_values[resource]],
+            )
+            for resource in range(self._resource_offsets[routine], self._resource_offsets[routine + 1])
+        }
+
+    def connections(self, routine: int) -> list[tuple[int, int]]:
+        """Connections of given routine, as pairs of indices of source and target ports."""
+        return [
+            (self._connection_sources[connection], self._connection_targets[connection])
+            for connection in range(self._connection_offsets[routine], self._connection_offsets[routine + 1])
+        ]
+
+    def input_params(self, routine: int) -> list[str]:
+        """Input parameters of given routine."""
+        return [
+            self._strings[self._input_params[param]]
+            for param in range(self._input_param_offsets[routine], self._input_param_offsets[routine + 1])
+        ]
+
+    def local_variables(self, routine: int) -> dict[str, str]:
+        """Local variables of given routine."""
+        return {
+            self._strings[self._local_variable_names[variable]]: self._strings[self._local_variable_values[variable]]
+            for variable in range(self._local_variable_offsets[routine], self._local_variable_offsets[routine + 1])
+        }
+
+    def linked_params(self, routine: int) -> dict[str, list[tuple[str, str]]]:
+        """Linked parameters of given routine, in the same format as in `Routine.linked_params`."""
+        linked_params: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        for link in range(self._linked_param_offsets[routine], self._linked_param_offsets[routine + 1]):
+            linked_params[self._strings[self._linked_param_sources[link]]].append(
+                (self._strings[self._linked_param_paths[link]], self._strings[self._linked_param_targets[link]])
+            )
+        return dict(linked_params)
+
+    def meta(self, routine: int) -> dict[str, Any]:
+        """Additional free-form information associated with given routine."""
+        return self._meta.get(routine, {})
+
+    def path(self, routine: int, exclude_root_name: bool = False) -> str:
+        """Path of given routine from the root, like the one returned by `Routine.absolute_path`."""
+        names = []
+        while (parent := self.parent(routine)) is not None:
+            names.append(self.name(routine))
+            routine = parent
+        if not exclude_root_name:
+            names.append(self.name(routine))
+        return ".".join(reversed(names))
+
+    def port_path(self, port: int, exclude_root_name: bool = False) -> str:
+        """Path of given port from the root, like the one returned by `Port.absolute_path`."""
+        routine_path = self.path(self.port_parent(port), exclude_root_name=exclude_root_name)
+        return f"{routine_path}.#{self.port_name(port)}" if routine_path else f"#{self.port_name(port)}"
+
+    def find(self, selector: str, routine: int = 0) -> int:
+        """Index of a descendant of given routine, selected like in `Routine.find_descendant`.
+
+        Raises:
+            ValueError: If there is no such descendant.
+        """
+        if selector == "":
+            return routine
+        for name in selector.split("."):
+            for child in self.children(routine):
+                if self.name(child) == name:
+                    routine = child
+                    break
+            else:
+                raise ValueError(f"Child {selector} not found.")
+        return routine
+
+    def walk(self, routine: int = 0) -> Iterator[int]:
+        """Iterate over given routine and its descendants in the same order as `Routine.walk`."""
+        return post_order(routine, self.sorted_children)
+
+    def walk_top_down(self, routine: int = 0) -> Iterator[int]:
+        """Iterate over given routine and its descendants, visiting each routine before its children."""
+        return pre_order(routine, self.children)
+
+    def sorted_children(self, routine: int) -> list[int]:
+        """Indices of children of given routine, sorted topologically, like in `Routine.walk`.
+
+        Raises:
+            ValueError: If connections between the children form a cycle.
+        """
+        graph_edges = dict.fromkeys(
+            (self._port_parents[source], self._port_parents[target])
+            for source, target in self.connections(routine)
+            if self._port_parents[source] != routine and self._port_parents[target] != routine
+        )
+        in_degrees = Counter(target for _, target in graph_edges)
+        adjacencies: dict[int, list[int]] = defaultdict(list)
+        for source, target in graph_edges:
+            adjacencies[source].append(target)
+
+        dangling_nodes = [child for child in self.children(routine) if in_degrees[child] == 0]
+        order = []
+        while dangling_nodes:
+            current_node = dangling_nodes.pop()
+            for target in adjacencies[current_node]:
+                in_degrees[target] -= 1
+                if in_degrees[target] == 0:
+                    dangling_nodes.append(target)
+            order.append(current_node)
+
+        if any(degree > 0 for degree in in_degrees.values()):
+            raise ValueError(f"A cycle occurred while sorting children of routine {self.name(routine)}.")
+        return order
+
+    def route(self, port: int, forward: bool = True) -> list[int]:
+        """Indices of all ports encountered when following given port, like `bartiq.routing.get_route`."""
+        next_ports = self._next_ports if forward else self._previous_ports
+        route = [port]
+        while (port := next_ports[port]) != _NONE:
+            route.append(port)
+        return route
+
+    def port_source(self, port: int) -> int:
+        """Index of the port's source port, like `bartiq.routing.get_port_source`."""
+        return self.route(port, forward=False)[-1]
+
+    def port_target(self, port: int) -> int:
+        """Index of the port's target port, like `bartiq.routing.get_port_target`."""
+        return self.route(port, forward=True)[-1]
+
+    def _port_selector(self, port: int, routine: int) -> str:
+        port_parent = self._port_parents[port]
+        return self.port_name(port) if port_parent == routine else f"{self.name(port_parent)}.{self.port_name(port)}"
+
+    def _index_routes(self) -> tuple[array, array]:
+        # Like in routing, connections of the port's parent take precedence over connections of
+        # its grandparent, and if there are multiple matching connections in a routine, the first one is used.
+        next_ports = array(_INDEX, [_NONE]) * self.port_count
+        previous_ports = array(_INDEX, [_NONE]) * self.port_count
+        for owned_by_parent in (False, True):
+            for routine in range(len(self)):
+                for source, target in reversed(self.connections(routine)):
+                    if (self._port_parents[source] == routine) == owned_by_parent:
+                        next_ports[source] = target
+                    if (self._port_parents[target] == routine) == owned_by_parent:
+                        previous_ports[target] = source
+        return next_ports, previous_ports
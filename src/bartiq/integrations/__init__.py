@@ -12,14 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-try:
+from typing import TYPE_CHECKING
+
+from .._lazy import is_installed, lazy_attributes
+
+if TYPE_CHECKING:
     from .jupyter.routine_explorer import explore_routine
+    from .latex import routine_to_latex
+    from .qref import bartiq_to_qref, qref_to_bartiq, qref_to_routine_graph
+
+_LAZY_ATTRIBUTES = {
+    "bartiq_to_qref": ".qref",
+    "qref_to_bartiq": ".qref",
+    "qref_to_routine_graph": ".qref",
+    "routine_to_latex": ".latex",
+}
 
-    additional_all = ["explore_routine"]
-except ImportError:
-    additional_all = []
+if is_installed("ipywidgets") and is_installed("ipytree"):
+    _LAZY_ATTRIBUTES["explore_routine"] = ".jupyter.routine_explorer"
 
-from .latex import routine_to_latex
-from .qref import bartiq_to_qref, qref_to_bartiq
+__all__ = list(_LAZY_ATTRIBUTES)
 
-__all__ = ["bartiq_to_qref", "qref_to_bartiq", "rotine_to_latex"] + additional_all
+# Integrations depend on sympy and QREF, which take a long time to import, hence they are imported only when used
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
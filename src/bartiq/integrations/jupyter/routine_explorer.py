@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from typing import Union
+
 import ipywidgets as widgets
 from ipytree import Node, Tree
 from traitlets import Unicode
 
 from bartiq import Routine
 
+from ...store import StoredRoutine
 from ..latex import routine_to_latex
 
 DEFAULT_ROOT_NAME = ""
@@ -29,15 +32,18 @@ class _RoutineTree(Tree):
     selected_routine_resources = Unicode(default_value="Please select a routine")
     # NOTE: the choice of 1000 here is arbitrary,
 
-    def __init__(self, routine: Routine, debug_mode: bool = False):
+    def __init__(self, routine: Union[Routine, StoredRoutine], debug_mode: bool = False):
         super().__init__(multiple_selection=False)
         self._debug_mode = debug_mode
         self._node_routine_lookup: dict = {}
+        # Stored routines are read only when needed, hence their nodes are added only when their parents are selected
+        self._lazy = isinstance(routine, StoredRoutine)
+        self._expanded_nodes: set = set()
         self._build_tree(routine)
         self._add_click_events()
         self.root_node.selected = True
 
-    def _build_tree(self, routine: Routine) -> None:
+    def _build_tree(self, routine: Union[Routine, StoredRoutine]) -> None:
         root_name = routine.name or DEFAULT_ROOT_NAME
         root_node = Node(root_name)
         self._node_routine_lookup[root_node] = routine
@@ -45,12 +51,14 @@ class _RoutineTree(Tree):
         self.add_node(root_node)
         self._add_child_nodes(routine, root_node)
 
-    def _add_child_nodes(self, routine: Routine, node: Node) -> None:
+    def _add_child_nodes(self, routine: Union[Routine, StoredRoutine], node: Node) -> None:
+        self._expanded_nodes.add(node)
         for child_routine in routine.children.values():
             child_node = Node(child_routine.name)
             self._node_routine_lookup[child_node] = child_routine
             node.add_node(child_node)
-            self._add_child_nodes(child_routine, child_node)
+            if not self._lazy:
+                self._add_child_nodes(child_routine, child_node)
 
     def _add_click_events(self, node: Node = None) -> None:
         node = node or self.root_node
@@ -65,15 +73,23 @@ class _RoutineTree(Tree):
         if event["new"]:
             node = event["owner"]
             routine = self._node_routine_lookup[node]
+            if self._lazy:
+                if node not in self._expanded_nodes:
+                    self._add_child_nodes(routine, node)
+                    for child_node in node.nodes:
+                        self._add_click_event(child_node)
+                # Descendants are needed only to show their resources
+                routine = routine.load(include_children=self._debug_mode)
             html_string = routine_to_latex(routine, show_non_root_resources=self._debug_mode)
             self.selected_routine_resources = rf"{html_string}"
 
 
-def explore_routine(routine: Routine) -> widgets.HBox:
+def explore_routine(routine: Union[Routine, StoredRoutine]) -> widgets.HBox:
     """Widget faciliting exploration of routine's costs.
 
     Args:
-        routine: Routine object to analyze.
+        routine: Routine object to analyze. If it's a routine from `bartiq.store.RoutineStore`,
+            subroutines are read from the store only when their parents are selected.
     """
     tree = _RoutineTree(routine)
     resource_display = widgets.HTMLMath()
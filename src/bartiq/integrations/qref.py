@@ -16,14 +16,9 @@ from typing import Any, Union
 
 from qref import SchemaV1
 
-from .. import Port, Routine
-
-
-def _serialize_port_direction(port_direction):
-    try:
-        return port_direction.value
-    except AttributeError:
-        return str(port_direction)
+from .. import Port, PortDirection, ResourceType, Routine
+from .._traversal import post_order
+from ..graph import RoutineGraph
 
 
 def bartiq_to_qref(routine: Routine, version: str = "v1") -> SchemaV1:
@@ -36,7 +31,14 @@ def bartiq_to_qref(routine: Routine, version: str = "v1") -> SchemaV1:
 def qref_to_bartiq(qref_obj: Union[SchemaV1, dict]) -> Routine:
     """Convert QREF object to a Bartiq routine."""
     qref_obj = SchemaV1.model_validate(qref_obj)
-    return _routine_v1_to_bartiq_routine(qref_obj.program)
+    # The program has already been validated by QREF, hence the routine is constructed without validation.
+    return Routine.from_trusted_dict(_routine_v1_to_bartiq_dict(qref_obj.program))
+
+
+def qref_to_routine_graph(qref_obj: Union[SchemaV1, dict]) -> RoutineGraph:
+    """Convert QREF object to a `RoutineGraph`, without creating Bartiq routines."""
+    qref_obj = SchemaV1.model_validate(qref_obj)
+    return RoutineGraph.from_dict(_routine_v1_to_bartiq_dict(qref_obj.program))
 
 
 def _scoped_port_name_from_op_port(port: Port, parent: Routine) -> str:
@@ -49,15 +51,24 @@ def _ensure_primitive_type(value: Any) -> Union[int, float, str, None]:
     return value if value is None or isinstance(value, (int, float, str)) else str(value)
 
 
-def _bartiq_routine_to_qref_v1_dict(routine: Routine) -> dict:
+def _bartiq_routine_to_qref_v1_dict(root: Routine) -> dict:
+    # Routines are converted bottom-up, so that converted children are ready when their parent is converted
+    converted: dict[int, dict] = {}
+    for routine in post_order(root, lambda routine: routine.children.values()):
+        children = [converted.pop(id(child)) for child in routine.children.values()]
+        converted[id(routine)] = _routine_to_qref_v1_dict(routine, children)
+    return converted[id(root)]
+
+
+def _routine_to_qref_v1_dict(routine: Routine, children: list[dict]) -> dict:
     return {
         "name": routine.name,
         "type": routine.type,
-        "children": [_bartiq_routine_to_qref_v1_dict(child) for child in routine.children.values()],
+        "children": children,
         "resources": [
             {
                 "name": resource.name,
-                "type": str(resource.type),
+                "type": ResourceType(resource.type).value,
                 "value": _ensure_primitive_type(resource.value),
             }
             for resource in routine.resources.values()
@@ -65,7 +76,7 @@ def _bartiq_routine_to_qref_v1_dict(routine: Routine) -> dict:
         "ports": [
             {
                 "name": port.name,
-                "direction": _serialize_port_direction(port.direction),
+                "direction": PortDirection(port.direction).value,
                 "size": _ensure_primitive_type(port.size),
             }
             for port in routine.ports.values()
@@ -91,17 +102,21 @@ def _bartiq_routine_to_qref_v1_dict(routine: Routine) -> dict:
 
 
 # Untypes because RoutineV1 is not public in QREF
-def _routine_v1_to_bartiq_routine(routine_v1) -> Routine:
-    return Routine(
-        name=routine_v1.name,
-        children={child.name: _routine_v1_to_bartiq_routine(child) for child in routine_v1.children},
-        type=routine_v1.type,
-        ports={port.name: port.model_dump() for port in routine_v1.ports},
-        resources={resource.name: resource.model_dump() for resource in routine_v1.resources},
-        local_variables=routine_v1.local_variables,
-        connections=[connection.model_dump() for connection in routine_v1.connections],
-        input_params=routine_v1.input_params,
-        linked_params={
-            link.source: [target.rsplit(".", 1) for target in link.targets] for link in routine_v1.linked_params
-        },
-    )
+def _routine_v1_to_bartiq_dict(root_v1) -> dict[str, Any]:
+    # Routines are converted bottom-up, so that converted children are ready when their parent is converted.
+    converted: dict[int, dict[str, Any]] = {}
+    for routine_v1 in post_order(root_v1, lambda routine_v1: routine_v1.children):
+        converted[id(routine_v1)] = {
+            "name": routine_v1.name,
+            "children": {child.name: converted.pop(id(child)) for child in routine_v1.children},
+            "type": routine_v1.type,
+            "ports": {port.name: port.model_dump() for port in routine_v1.ports},
+            "resources": {resource.name: resource.model_dump() for resource in routine_v1.resources},
+            "local_variables": routine_v1.local_variables,
+            "connections": [connection.model_dump() for connection in routine_v1.connections],
+            "input_params": routine_v1.input_params,
+            "linked_params": {
+                link.source: [target.rsplit(".", 1) for target in link.targets] for link in routine_v1.linked_params
+            },
+        }
+    return converted[id(root_v1)]
@@ -17,6 +17,7 @@ from copy import copy
 from typing import Any, Callable, Iterable, Optional
 
 from .. import Connection, Resource, ResourceType, Routine
+from .._traversal import pre_order
 from ..compilation._symbolic_function import infer_subresources
 from ..errors import BartiqPrecompilationError
 from ..symbolics.backend import SymbolicBackend
@@ -223,7 +224,13 @@ def propagate_linked_params(routine: Routine, _backend: SymbolicBackend) -> None
         _propagate_linked_params(routine)
 
 
-def _propagate_linked_params(routine: Routine) -> None:
+def _propagate_linked_params(root: Routine) -> None:
+    # Routines are visited top-down, as links introduced in a routine have to be propagated further by its children
+    for routine in pre_order(root, lambda routine: routine.children.values()):
+        _propagate_own_linked_params(routine)
+
+
+def _propagate_own_linked_params(routine: Routine) -> None:
     new_linked_params = {}
     for source_param, targets in routine.linked_params.items():
         current_links = []
@@ -248,9 +255,6 @@ def _propagate_linked_params(routine: Routine) -> None:
             else:
                 current_links.append((path, target_param))
         new_linked_params[source_param] = current_links
-    for child in routine.children.values():
-        _propagate_linked_params(child)
-
     # Avoid marking linked_params as set if there was no change
     if new_linked_params != routine.linked_params:
         routine.linked_params = new_linked_params
@@ -14,7 +14,7 @@
 
 from typing import Optional
 
-from bartiq._routine import Connection, Port
+from bartiq._routine import Port, _indexed_connections
 
 
 def join_paths(*paths: str) -> str:
@@ -45,35 +45,24 @@ def get_port_target(port: Port) -> Port:
 def get_route(port: Port, forward: bool = True) -> list[Port]:
     """Returns a list of all the ports that will be encountered when following particular port in either direction."""
     route = [port]
-    pred = _is_source if forward else _is_target
 
-    while (successor := _get_next_port(port, pred)) is not None:
+    while (successor := _get_next_port(port, forward)) is not None:
         port = successor
         route.append(port)
     return route
 
 
-def _is_source(port: Port, connection: Connection) -> bool:
-    return connection.source is port
-
-
-def _is_target(port: Port, connection: Connection) -> bool:
-    return connection.target is port
-
-
-def _other_end(port: Port, connection: Connection) -> Port:
-    return connection.source if connection.target is port else connection.target
-
-
-def _get_next_port(port: Port, predicate) -> Optional[Port]:
+def _get_next_port(port: Port, forward: bool) -> Optional[Port]:
     routine = port.parent
     ancestry_depth = 0
 
     # Terminate whenever we reach either root or grand-grand parent of port.
     while routine is not None and ancestry_depth < 2:
-        for connection in routine.connections:
-            if predicate(port, connection):
-                return _other_end(port, connection)
+        connections = _indexed_connections(routine)
+        if forward and (connection := connections.outgoing(port)) is not None:
+            return connection.target
+        if not forward and (connection := connections.incoming(port)) is not None:
+            return connection.source
         routine = routine.parent
         ancestry_depth += 1
 
@@ -0,0 +1,550 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serialization of routines to files, suitable for programs too large to be serialized in one go.
+
+Two formats are supported:
+
+- JSON, in the same format as the output of `Routine.model_dump`. Routines are written and read
+  incrementally, one routine at a time, so that neither the whole document nor the whole dictionary
+  returned by `Routine.model_dump` is ever kept in memory.
+- Compact binary format, in which all the strings are stored only once, and which is optionally
+  compressed. It is several times smaller than JSON, and much faster to load.
+"""
+
+from __future__ import annotations
+
+import json
+import lzma
+import re
+import struct
+import zlib
+from dataclasses import dataclass, field
+from mmap import mmap
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Iterator,
+    Mapping,
+    NoReturn,
+    Optional,
+    Sequence,
+    TextIO,
+    Union,
+)
+
+from ._routine import (
+    PortDirection,
+    ResourceType,
+    Routine,
+    _construct_routine,
+    _gc_paused,
+    _port_selector,
+)
+from ._traversal import post_order
+
+_CHUNK_SIZE = 2**20
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_LEAF_PREFIX = re.compile(r'\{"children": \{\}[,}]')
+_LEAF_PREFIX_LENGTH = len('{"children": {},')
+
+
+def dump_json(routine: Routine, file: TextIO) -> None:
+    """Write routine and all its descendants to a text file as JSON.
+
+    The output is canonical, i.e. it is the same as `json.dumps(routine.model_dump(), sort_keys=True)`,
+    and hence equal routines are always written the same way. It is written routine by routine,
+    without computing the dictionary describing the whole routine.
+
+    Args:
+        routine: Routine to be written.
+        file: Text file to which the JSON is written.
+    """
+    for chunk in _json_chunks(routine):
+        file.write(chunk)
+
+
+def load_json(file: TextIO, trusted: bool = False) -> Routine:
+    """Read routine from a text file containing its JSON, like the one written by `dump_json`.
+
+    The file is read incrementally, and only the data of routines which are being read at the moment
+    is kept in memory, apart from the routines which were already constructed.
+
+    Args:
+        file: Text file from which the JSON is read. It may contain any JSON object describing a routine
+            in the same format as `Routine.model_dump`, regardless of the order of fields and whitespace.
+        trusted: If True, the routines are not validated, like in `Routine.from_trusted_dict`, which
+            is considerably faster. Use it only for files that are known to be valid, e.g. ones written by
+            `dump_json`.
+
+    Returns:
+        Routine read from the file.
+
+    Raises:
+        ValueError: If the file does not contain a valid JSON object.
+    """
+    reader = _JSONReader(file)
+    with _gc_paused():
+        routine = _read_routine(reader, trusted)
+    if reader.peek() != "":
+        reader.fail("Extra data")
+    return routine
+
+
+def _json_chunks(root: Routine) -> Iterator[str]:
+    # Each routine is written as {"children": {...}, <own fields>}, which gives the same output as sorting the keys,
+    # because "children" comes alphabetically before all the other fields of routines.
+    stack = [_routine_json_chunks(root)]
+    while stack:
+        chunk = next(stack[-1], None)
+        if chunk is None:
+            stack.pop()
+        elif isinstance(chunk, Routine):
+            stack.append(_routine_json_chunks(chunk))
+        else:
+            yield chunk
+
+
+def _routine_json_chunks(routine: Routine) -> Iterator[Union[str, Routine]]:
+    yield '{"children": {'
+    for index, (name, child) in enumerate(sorted(routine.children.items())):
+        yield f"{', ' if index else ''}{json.dumps(name)}: "
+        yield child
+    own_fields = json.dumps(routine.model_dump(exclude={"children"}), sort_keys=True)
+    yield "}}" if own_fields == "{}" else f"}}, {own_fields[1:]}"
+
+
+@dataclass
+class _RoutineInProgress:
+    """Routine which is being read, together with its children read so far."""
+
+    fields: dict[str, Any] = field(default_factory=dict)
+    children: dict[str, Routine] = field(default_factory=dict)
+    members_read: int = 0
+    children_read: int = 0
+    reading_children: bool = False
+    # Name of the child which is being read at the moment
+    current_child: str = ""
+
+
+def _read_routine(reader: _JSONReader, trusted: bool) -> Routine:
+    # Routines which are being read are kept on a stack instead of being read recursively,
+    # so that routines of any depth can be read
+    reader.expect("{")
+    stack = [_RoutineInProgress()]
+    while True:
+        routine = stack[-1]
+        if reader.peek() == "}":
+            reader.expect("}")
+            if routine.reading_children:
+                routine.reading_children = False
+                continue
+            stack.pop()
+            constructed = _construct(routine, trusted)
+            if not stack:
+                return constructed
+            stack[-1].children[stack[-1].current_child] = constructed
+        elif routine.reading_children:
+            if routine.children_read:
+                reader.expect(",")
+            routine.children_read += 1
+            routine.current_child = reader.read_key()
+            # Leaves, which are the majority of routines, are decoded at once, which is much faster
+            if (leaf_fields := reader.read_leaf()) is not None:
+                routine.children[routine.current_child] = _construct(_RoutineInProgress(leaf_fields), trusted)
+            else:
+                reader.expect("{")
+                stack.append(_RoutineInProgress())
+        else:
+            if routine.members_read:
+                reader.expect(",")
+            routine.members_read += 1
+            key = reader.read_key()
+            if key == "children":
+                reader.expect("{")
+                routine.reading_children = True
+            else:
+                routine.fields[key] = reader.read_value()
+
+
+def _construct(routine: _RoutineInProgress, trusted: bool) -> Routine:
+    if trusted:
+        return _construct_routine(Routine, {**routine.fields, "children": routine.children}, routine.children)
+    return Routine(**routine.fields, children=routine.children)
+
+
+class _JSONReader:
+    """Reader of JSON documents from text files, which decodes one value at a time."""
+
+    def __init__(self, file: TextIO):
+        self._file = file
+        self._buffer = ""
+        self._position = 0
+        # Number of characters discarded from the beginning of the buffer, used for reporting positions of errors
+        self._offset = 0
+        self._exhausted = False
+        self._decoder = json.JSONDecoder()
+
+    def peek(self) -> str:
+        """Return the next character other than whitespace, without consuming it, or an empty string at the end."""
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()  # type: ignore[union-attr]
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read_chunk():
+                return ""
+
+    def expect(self, character: str) -> None:
+        """Consume given character, skipping the whitespace preceding it."""
+        if self.peek() != character:
+            self.fail(f"Expecting '{character}'")
+        self._position += 1
+
+    def read_key(self) -> str:
+        """Decode the next key of an object, together with the following colon."""
+        key = self.read_value()
+        if not isinstance(key, str):
+            self.fail("Expecting property name enclosed in double quotes")
+        self.expect(":")
+        return key
+
+    def read_leaf(self) -> Optional[dict[str, Any]]:
+        """Decode the next object if it describes a routine without children starting with them, like in `dump_json`.
+
+        Returns:
+            Fields of the routine other than children, or None if the next object doesn't start with empty children.
+        """
+        self.peek()
+        while len(self._buffer) - self._position < _LEAF_PREFIX_LENGTH and self._read_chunk():
+            pass
+        if not _LEAF_PREFIX.match(self._buffer, self._position):
+            return None
+        fields = self.read_value()
+        del fields["children"]
+        return fields
+
+    def read_value(self) -> Any:
+        """Decode the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # Value doesn't fit in the buffer. Size of the buffer is doubled, so that large values aren't
+                # decoded too many times.
+                if not self._read_chunk(len(self._buffer)):
+                    raise
+                continue
+            # Value reaching the end of the buffer, like a number, might continue in the next chunk
+            if end < len(self._buffer) or not self._read_chunk(len(self._buffer)):
+                self._position = end
+                return value
+
+    def fail(self, message: str) -> NoReturn:
+        """Raise an error pointing at the current position."""
+        raise ValueError(f"{message} at position {self._offset + self._position}.")
+
+    def _read_chunk(self, size: int = _CHUNK_SIZE) -> bool:
+        if self._exhausted:
+            return False
+        chunk = self._file.read(max(size, _CHUNK_SIZE))
+        if not chunk:
+            self._exhausted = True
+            return False
+        # Consumed part of the buffer is discarded, so that only the values which are being read are kept in memory
+        self._offset += self._position
+        self._buffer = self._buffer[self._position :] + chunk  # noqa: E203
+        self._position = 0
+        return True
+
+
+_MAGIC = b"BRTQ"
+_FORMAT_VERSION = 2
+# Header consists of magic bytes, version of the format and code of the compression
+_HEADER = struct.Struct("<4sBB")
+_COMPRESSIONS = {None: 0, "zlib": 1, "lzma": 2}
+_COMPRESSORS: dict[int, Callable[[bytes], bytes]] = {1: zlib.compress, 2: lzma.compress}
+_DECOMPRESSORS: dict[int, Callable[[bytes], bytes]] = {1: zlib.decompress, 2: lzma.decompress}
+
+_DIRECTIONS = [direction.value for direction in PortDirection]
+_RESOURCE_TYPES = [resource_type.value for resource_type in ResourceType]
+
+# Tags preceding encoded values
+_NONE, _INT, _FLOAT, _STR = range(4)
+_DOUBLE = struct.Struct("<d")
+
+
+def dump_binary(routine: Routine, file: BinaryIO, compression: Optional[str] = None) -> None:
+    """Write routine and all its descendants to a binary file in a compact format.
+
+    All the strings, like names, sizes and expressions, are stored once in a table, and are referred to
+    by their indices. Numbers are stored as variable-length integers.
+
+    Note:
+        Like in QREF, routines, ports and resources are identified by their names, and hence keys of
+        the dictionaries containing them aren't stored.
+
+    Args:
+        routine: Routine to be written.
+        file: Binary file to which the routine is written.
+        compression: Compression applied to the data, either "zlib", "lzma", or None for no compression.
+            Lzma gives the smallest files, while zlib is much faster.
+
+    Raises:
+        ValueError: If compression is not supported.
+    """
+    if compression not in _COMPRESSIONS:
+        raise ValueError(f"Unsupported compression {compression}, supported ones are: zlib, lzma and None.")
+    writer = _BinaryWriter()
+    for subroutine in post_order(routine, lambda routine: routine.children.values()):
+        writer.routine(subroutine)
+
+    body = bytearray()
+    _write_varint(body, len(writer.strings))
+    for string in writer.strings:
+        encoded = string.encode()
+        _write_varint(body, len(encoded))
+        body += encoded
+    body += writer.data
+
+    code = _COMPRESSIONS[compression]
+    file.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, code))
+    file.write(_COMPRESSORS[code](bytes(body)) if code else body)
+
+
+def load_binary(file: BinaryIO) -> Routine:
+    """Read routine from a binary file written by `dump_binary`.
+
+    Args:
+        file: Binary file from which the routine is read.
+
+    Returns:
+        Routine read from the file.
+
+    Raises:
+        ValueError: If the file was not written by `dump_binary`, or was written using a different version
+            of the format, i.e. by an incompatible version of bartiq.
+    """
+    header = file.read(_HEADER.size)
+    if len(header) < _HEADER.size or header[:4] != _MAGIC:
+        raise ValueError("Not a file containing a routine in bartiq's binary format.")
+    _, version, code = _HEADER.unpack(header)
+    if version != _FORMAT_VERSION:
+        raise ValueError(f"Unsupported version {version} of bartiq's binary format.")
+    if code not in _COMPRESSIONS.values():
+        raise ValueError(f"Unsupported compression code {code}.")
+    body = file.read()
+    reader = _BinaryReader(_DECOMPRESSORS[code](body) if code else body)
+    with _gc_paused():
+        return reader.routine()
+
+
+def _write_varint(data: bytearray, value: int) -> None:
+    while value >= 0x80:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+class _BinaryWriter:
+    """Encoder of routines, written in post-order, together with the table of strings they use."""
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self.strings: list[str] = []
+        self._string_ids: dict[str, int] = {}
+
+    def routine(self, routine: Routine) -> None:
+        """Encode routine, assuming that all its children have been encoded just before it."""
+        self._string(routine.name)
+        self._optional_string(routine.type)
+
+        self._varint(len(routine.ports))
+        for port in routine.ports.values():
+            self._string(port.name)
+            self._varint(_DIRECTIONS.index(port.direction))
+            self._value(port.size)
+            self._string(json.dumps(port.meta, sort_keys=True))
+
+        self._varint(len(routine.resources))
+        for resource in routine.resources.values():
+            self._string(resource.name)
+            self._varint(_RESOURCE_TYPES.index(resource.type))
+            self._value(resource.value)
+
+        self._varint(len(routine.connections))
+        for connection in routine.connections:
+            self._string(_port_selector(connection.source, routine))
+            self._string(_port_selector(connection.target, routine))
+
+        self._varint(len(routine.input_params))
+        for param in routine.input_params:
+            self._string(param)
+
+        self._varint(len(routine.local_variables))
+        for name, value in routine.local_variables.items():
+            self._string(name)
+            self._string(value)
+
+        self._varint(len(routine.linked_params))
+        for source, targets in routine.linked_params.items():
+            self._string(source)
+            self._varint(len(targets))
+            for path, param in targets:
+                self._string(path)
+                self._string(param)
+
+        self._string(json.dumps(routine.meta, sort_keys=True))
+        self._children(routine)
+
+    def _children(self, routine: Routine) -> None:
+        # Children precede their parent, hence their number is enough to find them
+        self._varint(len(routine.children))
+
+    def _varint(self, value: int) -> None:
+        _write_varint(self.data, value)
+
+    def _string(self, string: str) -> None:
+        if (string_id := self._string_ids.get(string)) is None:
+            string_id = self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        self._varint(string_id)
+
+    def _optional_string(self, string: Optional[str]) -> None:
+        if string is None:
+            self._varint(0)
+        else:
+            self.data.append(1)
+            self._string(string)
+
+    def _value(self, value: Union[int, float, str, None]) -> None:
+        if value is None:
+            self.data.append(_NONE)
+        elif isinstance(value, int):
+            self.data.append(_INT)
+            # Zigzag encoding maps integers with small absolute values to small non-negative ones
+            self._varint(2 * value if value >= 0 else -2 * value - 1)
+        elif isinstance(value, float):
+            self.data.append(_FLOAT)
+            self.data += _DOUBLE.pack(value)
+        else:
+            self.data.append(_STR)
+            self._string(value)
+
+
+class _BinaryReader:
+    """Decoder of routines encoded by `_BinaryWriter`.
+
+    Args:
+        data: Encoded data.
+        strings: Table of strings used by the encoded routines. If not given, it's read from the beginning of the data.
+        position: Position in the data at which decoding starts.
+    """
+
+    def __init__(
+        self,
+        data: Union[bytes, mmap],
+        strings: Optional[Union[Sequence[str], Mapping[int, str]]] = None,
+        position: int = 0,
+    ):
+        self._data = data
+        self._position = position
+        self._strings = [self._raw_string() for _ in range(self._varint())] if strings is None else strings
+
+    def routine(self) -> Routine:
+        """Decode all the routines, returning the last one, i.e. the root."""
+        # Routines are stored in post-order, hence children of each routine are the last constructed routines
+        constructed: list[Routine] = []
+        while self._position < len(self._data):
+            fields = self.fields()
+            first_child = len(constructed) - self._varint()
+            children = fields["children"] = {child.name: child for child in constructed[first_child:]}
+            del constructed[first_child:]
+            constructed.append(_construct_routine(Routine, fields, children))
+        (root,) = constructed
+        return root
+
+    def fields(self) -> dict[str, Any]:
+        """Decode all the fields of a single routine apart from its children, in the format of `Routine.model_dump`."""
+        fields: dict[str, Any] = {"name": self._string(), "type": self._optional_string()}
+        fields["ports"] = {
+            port_name: {
+                "name": port_name,
+                "direction": _DIRECTIONS[self._varint()],
+                "size": self._value(),
+                "meta": self._json(),
+            }
+            for port_name in (self._string() for _ in range(self._varint()))
+        }
+        fields["resources"] = {
+            resource_name: {"name": resource_name, "type": _RESOURCE_TYPES[self._varint()], "value": self._value()}
+            for resource_name in (self._string() for _ in range(self._varint()))
+        }
+        fields["connections"] = [{"source": self._string(), "target": self._string()} for _ in range(self._varint())]
+        fields["input_params"] = [self._string() for _ in range(self._varint())]
+        fields["local_variables"] = {self._string(): self._string() for _ in range(self._varint())}
+        fields["linked_params"] = {
+            self._string(): [(self._string(), self._string()) for _ in range(self._varint())]
+            for _ in range(self._varint())
+        }
+        fields["meta"] = self._json()
+        return fields
+
+    def _varint(self) -> int:
+        data, position = self._data, self._position
+        byte = data[position]
+        position += 1
+        # Most of the numbers, like counts and ids of frequently used strings, take a single byte
+        if byte < 0x80:
+            self._position = position
+            return byte
+        value, shift = byte & 0x7F, 7
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                self._position = position
+                return value
+            shift += 7
+
+    def _raw_string(self) -> str:
+        length = self._varint()
+        start = self._position
+        self._position = end = start + length
+        return self._data[start:end].decode()
+
+    def _string(self) -> str:
+        return self._strings[self._varint()]
+
+    def _optional_string(self) -> Optional[str]:
+        return self._string() if self._varint() else None
+
+    def _json(self) -> Any:
+        string = self._string()
+        # Metadata is empty in most of the routines and ports
+        return {} if string == "{}" else json.loads(string)
+
+    def _value(self) -> Union[int, float, str, None]:
+        tag = self._data[self._position]
+        self._position += 1
+        if tag == _INT:
+            zigzag = self._varint()
+            return zigzag // 2 if zigzag % 2 == 0 else -(zigzag + 1) // 2
+        if tag == _FLOAT:
+            (value,) = _DOUBLE.unpack_from(self._data, self._position)
+            self._position += _DOUBLE.size
+            return value
+        return self._string() if tag == _STR else None
@@ -0,0 +1,351 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""File-backed storage of routines, which reads only the routines that are actually accessed.
+
+`dump_store` writes a routine to a file in a variant of the binary format used by
+`bartiq.serialization.dump_binary`, in which each routine and each string can be read
+independently of the others, thanks to tables of their offsets stored at the end of the file.
+
+`RoutineStore` memory-maps such a file, so opening it takes constant time regardless of its size.
+Routines in the store are represented by `StoredRoutine` objects, which read their fields on first
+access, and which can be converted to ordinary routines with `StoredRoutine.load`. Hence, memory
+used by the store is proportional to the number of accessed routines, and not to the size of the file.
+"""
+
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+from functools import cached_property
+from mmap import ACCESS_READ, mmap
+from os import PathLike
+from typing import Any, Iterator, Optional, Union
+
+from ._routine import (
+    Port,
+    Resource,
+    Routine,
+    _construct_port,
+    _construct_resource,
+    _construct_routine,
+    _gc_paused,
+)
+from ._traversal import post_order, pre_order
+from .serialization import _BinaryReader, _BinaryWriter
+
+_MAGIC = b"BRTS"
+_FORMAT_VERSION = 1
+# Header consists of magic bytes, version of the format, and numbers and positions of tables of
+# offsets of strings and routines
+_HEADER = struct.Struct("<4sB3xQQQQ")
+_OFFSET = struct.Struct("<Q")
+
+
+def dump_store(routine: Routine, path: Union[str, PathLike]) -> None:
+    """Write routine and all its descendants to a file, which can be opened with `RoutineStore`.
+
+    Args:
+        routine: Routine to be written.
+        path: Path to the file to which the routine is written.
+    """
+    writer = _StoreWriter()
+    routine_offsets = array("Q")
+    string_offsets = array("Q")
+    with open(path, "wb") as file:
+        position = file.write(bytes(_HEADER.size))
+        for subroutine in post_order(routine, lambda routine: routine.children.values()):
+            routine_offsets.append(position)
+            writer.routine(subroutine)
+            position += file.write(writer.data)
+            writer.data.clear()
+
+        # Offset of each string is followed by the offset of the next one, hence there's one more offset than strings
+        for string in writer.strings:
+            string_offsets.append(position)
+            position += file.write(string.encode())
+        string_offsets.append(position)
+
+        file.write(_little_endian(string_offsets))
+        file.write(_little_endian(routine_offsets))
+        file.seek(0)
+        file.write(
+            _HEADER.pack(
+                _MAGIC,
+                _FORMAT_VERSION,
+                len(writer.strings),
+                position,
+                len(routine_offsets),
+                position + string_offsets.itemsize * len(string_offsets),
+            )
+        )
+
+
+def _little_endian(offsets: array) -> bytes:
+    if sys.byteorder == "big":
+        offsets = array(offsets.typecode, offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+class _StoreWriter(_BinaryWriter):
+    """Encoder of routines, which stores indices of children, so that each routine can be decoded on its own."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Indices of routines (in the order in which they are written) and of the first routines in their subtrees,
+        # keyed by ids of routines
+        self._indices: dict[int, tuple[int, int]] = {}
+
+    def _children(self, routine: Routine) -> None:
+        index = len(self._indices)
+        children = [(child.name, self._indices[id(child)]) for child in routine.children.values()]
+        # Routines are written in post-order, hence the subtree of a routine starts with the subtree of its first child
+        start = children[0][1][1] if children else index
+        self._indices[id(routine)] = (index, start)
+        self._varint(index - start)
+        self._varint(len(children))
+        for name, (child_index, _) in children:
+            self._string(name)
+            self._varint(child_index)
+
+
+class _StoreReader(_BinaryReader):
+    """Decoder of routines encoded by `_StoreWriter`."""
+
+    def name(self) -> str:
+        """Decode name of the routine, which is the first of its fields."""
+        return self._string()
+
+    def children(self) -> tuple[int, list[tuple[str, int]]]:
+        """Decode number of descendants of the routine, and names and indices of its children."""
+        descendant_count = self._varint()
+        return descendant_count, [(self._string(), self._varint()) for _ in range(self._varint())]
+
+
+class _StringTable(dict[int, str]):
+    """Strings stored in a memory-mapped file, keyed by their ids, and decoded on first access."""
+
+    def __init__(self, data: mmap, offsets_position: int):
+        super().__init__()
+        self._data = data
+        self._offsets_position = offsets_position
+
+    def __missing__(self, string_id: int) -> str:
+        position = self._offsets_position + _OFFSET.size * string_id
+        (start,) = _OFFSET.unpack_from(self._data, position)
+        (end,) = _OFFSET.unpack_from(self._data, position + _OFFSET.size)
+        string = self[string_id] = self._data[start:end].decode()
+        return string
+
+
+class RoutineStore:
+    """Routines stored in a file written by `dump_store`, read from it only when accessed.
+
+    The file is memory-mapped, and stays open until the store is closed. Stores can be used as
+    context managers, in which case they are closed on exit. Stored routines shouldn't be used
+    after their store is closed, but routines loaded from them remain valid.
+
+    Args:
+        path: Path to the file written by `dump_store`.
+
+    Attributes:
+        root: Root routine of the store.
+
+    Raises:
+        ValueError: If the file was not written by `dump_store`, or was written using a different version
+            of the format, i.e. by an incompatible version of bartiq.
+    """
+
+    def __init__(self, path: Union[str, PathLike]):
+        with open(path, "rb") as file:
+            header = file.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:4] != _MAGIC:
+                raise ValueError("Not a file containing routines in bartiq's store format.")
+            _, version, _, string_offsets, self._routine_count, self._routine_offsets = _HEADER.unpack(header)
+            if version != _FORMAT_VERSION:
+                raise ValueError(f"Unsupported version {version} of bartiq's store format.")
+            self._data = mmap(file.fileno(), 0, access=ACCESS_READ)
+        self._strings = _StringTable(self._data, string_offsets)
+        root_index = self._routine_count - 1
+        self.root = StoredRoutine(self, root_index, self._reader(root_index).name(), None)
+
+    def __enter__(self) -> RoutineStore:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._routine_count
+
+    def close(self) -> None:
+        """Close the file containing the routines."""
+        self._data.close()
+
+    def _reader(self, index: int) -> _StoreReader:
+        (position,) = _OFFSET.unpack_from(self._data, self._routine_offsets + _OFFSET.size * index)
+        return _StoreReader(self._data, self._strings, position)
+
+
+class StoredRoutine:
+    """Read-only view of a routine in a `RoutineStore`, whose fields are read from the store on first access.
+
+    Fields have the same meaning as in `Routine`, except for connections, which are represented in the
+    same way as in `Routine.model_dump`, i.e. by selectors of their ports. Values of the fields
+    shouldn't be modified.
+
+    Attributes:
+        name: Name of the routine.
+        parent: Parent of the routine, or None for the root of the store.
+    """
+
+    def __init__(self, store: RoutineStore, index: int, name: str, parent: Optional[StoredRoutine]):
+        self._store = store
+        self._index = index
+        self.name = name
+        self.parent = parent
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name={self.name!r})"
+
+    @cached_property
+    def _record(self) -> tuple[dict[str, Any], int, list[tuple[str, int]]]:
+        reader = self._store._reader(self._index)
+        fields = reader.fields()
+        return (fields, *reader.children())
+
+    @property
+    def type(self) -> Optional[str]:
+        """Type of the routine."""
+        return self._record[0]["type"]
+
+    @cached_property
+    def children(self) -> dict[str, StoredRoutine]:
+        """Children of the routine. Their fields are read only when accessed."""
+        return {name: StoredRoutine(self._store, index, name, self) for name, index in self._record[2]}
+
+    @cached_property
+    def ports(self) -> dict[str, Port]:
+        """Ports of the routine."""
+        return {name: _construct_port(port) for name, port in self._record[0]["ports"].items()}
+
+    @cached_property
+    def resources(self) -> dict[str, Resource]:
+        """Resources of the routine."""
+        return {name: _construct_resource(resource) for name, resource in self._record[0]["resources"].items()}
+
+    @property
+    def connections(self) -> list[dict[str, str]]:
+        """Connections of the routine, as dictionaries with selectors of their source and target ports."""
+        return self._record[0]["connections"]
+
+    @property
+    def input_params(self) -> list[str]:
+        """Input parameters of the routine."""
+        return self._record[0]["input_params"]
+
+    @property
+    def local_variables(self) -> dict[str, str]:
+        """Local variables of the routine."""
+        return self._record[0]["local_variables"]
+
+    @property
+    def linked_params(self) -> dict[str, list[tuple[str, str]]]:
+        """Parameters of the routine linked to parameters of its descendants."""
+        return self._record[0]["linked_params"]
+
+    @property
+    def meta(self) -> dict[str, Any]:
+        """Additional metadata of the routine."""
+        return self._record[0]["meta"]
+
+    @property
+    def is_leaf(self) -> bool:
+        """Return True if the routine has no children."""
+        return not self._record[2]
+
+    def walk(self) -> Iterator[StoredRoutine]:
+        """Iterate over the routine and all its descendants in pre-order.
+
+        Note:
+            As the fields of all the visited routines are read, walking the whole store
+            uses about as much memory as loading it.
+        """
+        return pre_order(self, lambda routine: routine.children.values())
+
+    def absolute_path(self, exclude_root_name: bool = False) -> str:
+        """Return a path from the root of the store to this routine, like `Routine.absolute_path`."""
+        names = []
+        routine: Optional[StoredRoutine] = self
+        while routine is not None:
+            names.append(routine.name)
+            routine = routine.parent
+        if exclude_root_name:
+            names.pop()
+        return ".".join(reversed(names))
+
+    def find_descendant(self, selector: str) -> StoredRoutine:
+        """Given a selector of a descendant, return the corresponding routine, like `Routine.find_descendant`.
+
+        Only the routines on the path to the descendant are read from the store.
+
+        Args:
+            selector: a string comprising sequence of names of routines on the path to the descendant.
+                If empty string is provided, returns itself.
+
+        Returns:
+            Stored routine corresponding to given selector.
+
+        Raises:
+            ValueError: if given descendant is not found.
+        """
+        routine = self
+        for name in selector.split(".") if selector else []:
+            if (child := routine.children.get(name)) is None:
+                raise ValueError(f"Child {selector} not found.")
+            routine = child
+        return routine
+
+    def load(self, include_children: bool = True) -> Routine:
+        """Read the routine and all its descendants from the store, and return them as an ordinary routine.
+
+        Args:
+            include_children: If False, the routine is loaded without its children, and hence also
+                without connections to or from the ports of its children.
+
+        Returns:
+            Routine with the same contents as the stored one. Its parent is None, even if the stored one has a parent.
+        """
+        with _gc_paused():
+            if not include_children:
+                fields = self._record[0]
+                connections = [
+                    connection
+                    for connection in fields["connections"]
+                    if "." not in connection["source"] and "." not in connection["target"]
+                ]
+                return _construct_routine(Routine, {**fields, "connections": connections}, {})
+
+            # Routines are stored in post-order, hence the subtree of the routine is a contiguous range of
+            # indices ending at the routine itself, in which children precede their parents
+            constructed: dict[int, Routine] = {}
+            for index in range(self._index - self._record[1], self._index + 1):
+                reader = self._store._reader(index)
+                fields = reader.fields()
+                _, child_indices = reader.children()
+                children = fields["children"] = {name: constructed.pop(child) for name, child in child_indices}
+                constructed[index] = _construct_routine(Routine, fields, children)
+            return constructed[self._index]
@@ -11,6 +11,24 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from .sympy_backends import sympy_backend
+from typing import TYPE_CHECKING
 
-__all__ = ["sympy_backend"]
+from .._lazy import is_installed, lazy_attributes
+
+if TYPE_CHECKING:
+    from .polynomial_backend import polynomial_backend
+    from .symengine_backend import symengine_backend
+    from .sympy_backends import sympy_backend
+
+_LAZY_ATTRIBUTES = {
+    "sympy_backend": ".sympy_backends",
+    "polynomial_backend": ".polynomial_backend",
+    "symengine_backend": ".symengine_backend",
+}
+
+# symengine_backend requires SymEngine, which is an optional dependency. Accessing it without SymEngine raises
+# an error explaining how to install it, but it's not exported, so that star imports work regardless.
+__all__ = [name for name in _LAZY_ATTRIBUTES if name != "symengine_backend" or is_installed("symengine")]
+
+# Backends are imported only when used, as importing sympy takes a long time
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
@@ -198,10 +198,13 @@ class _NodeConverter:
 
     Attributes:
         interpreter: An interpreter to use for constructing primitives of symbolic expressions.
+            If the interpreter has a `binary_ops` attribute, operators defined in it are used
+            instead of the default ones from _BINARY_OP_MAP.
     """
 
     def __init__(self, interpreter: Interpreter):
         self.interpreter = interpreter
+        self.binary_ops = {**_BINARY_OP_MAP, **getattr(interpreter, "binary_ops", {})}
 
     @singledispatchmethod
     def convert_node(self, node):
@@ -229,9 +232,9 @@ class _NodeConverter:
 
         This is the first of more involved variants. When converting binary operation, we first descend
         down the tree and convert children, and then combine the results using operator as given in
-        _BINARY_OP_MAP.
+        binary_ops.
         """
-        return _BINARY_OP_MAP[type(node.op)](self.convert_node(node.left), self.convert_node(node.right))
+        return self.binary_ops[type(node.op)](self.convert_node(node.left), self.convert_node(node.right))
 
     @convert_node.register
     def _(self, node: ast.UnaryOp):
@@ -12,9 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Callable, Iterable, Optional, Protocol, TypeVar, Union
+from typing import Callable, Iterable, Mapping, Optional, Protocol, TypeVar, Union
 
-from ..compilation.types import Number
+from ..compilation.types import NUMBER_TYPES, Number
 
 T_expr = TypeVar("T_expr")
 
@@ -54,3 +54,99 @@ class SymbolicBackend(Protocol[T_expr]):
 
     def parse_constant(self, expr: T_expr) -> T_expr:
         """Parse the expression, replacing known constants while ignoring case."""
+
+
+# Batch operations
+#
+# Backends may additionally implement any of the methods below, which operate on many symbols or expressions
+# at once, allowing them to fuse the work (e.g. into a single sympy xreplace call):
+#
+#     substitute_all(expr, substitutions) -> T_expr
+#     substitute_in_all(exprs, substitutions) -> list[T_expr]
+#     free_symbols_in_all(exprs) -> list[set[str]]
+#     serialize_all(exprs) -> list[str]
+#
+# The functions below should be used instead of calling these methods directly, as they fall back to
+# the single-expression methods of the SymbolicBackend protocol if a backend doesn't implement them.
+
+
+def substitute_all(
+    backend: SymbolicBackend[T_expr], expr: T_expr, substitutions: Mapping[str, Union[T_expr, Number]]
+) -> T_expr:
+    """Simultaneously substitute multiple symbols in given expression.
+
+    Args:
+        backend: backend used for manipulating the expression.
+        expr: expression in which the symbols are substituted.
+        substitutions: mapping of symbols to their replacements, which are expressions or numerical values.
+
+    Returns:
+        New expression with all the symbols substituted.
+    """
+    if (method := getattr(backend, "substitute_all", None)) is not None:
+        return method(expr, substitutions)
+    return _substitute_one_by_one(backend, expr, substitutions)
+
+
+def substitute_in_all(
+    backend: SymbolicBackend[T_expr], exprs: Iterable[T_expr], substitutions: Mapping[str, Union[T_expr, Number]]
+) -> list[T_expr]:
+    """Simultaneously substitute multiple symbols in each of given expressions.
+
+    Args:
+        backend: backend used for manipulating the expressions.
+        exprs: expressions in which the symbols are substituted.
+        substitutions: mapping of symbols to their replacements, which are expressions or numerical values.
+
+    Returns:
+        List of new expressions, in the same order as ``exprs``.
+    """
+    if (method := getattr(backend, "substitute_in_all", None)) is not None:
+        return method(exprs, substitutions)
+    return [substitute_all(backend, expr, substitutions) for expr in exprs]
+
+
+def free_symbols_in_all(backend: SymbolicBackend[T_expr], exprs: Iterable[T_expr]) -> list[set[str]]:
+    """Return sets of free symbol names in each of given expressions."""
+    if (method := getattr(backend, "free_symbols_in_all", None)) is not None:
+        return method(exprs)
+    return [set(backend.free_symbols_in(expr)) for expr in exprs]
+
+
+def serialize_all(backend: SymbolicBackend[T_expr], exprs: Iterable[T_expr]) -> list[str]:
+    """Return textual representations of each of given expressions."""
+    if (method := getattr(backend, "serialize_all", None)) is not None:
+        return method(exprs)
+    return [backend.serialize(expr) for expr in exprs]
+
+
+def _substitute_one_by_one(
+    backend: SymbolicBackend[T_expr], expr: T_expr, substitutions: Mapping[str, Union[T_expr, Number]]
+) -> T_expr:
+    symbols = set(backend.free_symbols_in(expr))
+    substitutions = {symbol: replacement for symbol, replacement in substitutions.items() if symbol in symbols}
+    replacement_symbols = set().union(
+        *(
+            backend.free_symbols_in(replacement)
+            for replacement in substitutions.values()
+            if not isinstance(replacement, NUMBER_TYPES)
+        )
+    )
+    if replacement_symbols.isdisjoint(substitutions):
+        for symbol, replacement in substitutions.items():
+            expr = backend.substitute(expr, symbol, replacement)
+        return expr
+
+    # Some replacements contain substituted symbols, which can't be substituted again. Hence, the symbols are
+    # first replaced with placeholders, and only then the placeholders are replaced with the actual replacements.
+    used_symbols = symbols | replacement_symbols
+    placeholders = {}
+    for index, symbol in enumerate(substitutions):
+        placeholder = f"_placeholder_{index}"
+        while placeholder in used_symbols:
+            placeholder = f"_{placeholder}"
+        placeholders[symbol] = placeholder
+        expr = backend.substitute(expr, symbol, backend.as_expression(placeholder))
+    for symbol, replacement in substitutions.items():
+        expr = backend.substitute(expr, placeholders[symbol], replacement)
+    return expr
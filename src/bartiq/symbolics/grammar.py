@@ -15,27 +15,27 @@
 from abc import ABC, abstractmethod
 from functools import wraps
 
-from pyparsing import (
-    Combine,
-    Forward,
-    Group,
-    Literal,
-    OneOrMore,
-    Opt,
-    ParseResults,
-    StringEnd,
-    StringStart,
-    Suppress,
-    ZeroOrMore,
-    delimited_list,
-    pyparsing_common,
-)
-
 WILDCARD_CHARACTER = "~"
 
 
 def make_parser(interpreter):
     """Construct a parser for our grammar."""
+    # Pyparsing is imported here, as the grammar is only used by the legacy parser
+    from pyparsing import (
+        Combine,
+        Forward,
+        Group,
+        Literal,
+        OneOrMore,
+        Opt,
+        StringEnd,
+        StringStart,
+        Suppress,
+        ZeroOrMore,
+        delimited_list,
+        pyparsing_common,
+    )
+
     # Define parameter prefixes
     name = pyparsing_common.identifier.set_name("name")
     port_name = Combine(Literal("#") + name).set_name("port name")
@@ -139,6 +139,8 @@ def debuggable(method):
     @wraps(method)
     def debuggable_method(self, tokens):
         if self.debug:
+            from pyparsing import ParseResults
+
             print(method.__name__)
             tokens_str = [token.as_list() if isinstance(token, ParseResults) else token for token in tokens]
             print(f"tokens={tokens_str}")
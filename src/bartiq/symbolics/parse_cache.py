@@ -0,0 +1,128 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded cache of parsed expressions, used by symbolic backends to avoid reparsing the same strings."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Generic, Literal, Optional, TypeVar
+
+T = TypeVar("T")
+
+EvictionPolicy = Literal["lru", "fifo"]
+
+DEFAULT_PARSE_CACHE_SIZE = 8192
+
+
+@dataclass(frozen=True)
+class ParseCacheInfo:
+    """Statistics of a parse cache.
+
+    Attributes:
+        hits: Number of lookups which found a cached expression.
+        misses: Number of lookups which required parsing.
+        evictions: Number of expressions removed from the cache to make room for new ones.
+        maxsize: Maximum number of cached expressions, or None if the cache is unbounded.
+        currsize: Current number of cached expressions.
+    """
+
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: Optional[int]
+    currsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups which found a cached expression."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ParseCache(Generic[T]):
+    """A size-bounded cache of expressions parsed from strings.
+
+    Args:
+        maxsize: Maximum number of cached expressions. If None, the cache grows without bounds,
+            and if 0, nothing is cached (but lookups are still counted).
+        eviction: Policy used for choosing an expression to be removed when the cache is full:
+            "lru" removes the least recently used one, and "fifo" the one cached first.
+    """
+
+    def __init__(self, maxsize: Optional[int] = DEFAULT_PARSE_CACHE_SIZE, eviction: EvictionPolicy = "lru"):
+        if maxsize is not None and maxsize < 0:
+            raise ValueError(f"Size of the parse cache has to be nonnegative or None, got {maxsize}.")
+        if eviction not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy {eviction}; expected 'lru' or 'fifo'.")
+        self.maxsize = maxsize
+        self.eviction = eviction
+        self._entries: OrderedDict[str, T] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get_or_parse(self, expression: str, parse: Callable[[str], T]) -> T:
+        """Return expression parsed from given string, parsing it only if it isn't cached yet.
+
+        Errors raised by ``parse`` are propagated, and nothing is cached in such a case.
+        """
+        try:
+            result = self._entries[expression]
+        except KeyError:
+            pass
+        else:
+            self._hits += 1
+            if self.eviction == "lru":
+                self._entries.move_to_end(expression)
+            return result
+
+        self._misses += 1
+        result = parse(expression)
+        if self.maxsize != 0:
+            if self.maxsize is not None and len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+            self._entries[expression] = result
+        return result
+
+    def info(self) -> ParseCacheInfo:
+        """Return statistics of this cache."""
+        return ParseCacheInfo(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            maxsize=self.maxsize,
+            currsize=len(self._entries),
+        )
+
+    def clear(self) -> None:
+        """Remove all cached expressions and reset the statistics."""
+        self._entries.clear()
+        self._hits = self._misses = self._evictions = 0
+
+    def __getstate__(self):
+        # Cached expressions are not pickled (e.g. together with a backend sent to worker processes),
+        # as their size could easily exceed the size of everything else
+        return {"maxsize": self.maxsize, "eviction": self.eviction}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, expression: str) -> bool:
+        return expression in self._entries
@@ -0,0 +1,1318 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module is an implementation of SymbolicBackend protocol using a lightweight, pure-Python
+# representation of expressions as sparse polynomials, i.e. dictionaries mapping monomials to their
+# coefficients. Monomials are sets of (atom, exponent) pairs, where atoms are symbols, mathematical
+# constants, calls of functions (e.g. ceiling, Max or user-defined ones) and, rarely, sums raised
+# to non-integer powers. Adding, multiplying and substituting such polynomials is considerably
+# cheaper than doing the same with general sympy expressions.
+#
+# Expressions which can't be represented this way (e.g. ones using trigonometric functions or
+# sum_over) are kept as sympy expressions, and operations on them are delegated to sympy_backend.
+# Sympy is imported only when such an expression is encountered, as importing it takes a long time.
+
+from __future__ import annotations
+
+import math
+import operator
+import sys
+from dataclasses import dataclass
+from fractions import Fraction
+from functools import cache, cached_property, reduce
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping, Optional, Union
+
+from typing_extensions import TypeAlias
+
+from ..compilation.types import Number
+from ..errors import BartiqCompilationError
+from .ast_parser import parse
+from .grammar import WILDCARD_CHARACTER, Interpreter, debuggable
+
+if TYPE_CHECKING:
+    import sympy
+
+    from .sympy_backends import SympyBackend
+
+Coefficient: TypeAlias = Union[int, Fraction, float]
+Atom: TypeAlias = Union[str, "_Constant", "_Call", "_Group", "_Power"]
+Monomial: TypeAlias = frozenset  # of (atom, exponent) pairs, with exponents being nonzero numbers
+
+T_expr: TypeAlias = Union["Polynomial", "sympy.Expr"]
+
+_ONE: Monomial = frozenset()
+
+# Same as sympy_backends.NUM_DIGITS_PRECISION and BUILT_IN_FUNCTIONS, names of sympy_interpreter.SPECIAL_PARAMS,
+# and sympy_interpreter.EPSILON, which are not imported, since importing sympy takes a long time
+NUM_DIGITS_PRECISION = 15
+# fmt: off
+BUILT_IN_FUNCTIONS = [
+    "mod", "max", "min", "sum", "sum_over", "prod_over", "round", "abs", "sgn", "sin", "cos", "tan", "cot", "sec",
+    "csc", "asin", "acos", "atan", "acot", "asec", "acsc", "sinh", "cosh", "tanh", "coth", "sech", "csch", "asinh",
+    "acosh", "atanh", "acoth", "asech", "acsch", "sqrt", "cbrt", "prod", "exp", "log", "ceil", "ceiling", "floor",
+    "re", "im", "frac", "exp2", "log2", "log_2", "log10", "log_10", "lambertw", "heaviside", "multiplicity",
+]
+# fmt: on
+_SPECIAL_PARAM_NAMES = frozenset({"PI", "Infinity", "NegativeInfinity", "ComplexInfinity", "oo", "noo", "zoo"})
+_EPSILON = 1e-12
+
+
+def _is_sympy_expression(value: Any) -> bool:
+    # Sympy expressions exist only if sympy has been imported, which is checked first so as not to import it
+    return (module := sys.modules.get("sympy")) is not None and isinstance(value, module.Basic)
+
+
+def _sympy_backend() -> SympyBackend:
+    """Backend to which operations on sympy expressions are delegated."""
+    from .sympy_backends import sympy_backend
+
+    return sympy_backend
+
+
+class _Unrepresentable(Exception):
+    """Raised when sympy expression can't be converted to a polynomial."""
+
+
+def _normalize(number: Coefficient) -> Coefficient:
+    """Convert fractions with denominator 1 to ints, so that integer coefficients are always ints."""
+    if type(number) is Fraction and number.denominator == 1:
+        return number.numerator
+    return number
+
+
+def _divide(numerator: Coefficient, denominator: Coefficient) -> Coefficient:
+    if isinstance(numerator, float) or isinstance(denominator, float):
+        return numerator / denominator
+    return _normalize(Fraction(numerator, denominator))
+
+
+def _integer_power(number: Coefficient, exponent: int) -> Coefficient:
+    return _divide(1, number**-exponent) if exponent < 0 else number**exponent
+
+
+def _exact_root(number: Union[int, Fraction], degree: int) -> Optional[Coefficient]:
+    """Return an exact root of given degree of a nonnegative rational number, or None if it's irrational."""
+    number = Fraction(number)
+    roots = []
+    for part in (number.numerator, number.denominator):
+        try:
+            guess = round(part ** (1 / degree))
+        except OverflowError:
+            return None
+        root = next((candidate for candidate in (guess, guess - 1, guess + 1) if candidate ** degree == part), None)
+        if root is None:
+            return None
+        roots.append(root)
+    return _normalize(Fraction(*roots))
+
+
+class Polynomial:
+    """Expression represented as a sparse polynomial.
+
+    Attributes:
+        terms: mapping of monomials to their (nonzero) coefficients. The constant term, if present,
+            is stored under the empty monomial.
+    """
+
+    __slots__ = ("terms", "_free_symbols", "_call_names", "_hash")
+
+    def __init__(self, terms: dict[Monomial, Coefficient]):
+        self.terms = terms
+        self._free_symbols: Optional[frozenset[str]] = None
+        self._call_names: Optional[frozenset[str]] = None
+        self._hash: Optional[int] = None
+
+    def __getstate__(self):
+        return self.terms
+
+    def __setstate__(self, terms):
+        self.__init__(terms)
+
+    @property
+    def free_symbols(self) -> frozenset[str]:
+        """Names of all symbols present in this polynomial."""
+        if self._free_symbols is None:
+            self._free_symbols = frozenset(
+                symbol
+                for monomial in self.terms
+                for atom, _ in monomial
+                for symbol in ((atom,) if isinstance(atom, str) else atom.free_symbols)
+            )
+        return self._free_symbols
+
+    @property
+    def call_names(self) -> frozenset[str]:
+        """Names of all functions called in this polynomial, including nested calls."""
+        if self._call_names is None:
+            self._call_names = frozenset(
+                name
+                for monomial in self.terms
+                for atom, _ in monomial
+                if not isinstance(atom, str)
+                for name in atom.call_names
+            )
+        return self._call_names
+
+    def __add__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        if not isinstance(other, Polynomial):
+            return _to_sympy(self) + other
+        if not other.terms:
+            return self
+        terms = dict(self.terms)
+        _add_terms(terms, other.terms)
+        return Polynomial(terms)
+
+    def __radd__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return other + self if isinstance(other, Polynomial) else other + _to_sympy(self)
+
+    def __neg__(self):
+        return Polynomial({monomial: -coefficient for monomial, coefficient in self.terms.items()})
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return _call("Abs", self)
+
+    def __sub__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return self + (-other)
+
+    def __rsub__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return other + (-self)
+
+    def __mul__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        if not isinstance(other, Polynomial):
+            return _to_sympy(self) * other
+        return _multiply(self, other)
+
+    def __rmul__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return other * self if isinstance(other, Polynomial) else other * _to_sympy(self)
+
+    def __truediv__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return self * other**-1
+
+    def __rtruediv__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return other * self**-1
+
+    def __floordiv__(self, other):
+        return _call("floor", self / other)
+
+    def __rfloordiv__(self, other):
+        return _call("floor", other / self)
+
+    def __mod__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return _call("Mod", self, other)
+
+    def __rmod__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return _call("Mod", other, self)
+
+    def __pow__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        if not isinstance(other, Polynomial):
+            return _to_sympy(self) ** other
+        if (exponent := _exact_value(other)) is None:
+            return _power_atom(self, other)
+        return _power(self, exponent)
+
+    def __rpow__(self, other):
+        if (other := _as_operand(other)) is None:
+            return NotImplemented
+        return other ** self if isinstance(other, Polynomial) else other ** _to_sympy(self)
+
+    def __eq__(self, other):
+        if isinstance(other, Polynomial):
+            return self.terms == other.terms
+        if isinstance(other, (int, float, Fraction)):
+            return self.terms == _constant(other).terms
+        if _is_sympy_expression(other):
+            return _to_sympy(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            value = _exact_value(self)
+            self._hash = hash(value) if value is not None else hash(frozenset(self.terms.items()))
+        return self._hash
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def _compare(self, other, compare: Callable[[Coefficient, Coefficient], bool], symbol: str) -> bool:
+        lhs, rhs = _value(self), _value(_as_polynomial(other))
+        if lhs is None or rhs is None:
+            raise TypeError(f"Cannot determine truth value of relational {self} {symbol} {other}")
+        return compare(lhs, rhs)
+
+    def __lt__(self, other):
+        return self._compare(other, operator.lt, "<")
+
+    def __le__(self, other):
+        return self._compare(other, operator.le, "<=")
+
+    def __gt__(self, other):
+        return self._compare(other, operator.gt, ">")
+
+    def __ge__(self, other):
+        return self._compare(other, operator.ge, ">=")
+
+    def __float__(self):
+        if (value := _value(self)) is None:
+            raise TypeError(f"Cannot convert expression {self} to float")
+        return float(value)
+
+    def __int__(self):
+        if (value := _value(self)) is None:
+            raise TypeError(f"Cannot convert expression {self} to int")
+        return int(value)
+
+    def _sympy_(self):
+        """Convert this polynomial to sympy expression, called whenever polynomial is passed to sympy."""
+        return _to_sympy(self)
+
+    def __str__(self):
+        return _format_polynomial(self)
+
+    def __repr__(self):
+        return str(self)
+
+
+@dataclass(frozen=True)
+class _Constant:
+    """Mathematical constant, like pi."""
+
+    name: str
+
+    free_symbols = frozenset[str]()
+    call_names = frozenset[str]()
+
+    @cached_property
+    def sort_key(self) -> tuple:
+        return (0, self.name)
+
+    def __str__(self):
+        return _CONSTANT_STRINGS[self.name]
+
+
+@dataclass(frozen=True)
+class _Call:
+    """Function call, which can be either a special function or user-defined one."""
+
+    name: str
+    args: tuple[Polynomial, ...]
+
+    @cached_property
+    def free_symbols(self) -> frozenset[str]:
+        return frozenset().union(*(arg.free_symbols for arg in self.args))
+
+    @cached_property
+    def call_names(self) -> frozenset[str]:
+        return frozenset({self.name}).union(*(arg.call_names for arg in self.args))
+
+    @cached_property
+    def sort_key(self) -> tuple:
+        return (3, str(self))
+
+    def __str__(self):
+        return f"{self.name}({', '.join(map(str, self.args))})"
+
+
+@dataclass(frozen=True)
+class _Group:
+    """Polynomial which cannot be expanded, because it is raised to a non-integer or negative power."""
+
+    base: Polynomial
+
+    @property
+    def free_symbols(self) -> frozenset[str]:
+        return self.base.free_symbols
+
+    @property
+    def call_names(self) -> frozenset[str]:
+        return self.base.call_names
+
+    @cached_property
+    def sort_key(self) -> tuple:
+        return (2, str(self))
+
+    def __str__(self):
+        return _format_base(self.base)
+
+
+@dataclass(frozen=True)
+class _Power:
+    """Polynomial raised to a symbolic power, e.g. 2 ^ N."""
+
+    base: Polynomial
+    exponent: Polynomial
+
+    @cached_property
+    def free_symbols(self) -> frozenset[str]:
+        return self.base.free_symbols | self.exponent.free_symbols
+
+    @cached_property
+    def call_names(self) -> frozenset[str]:
+        return self.base.call_names | self.exponent.call_names
+
+    @cached_property
+    def sort_key(self) -> tuple:
+        return (2, str(self))
+
+    def __str__(self):
+        return f"{_format_base(self.base)} ^ {_format_base(self.exponent)}"
+
+
+_CONSTANT_STRINGS = {"pi": "PI", "E": "exp(1)"}
+_CONSTANT_VALUES = {"pi": math.pi, "E": math.e}
+
+
+def _atom_key(atom: Atom) -> tuple:
+    return (1, atom) if isinstance(atom, str) else atom.sort_key
+
+
+def _constant(value: Coefficient) -> Polynomial:
+    return Polynomial({_ONE: _normalize(value)} if value else {})
+
+
+def _symbol(name: str) -> Polynomial:
+    return Polynomial({frozenset({(name, 1)}): 1})
+
+
+def _atom(atom: Atom, exponent: Coefficient = 1) -> Polynomial:
+    return Polynomial({frozenset({(atom, exponent)}): 1})
+
+
+def _as_polynomial(value) -> Polynomial:
+    return value if isinstance(value, Polynomial) else _constant(value)
+
+
+def _as_operand(value) -> Optional[T_expr]:
+    """Convert given value into a polynomial or sympy expression, or None if it's not an expression at all."""
+    if isinstance(value, Polynomial) or _is_sympy_expression(value):
+        return value
+    if isinstance(value, (int, float, Fraction)):
+        return _constant(value)
+    return None
+
+
+def _exact_value(expr: Polynomial) -> Optional[Coefficient]:
+    """Return value of given polynomial if it is a (rational or float) number, and None otherwise."""
+    terms = expr.terms
+    if not terms:
+        return 0
+    if len(terms) == 1 and _ONE in terms:
+        return terms[_ONE]
+    return None
+
+
+def _value(expr: Polynomial) -> Optional[Coefficient]:
+    """Return value of a polynomial, evaluated numerically if necessary, or None if it can't be evaluated."""
+    if (value := _exact_value(expr)) is not None:
+        return value
+    if expr.free_symbols:
+        return None
+    total = 0.0
+    try:
+        for monomial, coefficient in expr.terms.items():
+            term = float(coefficient)
+            for atom, exponent in monomial:
+                if (atom_value := _atom_value(atom)) is None:
+                    return None
+                term *= atom_value**exponent
+            total += term
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+    return total if isinstance(total, float) and math.isfinite(total) else None
+
+
+def _atom_value(atom: Atom) -> Optional[Coefficient]:
+    if isinstance(atom, _Constant):
+        return _CONSTANT_VALUES[atom.name]
+    if isinstance(atom, _Group):
+        return _value(atom.base)
+    if isinstance(atom, _Power):
+        base, exponent = _value(atom.base), _value(atom.exponent)
+        return None if base is None or exponent is None else float(base) ** float(exponent)
+    if isinstance(atom, _Call) and atom.name in _NUMERIC_FUNCTIONS:
+        args = [_value(arg) for arg in atom.args]
+        return None if any(arg is None for arg in args) else _NUMERIC_FUNCTIONS[atom.name](*args)
+    return None
+
+
+def _add_terms(terms: dict[Monomial, Coefficient], other_terms: dict[Monomial, Coefficient]) -> None:
+    """Add other terms to given terms in place."""
+    for monomial, coefficient in other_terms.items():
+        new_coefficient = _normalize(terms.get(monomial, 0) + coefficient)
+        if new_coefficient:
+            terms[monomial] = new_coefficient
+        else:
+            terms.pop(monomial, None)
+
+
+def _multiply_monomials(lhs: Monomial, rhs: Monomial) -> Monomial:
+    if not lhs:
+        return rhs
+    if not rhs:
+        return lhs
+    exponents = dict(lhs)
+    for atom, exponent in rhs:
+        if atom in exponents:
+            if new_exponent := _normalize(exponents[atom] + exponent):
+                exponents[atom] = new_exponent
+            else:
+                del exponents[atom]
+        else:
+            exponents[atom] = exponent
+    return frozenset(exponents.items())
+
+
+def _multiply(lhs: Polynomial, rhs: Polynomial) -> Polynomial:
+    terms: dict[Monomial, Coefficient] = {}
+    for lhs_monomial, lhs_coefficient in lhs.terms.items():
+        for rhs_monomial, rhs_coefficient in rhs.terms.items():
+            monomial = _multiply_monomials(lhs_monomial, rhs_monomial)
+            terms[monomial] = _normalize(terms.get(monomial, 0) + lhs_coefficient * rhs_coefficient)
+    return _expand_groups(Polynomial({monomial: coefficient for monomial, coefficient in terms.items() if coefficient}))
+
+
+def _is_expandable(atom: Atom, exponent: Coefficient) -> bool:
+    """Check if group raised to given power should be expanded, e.g. (a + b) ^ (1/2) * (a + b) ^ (1/2)."""
+    return (
+        isinstance(atom, _Group) and isinstance(exponent, int) and (exponent > 0 or _exact_value(atom.base) is not None)
+    )
+
+
+def _expand_groups(expr: Polynomial) -> Polynomial:
+    if not any(_is_expandable(atom, exponent) for monomial in expr.terms for atom, exponent in monomial):
+        return expr
+    terms: dict[Monomial, Coefficient] = {}
+    for monomial, coefficient in expr.terms.items():
+        term = Polynomial({frozenset(entry for entry in monomial if not _is_expandable(*entry)): coefficient})
+        for atom, exponent in monomial:
+            if _is_expandable(atom, exponent):
+                term = _multiply(term, _power(atom.base, exponent))
+        _add_terms(terms, term.terms)
+    return Polynomial(terms)
+
+
+def _power(base: Polynomial, exponent: Coefficient) -> T_expr:
+    """Raise polynomial to a numeric power."""
+    if exponent == 0:
+        return _constant(1)
+    if exponent == 1:
+        return base
+    if (value := _exact_value(base)) is not None:
+        return _power_of_number(value, exponent)
+    if len(base.terms) == 1:
+        ((monomial, coefficient),) = base.terms.items()
+        if isinstance(exponent, int):
+            return _expand_groups(
+                Polynomial(
+                    {
+                        frozenset((atom, _normalize(power * exponent)) for atom, power in monomial): _integer_power(
+                            coefficient, exponent
+                        )
+                    }
+                )
+            )
+        if coefficient != 1 and not isinstance(coefficient, float) and coefficient > 0:
+            return _power_of_number(coefficient, exponent) * _power(Polynomial({monomial: 1}), exponent)
+        if coefficient == 1 and len(monomial) == 1:
+            ((atom, power),) = monomial
+            if power == 1:
+                return _atom(atom, exponent)
+    elif isinstance(exponent, int) and exponent > 0:
+        result, square = _constant(1), base
+        while exponent:
+            if exponent & 1:
+                result = _multiply(result, square)
+            exponent >>= 1
+            if exponent:
+                square = _multiply(square, square)
+        return result
+    return _atom(_Group(base), exponent)
+
+
+def _power_of_number(value: Coefficient, exponent: Coefficient) -> T_expr:
+    if value == 0 and exponent < 0 or value < 0 and not isinstance(exponent, int):
+        # Sympy knows best how to deal with complex infinities and numbers
+        import sympy
+
+        return _from_sympy_if_possible(sympy.Pow(_number_to_sympy(value), _number_to_sympy(exponent)))
+    if isinstance(exponent, int):
+        return _constant(_integer_power(value, exponent))
+    if isinstance(value, float) or isinstance(exponent, float):
+        return _constant(value**exponent)
+    if (root := _exact_root(value, exponent.denominator)) is not None:
+        return _power_of_number(root, exponent.numerator)
+    return _atom(_Group(_constant(value)), exponent)
+
+
+def _power_atom(base: Polynomial, exponent: Polynomial) -> Polynomial:
+    if _exact_value(base) in (0, 1):
+        return base
+    return _atom(_Power(base, exponent))
+
+
+# Functions evaluating special functions, returning None if they should remain unevaluated
+def _evaluate_rounding(name: str, function: Callable[[Coefficient], int]) -> Callable[[Polynomial], Optional[T_expr]]:
+    def _evaluate(x):
+        if (value := _value(x)) is None:
+            return None
+        if isinstance(value, float) and _exact_value(x) is None:
+            # Value of an irrational constant (e.g. log(8)/log(2)) may be off by a rounding error,
+            # hence close to the integer boundary we let sympy evaluate it exactly
+            tolerance = 1e-9 * max(1.0, abs(value))
+            if function(value - tolerance) != function(value + tolerance):
+                return _from_sympy_if_possible(_sympy_functions()[name](_to_sympy(x)))
+        return _constant(function(value))
+
+    return _evaluate
+
+
+def _evaluate_log2(x: Polynomial) -> Optional[T_expr]:
+    value = _exact_value(x)
+    if value is None or value <= 0:
+        return None
+    if isinstance(value, float):
+        return _constant(math.log2(value))
+    numerator, denominator = Fraction(value).as_integer_ratio()
+    if denominator == 1 and numerator & (numerator - 1) == 0:
+        return _constant(numerator.bit_length() - 1)
+    if numerator == 1 and denominator & (denominator - 1) == 0:
+        return _constant(1 - denominator.bit_length())
+    return None
+
+
+def _evaluate_log(x: Polynomial) -> Optional[T_expr]:
+    value = _exact_value(x)
+    if value == 1:
+        return _constant(0)
+    if x == _atom(_Constant("E")):
+        return _constant(1)
+    if isinstance(value, float) and value > 0:
+        return _constant(math.log(value))
+    return None
+
+
+def _evaluate_heaviside(x: Polynomial) -> Optional[T_expr]:
+    if (value := _value(x)) is None:
+        return None
+    return _constant(Fraction(1, 2) if value == 0 else int(value > 0))
+
+
+def _heaviside(value: float) -> Union[float, int]:
+    return 0.5 if value == 0 else int(value > 0)
+
+
+def _evaluate_extremum(name: str, select: Callable) -> Callable[..., T_expr]:
+    def _evaluate(*args: Polynomial) -> T_expr:
+        flat_args: list[Polynomial] = []
+        for arg in args:
+            if (call := _as_call(arg)) is not None and call.name == name:
+                flat_args.extend(call.args)
+            else:
+                flat_args.append(arg)
+        numbers = [(value, arg) for arg in flat_args if (value := _value(arg)) is not None]
+        unique_args = {arg: None for arg in flat_args if _value(arg) is None}
+        if numbers:
+            unique_args[select(numbers, key=operator.itemgetter(0))[1]] = None
+        if len(unique_args) == 1:
+            return next(iter(unique_args))
+        return _atom(_Call(name, tuple(sorted(unique_args, key=lambda arg: (_value(arg) is None, str(arg))))))
+
+    return _evaluate
+
+
+def _evaluate_abs(x: Polynomial) -> Optional[T_expr]:
+    if (value := _value(x)) is None:
+        return None
+    return x if value >= 0 else -x
+
+
+def _evaluate_mod(x: Polynomial, y: Polynomial) -> Optional[T_expr]:
+    x_value, y_value = _exact_value(x), _exact_value(y)
+    if x_value is None or not y_value:
+        return None
+    return _constant(x_value % y_value)
+
+
+def _evaluate_round(x: Polynomial, ndigits: Optional[Polynomial] = None) -> Optional[T_expr]:
+    if (value := _value(x)) is None:
+        return None
+    if ndigits is None:
+        return _constant(round(value))
+    if isinstance(digits := _exact_value(ndigits), int):
+        return _constant(round(value, digits))  # type: ignore[arg-type]
+    return None
+
+
+def _evaluate_multiplicity(p: Polynomial, n: Polynomial) -> Optional[T_expr]:
+    p_value, n_value = _exact_value(p), _exact_value(n)
+    if not isinstance(p_value, int) or not isinstance(n_value, int) or p_value < 2 or n_value == 0:
+        return None
+    return _constant(_multiplicity(p_value, n_value))
+
+
+def _multiplicity(p: int, n: int) -> int:
+    result = 0
+    while n % p == 0:
+        n //= p
+        result += 1
+    return result
+
+
+_EVALUATORS: dict[str, Callable[..., Optional[T_expr]]] = {
+    "ceiling": _evaluate_rounding("ceiling", math.ceil),
+    "floor": _evaluate_rounding("floor", math.floor),
+    "log": _evaluate_log,
+    "log2": _evaluate_log2,
+    "Heaviside": _evaluate_heaviside,
+    "Max": _evaluate_extremum("Max", max),
+    "Min": _evaluate_extremum("Min", min),
+    "Abs": _evaluate_abs,
+    "Mod": _evaluate_mod,
+    "Round": _evaluate_round,
+    "multiplicity": _evaluate_multiplicity,
+}
+
+_NUMERIC_FUNCTIONS: dict[str, Callable] = {
+    "ceiling": math.ceil,
+    "floor": math.floor,
+    "log": math.log,
+    "log2": math.log2,
+    "Heaviside": _heaviside,
+    "Max": max,
+    "Min": min,
+    "Abs": abs,
+    "Mod": operator.mod,
+    "Round": round,
+    "multiplicity": _multiplicity,
+}
+
+
+@cache
+def _sympy_functions() -> dict[str, Callable]:
+    """Sympy counterparts of special functions represented natively."""
+    import sympy
+    from sympy.codegen.cfunctions import log2
+
+    from .sympy_interpreter import Round, multiplicity
+
+    return {
+        "ceiling": sympy.ceiling,
+        "floor": sympy.floor,
+        "log": sympy.log,
+        "log2": log2,
+        "Heaviside": sympy.Heaviside,
+        "Max": sympy.Max,
+        "Min": sympy.Min,
+        "Abs": sympy.Abs,
+        "Mod": sympy.Mod,
+        "Round": Round,
+        "multiplicity": multiplicity,
+    }
+
+
+@cache
+def _function_names() -> dict[type, str]:
+    return {function: name for name, function in _sympy_functions().items()}  # type: ignore
+
+
+def _call(name: str, *args: T_expr) -> T_expr:
+    """Call function with given name, evaluating it if possible."""
+    if not all(isinstance(arg, Polynomial) for arg in args):
+        return _from_sympy_if_possible(_sympy_functions()[name](*args))
+    if (evaluate := _EVALUATORS.get(name)) is not None and (result := evaluate(*args)) is not None:
+        return result
+    return _atom(_Call(name, args))  # type: ignore[arg-type]
+
+
+def _as_call(expr: Polynomial) -> Optional[_Call]:
+    """Return a call if given polynomial is a single function call, and None otherwise."""
+    if len(expr.terms) == 1:
+        ((monomial, coefficient),) = expr.terms.items()
+        if coefficient == 1 and len(monomial) == 1:
+            ((atom, exponent),) = monomial
+            if isinstance(atom, _Call) and exponent == 1:
+                return atom
+    return None
+
+
+def _rebuild(expr: Polynomial, needs_update: Callable[[Atom], bool], update: Callable[[Atom], T_expr]) -> T_expr:
+    """Rebuild polynomial, replacing atoms for which needs_update is true by results of update."""
+    terms: dict[Monomial, Coefficient] = {}
+    updated_terms: list[T_expr] = []
+    for monomial, coefficient in expr.terms.items():
+        if not any(needs_update(atom) for atom, _ in monomial):
+            terms[monomial] = coefficient
+            continue
+        term: T_expr = Polynomial({frozenset(entry for entry in monomial if not needs_update(entry[0])): coefficient})
+        for atom, exponent in monomial:
+            if needs_update(atom):
+                new_atom = update(atom)
+                factor = _power(new_atom, exponent) if isinstance(new_atom, Polynomial) else new_atom ** exponent
+                term = term * factor
+        updated_terms.append(term)
+    sympy_terms = []
+    for term in updated_terms:
+        if isinstance(term, Polynomial):
+            _add_terms(terms, term.terms)
+        else:
+            sympy_terms.append(term)
+    result = Polynomial(terms)
+    if not sympy_terms:
+        return result
+    import sympy
+
+    return sympy.Add(_to_sympy(result), *sympy_terms)
+
+
+def _substitute(expr: Polynomial, substitutions: dict[str, T_expr]) -> T_expr:
+    """Simultaneously substitute symbols in given polynomial."""
+
+    def _needs_update(atom: Atom) -> bool:
+        if isinstance(atom, str):
+            return atom in substitutions
+        return not atom.free_symbols.isdisjoint(substitutions)
+
+    def _update(atom: Atom) -> T_expr:
+        if isinstance(atom, str):
+            return substitutions[atom]
+        return _map_atom(atom, lambda arg: _substitute(arg, substitutions))
+
+    return _rebuild(expr, _needs_update, _update)
+
+
+def _replace_calls(expr: Polynomial, name: str, replacement: Callable[[tuple[T_expr, ...]], T_expr]) -> T_expr:
+    """Replace calls of function with given name, starting from the innermost ones."""
+
+    def _update(atom: Atom) -> T_expr:
+        if isinstance(atom, _Call) and atom.name == name:
+            return replacement(tuple(_replace_calls(arg, name, replacement) for arg in atom.args))
+        return _map_atom(atom, lambda arg: _replace_calls(arg, name, replacement))
+
+    return _rebuild(expr, lambda atom: not isinstance(atom, str) and name in atom.call_names, _update)
+
+
+def _map_atom(atom: Atom, function: Callable[[Polynomial], T_expr]) -> T_expr:
+    """Apply function to all polynomials an atom consists of, and construct a new expression from the results."""
+    if isinstance(atom, _Call):
+        args = tuple(map(function, atom.args))
+        if atom.name in _EVALUATORS:
+            return _call(atom.name, *args)
+        if all(isinstance(arg, Polynomial) for arg in args):
+            return _atom(_Call(atom.name, args))  # type: ignore[arg-type]
+        return _sympy_call(atom.name, args)
+    if isinstance(atom, _Group):
+        return function(atom.base)
+    if isinstance(atom, _Power):
+        return function(atom.base) ** function(atom.exponent)
+    return _atom(atom)
+
+
+def _sympy_call(name: str, args: Iterable[T_expr]) -> sympy.Expr:
+    """Call undefined function with given name on arguments, some of which are sympy expressions."""
+    import sympy
+
+    return sympy.Function(name)(*map(_to_sympy, args))
+
+
+def _number_to_sympy(number: Coefficient) -> sympy.Expr:
+    import sympy
+
+    if isinstance(number, Fraction):
+        return sympy.Rational(number.numerator, number.denominator)
+    return sympy.sympify(number)
+
+
+def _atom_to_sympy(atom: Atom) -> sympy.Expr:
+    import sympy
+
+    if isinstance(atom, str):
+        return sympy.Symbol(atom)
+    if isinstance(atom, _Constant):
+        return getattr(sympy, atom.name)
+    if isinstance(atom, _Call):
+        return _sympy_functions().get(atom.name, sympy.Function(atom.name))(*map(_to_sympy, atom.args))
+    if isinstance(atom, _Group):
+        return _to_sympy(atom.base)
+    return sympy.Pow(_to_sympy(atom.base), _to_sympy(atom.exponent))
+
+
+def _to_sympy(expr: T_expr) -> sympy.Expr:
+    """Convert polynomial to an equivalent sympy expression."""
+    if not isinstance(expr, Polynomial):
+        return expr
+    import sympy
+
+    return sympy.Add(
+        *(
+            sympy.Mul(
+                _number_to_sympy(coefficient),
+                *(sympy.Pow(_atom_to_sympy(atom), _number_to_sympy(exponent)) for atom, exponent in monomial),
+            )
+            for monomial, coefficient in expr.terms.items()
+        )
+    )
+
+
+def _from_sympy(expr: sympy.Expr) -> Polynomial:
+    """Convert sympy expression into polynomial, raising _Unrepresentable if it's not possible."""
+    import sympy
+    from sympy.core.function import AppliedUndef
+
+    if isinstance(expr, sympy.Symbol):
+        return _symbol(expr.name)
+    if isinstance(expr, sympy.Integer):
+        return _constant(int(expr))
+    if isinstance(expr, sympy.Rational):
+        return _constant(Fraction(expr.p, expr.q))
+    if isinstance(expr, sympy.Float):
+        return _constant(float(expr))
+    if expr is sympy.pi:
+        return _atom(_Constant("pi"))
+    if expr is sympy.E:
+        return _atom(_Constant("E"))
+    if isinstance(expr, (sympy.Add, sympy.Mul, sympy.Pow)):
+        args = [_from_sympy(arg) for arg in expr.args]
+        combine = operator.add if isinstance(expr, sympy.Add) else operator.mul
+        result = reduce(combine, args) if not isinstance(expr, sympy.Pow) else args[0] ** args[1]
+    elif type(expr) in _function_names():
+        args = expr.args
+        if isinstance(expr, sympy.Heaviside):
+            # Heaviside stores its value at zero as an argument, only the default one is represented natively
+            if len(expr.pargs) > 1:
+                raise _Unrepresentable(expr)
+            args = expr.pargs
+        result = _call(_function_names()[type(expr)], *map(_from_sympy, args))
+    elif isinstance(expr, AppliedUndef):
+        result = _atom(_Call(type(expr).__name__, tuple(map(_from_sympy, expr.args))))
+    else:
+        raise _Unrepresentable(expr)
+    if not isinstance(result, Polynomial):
+        raise _Unrepresentable(expr)
+    return result
+
+
+def _from_sympy_if_possible(expr: T_expr) -> T_expr:
+    if isinstance(expr, Polynomial):
+        return expr
+    try:
+        return _from_sympy(expr)
+    except _Unrepresentable:
+        return expr
+
+
+def _format_float(value: float) -> str:
+    mantissa, _, exponent = repr(value).partition("e")
+    if len(mantissa.replace("-", "").replace(".", "").strip("0")) > NUM_DIGITS_PRECISION:
+        # Results of float arithmetic are printed with the default sympy precision
+        import sympy
+
+        return str(sympy.Float(value))
+    if exponent:
+        return f"{mantissa if '.' in mantissa else mantissa + '.0'}e{int(exponent):+d}"
+    return mantissa
+
+
+def _format_exponent(exponent: Coefficient) -> str:
+    if isinstance(exponent, float):
+        return _format_float(exponent) if exponent >= 0 else f"({_format_float(exponent)})"
+    return str(exponent) if isinstance(exponent, int) and exponent >= 0 else f"({exponent})"
+
+
+def _format_base(expr: Polynomial) -> str:
+    """Format polynomial used as a base or an exponent, parenthesizing it if needed."""
+    if len(expr.terms) == 1:
+        ((monomial, coefficient),) = expr.terms.items()
+        if not monomial and isinstance(coefficient, int) and coefficient >= 0:
+            return str(coefficient)
+        if coefficient == 1 and len(monomial) == 1:
+            ((atom, exponent),) = monomial
+            if exponent == 1 and isinstance(atom, (str, _Constant, _Call)):
+                return str(atom)
+    return f"({expr})"
+
+
+def _format_factor(atom: Atom, exponent: Coefficient) -> str:
+    if exponent == 1:
+        return str(atom)
+    base = f"({atom})" if isinstance(atom, _Power) else str(atom)
+    return f"{base} ^ {_format_exponent(exponent)}"
+
+
+def _format_term(monomial: Monomial, coefficient: Coefficient) -> str:
+    """Format a term with positive coefficient, putting atoms with negative exponents in the denominator."""
+    if coefficient == 1 and not isinstance(coefficient, float) and len(monomial) == 1:
+        # Like in sympy, a single power is not printed as a fraction
+        ((atom, exponent),) = monomial
+        return _format_factor(atom, exponent)
+    entries = sorted(monomial, key=lambda entry: _atom_key(entry[0]))
+    numerator = [_format_factor(atom, exponent) for atom, exponent in entries if exponent > 0]
+    denominator = [_format_factor(atom, -exponent) for atom, exponent in entries if exponent < 0]
+    if isinstance(coefficient, float):
+        if coefficient != 1 or not numerator:
+            numerator.insert(0, _format_float(coefficient))
+    else:
+        if coefficient.numerator != 1 or not numerator:
+            numerator.insert(0, str(coefficient.numerator))
+        if coefficient.denominator != 1:
+            denominator.insert(0, str(coefficient.denominator))
+    text = "*".join(numerator)
+    if len(denominator) == 1:
+        text = f"{text}/{denominator[0]}"
+    elif denominator:
+        text = f"{text}/({'*'.join(denominator)})"
+    return text
+
+
+def _format_polynomial(expr: Polynomial) -> str:
+    """Format polynomial in a way similar to sympy, i.e. ordering terms lexicographically by exponents."""
+    if not expr.terms:
+        return "0"
+    atoms = sorted({atom for monomial in expr.terms for atom, _ in monomial}, key=_atom_key)
+    positions = {atom: i for i, atom in enumerate(atoms)}
+
+    def _exponents(monomial: Monomial) -> list[Coefficient]:
+        exponents: list[Coefficient] = [0] * len(atoms)
+        for atom, exponent in monomial:
+            exponents[positions[atom]] = exponent
+        return exponents
+
+    text = ""
+    for monomial, coefficient in sorted(expr.terms.items(), key=lambda term: _exponents(term[0]), reverse=True):
+        term = _format_term(monomial, -coefficient if coefficient < 0 else coefficient)
+        if not text:
+            text = f"-{term}" if coefficient < 0 else term
+        else:
+            text += f" - {term}" if coefficient < 0 else f" + {term}"
+    return text
+
+
+def _log(x: Polynomial, base: Optional[Polynomial] = None) -> T_expr:
+    if base is None:
+        return _call("log", x)
+    if _exact_value(x) is not None and _exact_value(base) is not None:
+        # Sympy extracts integer powers of numeric base from numeric argument, e.g. log(6, 2) = 1 + log(3)/log(2)
+        import sympy
+
+        return _from_sympy_if_possible(sympy.log(_to_sympy(x), _to_sympy(base)))
+    return _call("log", x) / _call("log", base)
+
+
+def _heaviside_call(x: Polynomial, *args: Polynomial) -> T_expr:
+    if args:
+        import sympy
+
+        return _from_sympy_if_possible(sympy.Heaviside(_to_sympy(x), *map(_to_sympy, args)))
+    return _call("Heaviside", x)
+
+
+# Functions which are represented natively, keyed by their lowercase names used in bartiq expressions
+_NATIVE_FUNCS: dict[str, Callable] = {
+    "ceil": lambda x: _call("ceiling", x),
+    "ceiling": lambda x: _call("ceiling", x),
+    "floor": lambda x: _call("floor", x),
+    "log": _log,
+    "log2": lambda x: _call("log2", x),
+    "log_2": lambda x: _call("log2", x),
+    "heaviside": _heaviside_call,
+    "max": lambda *args: _call("Max", *args),
+    "min": lambda *args: _call("Min", *args),
+    "abs": lambda x: _call("Abs", x),
+    "mod": lambda x, y: _call("Mod", x, y),
+    "round": lambda *args: _call("Round", *args),
+    "multiplicity": lambda p, n: _call("multiplicity", p, n),
+    "sqrt": lambda x: x ** Fraction(1, 2),
+    "cbrt": lambda x: x ** Fraction(1, 3),
+    "sum": lambda *args: sum(args) if args else 0,
+    "prod": lambda *args: reduce(operator.mul, args, 1),
+    "sgn": lambda a: -1 if a < -_EPSILON else 1 if a > _EPSILON else 0,
+}
+
+# Names of calls of special functions
+_NATIVE_CALL_NAMES = frozenset(_EVALUATORS)
+
+# Names of constants which symbols treated as constants by parse_constant, in all variants of their
+# capitalization, stand for
+_CONSTANT_SYMBOLS: dict[str, str] = {
+    variant: name
+    for name in ("pi", "E", "oo", "infinity")
+    for variant in (name.casefold(), name.upper(), name.capitalize())
+}
+
+
+def _named_constant(name: str) -> T_expr:
+    if name in _CONSTANT_STRINGS:
+        return _atom(_Constant(name))
+    import sympy
+
+    return sympy.oo
+
+
+def _has_wildcard(args) -> bool:
+    """Check for wildcards in names used in polynomials, which is much cheaper than printing them."""
+    if all(isinstance(arg, Polynomial) for arg in args):
+        return any(WILDCARD_CHARACTER in name for arg in args for name in arg.free_symbols | arg.call_names)
+    return any(WILDCARD_CHARACTER in str(arg) for arg in args)
+
+
+class PolynomialInterpreter(Interpreter):
+    """An interpreter for parsing expressions to polynomials."""
+
+    @debuggable
+    def create_number(self, tokens):
+        """Return a constant polynomial."""
+        return _constant(tokens[0])
+
+    @debuggable
+    def create_parameter(self, tokens):
+        """Return a polynomial consisting of a single symbol."""
+        param = tokens[0]
+        if param == "PI":
+            return _atom(_Constant("pi"))
+        if param in _SPECIAL_PARAM_NAMES:
+            from .sympy_interpreter import SPECIAL_PARAMS
+
+            return SPECIAL_PARAMS[param]
+        return _symbol(param)
+
+    @debuggable
+    def create_function(self, tokens):
+        """Return a polynomial representing function call, or sympy expression if there is no such polynomial."""
+        name, args = tokens
+
+        # Case 1: if the function has a wildcard, don't evaluate it yet (see SympyInterpreter for details)
+        if _has_wildcard(args):
+            return _atom(_Call(name, tuple(args)))
+
+        # Case 2: if a known function, represent it natively if possible, and fall back to sympy otherwise
+        lower_name = name.lower()
+        if lower_name in _NATIVE_FUNCS and all(isinstance(arg, Polynomial) for arg in args):
+            return _as_expression(_NATIVE_FUNCS[lower_name](*args))
+        if lower_name in BUILT_IN_FUNCTIONS:
+            from .sympy_interpreter import SPECIAL_FUNCS
+
+            return _from_sympy_if_possible(SPECIAL_FUNCS[lower_name](*map(_to_sympy, args)))
+
+        # Case 3: if nothing else works, just cast to a generic function
+        if all(isinstance(arg, Polynomial) for arg in args):
+            return _atom(_Call(name, tuple(args)))
+        return _sympy_call(name, args)
+
+    # Binary and unary operators are handled by the default parser itself, and these methods are used only
+    # by the legacy one, which relies on sympy anyway
+    @debuggable
+    def create_expression(self, tokens):
+        """Return an expression built by applying binary operators."""
+        from .sympy_interpreter import SympyInterpreter
+
+        return SympyInterpreter.create_expression(self, tokens)
+
+    @debuggable
+    def create_unary_atom(self, tokens):
+        """Return an atom with unary operators applied."""
+        from .sympy_interpreter import SympyInterpreter
+
+        return SympyInterpreter.create_unary_atom(self, tokens)
+
+
+def parse_to_polynomial(expression: str, debug=False) -> T_expr:
+    """Parse given mathematical expression into a polynomial.
+
+    Args:
+        expression: expression to be parsed.
+        debug: flag indicating if PolynomialInterpreter should use debug prints. Defaults to False
+            for performance reasons.
+
+    Returns:
+        A polynomial parsed from `expression`, or a sympy expression if it can't be represented as a polynomial.
+    """
+    return parse(expression, interpreter=PolynomialInterpreter(debug=debug))
+
+
+def _as_expression(value) -> T_expr:
+    if isinstance(value, Polynomial):
+        return value
+    if _is_sympy_expression(value):
+        return _from_sympy_if_possible(value)
+    return _constant(value)
+
+
+class PolynomialBackend:
+    """Backend representing expressions as sparse polynomials, falling back to sympy when necessary.
+
+    The expressions are serialized in the same format as by the sympy backend, hence this backend can
+    be used as a drop-in replacement for it, e.g. ``compile_routine(routine, backend=polynomial_backend)``.
+    """
+
+    def __init__(self, parse_function=parse_to_polynomial):
+        self.parse = parse_function
+
+    def as_expression(self, value: Union[str, int, float]) -> T_expr:
+        """Convert numerical or textual value into an expression."""
+        if isinstance(value, str):
+            return _as_expression(self.parse(value))
+        # Like sympify, we leave None as it is, which is relied upon e.g. for ports without sizes
+        return _as_expression(value) if value is not None else value
+
+    def parse_constant(self, expr: T_expr) -> T_expr:
+        """Parse the expression, replacing known constants while ignoring case."""
+        if not isinstance(expr, Polynomial):
+            return _as_expression(_sympy_backend().parse_constant(expr))
+        if substitutions := {
+            symbol: _named_constant(_CONSTANT_SYMBOLS[symbol])
+            for symbol in expr.free_symbols & _CONSTANT_SYMBOLS.keys()
+        }:
+            return _as_expression(_substitute(expr, substitutions))
+        return expr
+
+    def free_symbols_in(self, expr: T_expr) -> Iterable[str]:
+        """Return an iterable over free symbol names in given expression."""
+        if isinstance(expr, Polynomial):
+            return expr.free_symbols
+        return _sympy_backend().free_symbols_in(expr)
+
+    def functions_in(self, expr: T_expr) -> Iterable[str]:
+        """Returns the (non-built-in) functions referenced in the expression."""
+        if not isinstance(expr, Polynomial):
+            return _sympy_backend().functions_in(expr)
+        return [
+            name for name in expr.call_names if name not in _NATIVE_CALL_NAMES and name not in self.reserved_functions()
+        ]
+
+    def reserved_functions(self) -> Iterable[str]:
+        """Return an iterable over all built-in functions."""
+        return BUILT_IN_FUNCTIONS
+
+    def value_of(self, expr: T_expr) -> Optional[Number]:
+        """Compute a numerical value of an expression, return None if it's not possible."""
+        if not isinstance(expr, Polynomial):
+            return _sympy_backend().value_of(expr)
+        if (value := _value(expr)) is None:
+            return None
+        if isinstance(value, int):
+            return value
+        # Like sympy backend, evaluate to NUM_DIGITS_PRECISION significant digits, and then round
+        value = round(float(f"{float(value):.{NUM_DIGITS_PRECISION}g}"), NUM_DIGITS_PRECISION)
+        return int(value) if value.is_integer() else value
+
+    def substitute(self, expr: T_expr, symbol: str, replacement: Union[T_expr, Number]) -> T_expr:
+        """Substitute occurrences of given symbol with an expression or numerical value."""
+        return self.substitute_all(expr, {symbol: replacement})
+
+    def substitute_all(self, expr: T_expr, substitutions: Mapping[str, Union[T_expr, Number]]) -> T_expr:
+        """Simultaneously substitute occurrences of multiple symbols with expressions or numerical values."""
+        return self.substitute_in_all([expr], substitutions)[0]
+
+    def substitute_in_all(
+        self, exprs: Iterable[T_expr], substitutions: Mapping[str, Union[T_expr, Number]]
+    ) -> list[T_expr]:
+        """Simultaneously substitute occurrences of multiple symbols in each of given expressions."""
+        replacements = {symbol: _as_expression(replacement) for symbol, replacement in substitutions.items()}
+        return [self._substitute_in(expr, replacements) for expr in exprs]
+
+    def _substitute_in(self, expr: T_expr, replacements: dict[str, T_expr]) -> T_expr:
+        free_symbols = set(self.free_symbols_in(expr))
+        if not (replacements := {symbol: value for symbol, value in replacements.items() if symbol in free_symbols}):
+            return expr
+        if isinstance(expr, Polynomial):
+            return _as_expression(_substitute(expr, replacements))
+        return _as_expression(
+            _sympy_backend().substitute_all(
+                expr, {symbol: _to_sympy(replacement) for symbol, replacement in replacements.items()}
+            )
+        )
+
+    def rename_function(self, expr: T_expr, old_name: str, new_name: str) -> T_expr:
+        """Rename all instances of given function call."""
+        if old_name in BUILT_IN_FUNCTIONS:
+            raise BartiqCompilationError(
+                f"Attempted to rename the special function {old_name} (to {new_name}); cannot rename special functions."
+            )
+        if new_name in BUILT_IN_FUNCTIONS:
+            raise BartiqCompilationError(
+                f"Attempted to rename the function {old_name} to the special function {new_name}); "
+                " cannot rename functions to special functions."
+            )
+        if not isinstance(expr, Polynomial):
+            return _sympy_backend().rename_function(expr, old_name, new_name)
+        if old_name not in expr.call_names:
+            return expr
+        return _replace_calls(
+            expr,
+            old_name,
+            lambda args: (
+                _atom(_Call(new_name, args))  # type: ignore[arg-type]
+                if all(isinstance(arg, Polynomial) for arg in args)
+                else _sympy_call(new_name, args)
+            ),
+        )
+
+    def define_function(self, expr: T_expr, func_name: str, function: Callable) -> T_expr:
+        """Define an undefined function."""
+        # Catch attempt to define special function names
+        if func_name in BUILT_IN_FUNCTIONS:
+            raise BartiqCompilationError(
+                f"Attempted to redefine the special function {func_name}; cannot " "define special functions."
+            )
+        if not isinstance(expr, Polynomial):
+            return _as_expression(_sympy_backend().define_function(expr, func_name, function))
+        if func_name not in expr.call_names:
+            return expr
+
+        # Trying to evaluate a function which cannot be evaluated symbolically raises TypeError.
+        # This, however, is expected for certain functions (e.g. with conditions)
+        try:
+            return _as_expression(_replace_calls(expr, func_name, lambda args: _as_expression(function(*args))))
+        except TypeError:
+            return expr
+
+    def is_constant_int(self, expr: T_expr) -> bool:
+        """Return True if a given expression represents a constant int and False otherwise."""
+        if not isinstance(expr, Polynomial):
+            return _sympy_backend().is_constant_int(expr)
+        return isinstance(_exact_value(expr), int)
+
+    def serialize(self, expr: T_expr) -> str:
+        """Return a textual representation of given expression."""
+        if isinstance(expr, Polynomial):
+            return str(expr)
+        from .sympy_serializer import serialize_expression
+
+        return serialize_expression(expr)
+
+
+polynomial_backend = PolynomialBackend()
@@ -0,0 +1,447 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# This module is an implementation of SymbolicBackend protocol (with T_expr = symengine.Expr)
+# using SymEngine, which is considerably faster than sympy when it comes to constructing
+# expressions, substituting symbols and finding free symbols.
+#
+# Special functions which SymEngine doesn't know about (e.g. round or sum_over) are represented
+# by undefined functions with reserved names. They are evaluated with sympy, whenever their
+# arguments become numbers, and converted to their sympy counterparts when expressions are
+# serialized, so that the results are the same as obtained with the sympy backend.
+
+from __future__ import annotations
+
+import ast
+from typing import Callable, Iterable, Mapping, Optional, Union
+
+import sympy
+from sympy.codegen.cfunctions import exp2, log2, log10
+from sympy.core.function import AppliedUndef
+from typing_extensions import TypeAlias
+
+try:
+    import symengine as se
+except ImportError as error:
+    raise ImportError(
+        'SymEngine backend requires SymEngine, which can be installed with: pip install "bartiq[symengine]"'
+    ) from error
+
+from ..compilation.types import Number
+from ..errors import BartiqCompilationError
+from .ast_parser import parse
+from .grammar import debuggable
+from .sympy_backends import BUILT_IN_FUNCTIONS, sympy_backend
+from .sympy_interpreter import (
+    SPECIAL_FUNCS,
+    Round,
+    SympyInterpreter,
+    _contains_wildcard_arg,
+    multiplicity,
+)
+from .sympy_serializer import serialize_expression
+
+T_expr: TypeAlias = se.Expr
+
+MATH_CONSTANTS = {
+    "pi": se.pi,
+    "E": se.E,
+    "oo": se.oo,
+    "infinity": se.oo,
+}
+
+SPECIAL_PARAMS = {
+    "PI": se.pi,
+    "Infinity": se.oo,
+    "NegativeInfinity": -se.oo,
+    "ComplexInfinity": se.zoo,
+    "oo": se.oo,
+    "noo": -se.oo,
+    "zoo": se.zoo,
+}
+
+# Special functions which have their counterparts in SymEngine
+NATIVE_FUNCS: dict[str, Callable] = {
+    "max": se.Max,
+    "min": se.Min,
+    "sum": SPECIAL_FUNCS["sum"],
+    "abs": abs,
+    "sgn": SPECIAL_FUNCS["sgn"],
+    "sin": se.sin,
+    "cos": se.cos,
+    "tan": se.tan,
+    "cot": se.cot,
+    "sec": se.sec,
+    "csc": se.csc,
+    "asin": se.asin,
+    "acos": se.acos,
+    "atan": se.atan,
+    "acot": se.acot,
+    "asec": se.asec,
+    "acsc": se.acsc,
+    "sinh": se.sinh,
+    "cosh": se.cosh,
+    "tanh": se.tanh,
+    "coth": se.coth,
+    "sech": se.sech,
+    "csch": se.csch,
+    "asinh": se.asinh,
+    "acosh": se.acosh,
+    "atanh": se.atanh,
+    "acoth": se.acoth,
+    "asech": se.asech,
+    "acsch": se.acsch,
+    "sqrt": se.sqrt,
+    "cbrt": lambda x: x ** se.Rational(1, 3),
+    "prod": SPECIAL_FUNCS["prod"],
+    "exp": se.exp,
+    "log": se.log,
+    "ceil": se.ceiling,
+    "ceiling": se.ceiling,
+    "floor": se.floor,
+    "lambertw": se.LambertW,
+}
+
+# Special functions evaluated with sympy, keyed by the reserved names of functions representing them
+SYMPY_FUNCS: dict[str, Callable] = {
+    "Mod": sympy.Mod,
+    "Round": Round,
+    "multiplicity": multiplicity,
+    "frac": sympy.frac,
+    "re": sympy.re,
+    "im": sympy.im,
+    "exp2": exp2,
+    "log2": log2,
+    "log10": log10,
+    "Heaviside": sympy.Heaviside,
+    "sum_over": SPECIAL_FUNCS["sum_over"],
+    "prod_over": SPECIAL_FUNCS["prod_over"],
+}
+
+# Reserved names of functions representing given bartiq's special function
+_SYMPY_FUNC_NAMES = {
+    "mod": "Mod",
+    "round": "Round",
+    "multiplicity": "multiplicity",
+    "frac": "frac",
+    "re": "re",
+    "im": "im",
+    "exp2": "exp2",
+    "log2": "log2",
+    "log_2": "log2",
+    "log10": "log10",
+    "log_10": "log10",
+    "heaviside": "Heaviside",
+    "sum_over": "sum_over",
+    "prod_over": "prod_over",
+}
+
+# Sympy types of the special functions, mapped to the reserved names of functions representing them
+_SYMPY_TYPE_NAMES: dict[type, str] = {
+    sympy.Mod: "Mod",
+    Round: "Round",
+    multiplicity: "multiplicity",
+    sympy.frac: "frac",
+    sympy.re: "re",
+    sympy.im: "im",
+    exp2: "exp2",
+    log2: "log2",
+    log10: "log10",
+    sympy.Heaviside: "Heaviside",
+    sympy.Sum: "sum_over",
+    sympy.Product: "prod_over",
+}
+
+# Functions whose second argument is a bound variable, e.g. i in sum_over(i**2, i, 1, N)
+_SEQUENCE_FUNCS = ("sum_over", "prod_over")
+
+
+def _calls(expr: T_expr) -> set[T_expr]:
+    return expr.atoms(se.FunctionSymbol)
+
+
+def _from_sympy(expr: sympy.Expr) -> T_expr:
+    """Convert sympy expression into SymEngine expression, representing special functions by undefined functions."""
+    if expr.has(*_SYMPY_TYPE_NAMES):
+        expr = expr.replace(
+            lambda sub_expr: type(sub_expr) in _SYMPY_TYPE_NAMES,
+            lambda match: sympy.Function(_SYMPY_TYPE_NAMES[type(match)])(*_sympy_call_args(match)),
+        )
+    return se.sympify(expr)
+
+
+def _sympy_call_args(expr: sympy.Expr) -> tuple:
+    if isinstance(expr, (sympy.Sum, sympy.Product)):
+        function, (index, start, end) = expr.args
+        return (function, index, start, end)
+    return expr.args
+
+
+def _to_sympy(expr: T_expr) -> sympy.Expr:
+    """Convert SymEngine expression into sympy expression, replacing reserved functions by sympy special functions."""
+    result = sympy.sympify(expr)
+    if any(call.get_name() in SYMPY_FUNCS for call in _calls(expr)):
+        result = result.replace(
+            lambda sub_expr: isinstance(sub_expr, AppliedUndef) and type(sub_expr).__name__ in SYMPY_FUNCS,
+            lambda match: SYMPY_FUNCS[type(match).__name__](*match.args),
+        )
+    return result
+
+
+def _distribute_coefficients(expr: T_expr) -> T_expr:
+    """Distribute rational coefficients over sums, e.g. 2*(x + 1) -> 2*x + 2.
+
+    Sympy does this whenever it creates a product of a rational number and a sum, while SymEngine never does.
+    Without it, expressions like m - n, with m = a + b and n = a - b, wouldn't simplify to 2*b.
+    """
+    if not expr.args:
+        return expr
+    new_expr = expr.func(*map(_distribute_coefficients, expr.args))
+    if isinstance(new_expr, se.Mul) and len(new_expr.args) == 2:
+        coefficient, term = new_expr.args
+        if isinstance(coefficient, se.Rational) and isinstance(term, se.Add):
+            return se.Add(*(coefficient * sub_term for sub_term in term.args))
+    return new_expr
+
+
+def _call_sympy_function(name: str, *args: T_expr) -> T_expr:
+    return _from_sympy(SYMPY_FUNCS[name](*map(_to_sympy, args)))
+
+
+def _evaluate_sympy_functions(expr: T_expr) -> T_expr:
+    """Evaluate special functions whose arguments are numbers, like sympy does."""
+    evaluated_calls = {
+        call: _from_sympy(_to_sympy(call))
+        for call in _calls(expr)
+        if call.get_name() in SYMPY_FUNCS and not call.free_symbols
+    }
+    return expr.subs(evaluated_calls) if evaluated_calls else expr
+
+
+def _replace_calls(expr: T_expr, name: str, replacement: Callable[[T_expr], T_expr]) -> T_expr:
+    """Replace calls of function with given name, starting from the innermost ones."""
+    if not expr.args:
+        return expr
+    new_expr = expr.func(*(_replace_calls(arg, name, replacement) for arg in expr.args))
+    if isinstance(new_expr, se.FunctionSymbol) and new_expr.get_name() == name:
+        return replacement(new_expr)
+    return new_expr
+
+
+def _free_symbols(expr: T_expr) -> set[T_expr]:
+    """Free symbols of an expression, excluding variables bound by sum_over and prod_over."""
+    if isinstance(expr, se.FunctionSymbol) and expr.get_name() in _SEQUENCE_FUNCS:
+        function, index, start, end = expr.args
+        return (_free_symbols(function) - {index}) | _free_symbols(start) | _free_symbols(end)
+    if not expr.args:
+        return expr.free_symbols
+    return set().union(*map(_free_symbols, expr.args))
+
+
+def _substitute_free_symbols(expr: T_expr, substitutions: dict[T_expr, T_expr]) -> T_expr:
+    """Substitute symbols in an expression, leaving variables bound by sum_over and prod_over intact."""
+    if isinstance(expr, se.FunctionSymbol) and expr.get_name() in _SEQUENCE_FUNCS:
+        function, index, start, end = expr.args
+        function_substitutions = {symbol: value for symbol, value in substitutions.items() if symbol != index}
+        return expr.func(
+            _substitute_free_symbols(function, function_substitutions),
+            index,
+            _substitute_free_symbols(start, substitutions),
+            _substitute_free_symbols(end, substitutions),
+        )
+    if not any(call.get_name() in _SEQUENCE_FUNCS for call in _calls(expr)):
+        return expr.subs(substitutions)
+    return expr.func(*(_substitute_free_symbols(arg, substitutions) for arg in expr.args))
+
+
+class SymengineInterpreter(SympyInterpreter):
+    """An interpreter for parsing to SymEngine expressions."""
+
+    # SymEngine expresses x % y in terms of floor, which is not how sympy (and hence bartiq) represents it
+    binary_ops = {ast.Mod: lambda lhs, rhs: _call_sympy_function("Mod", lhs, rhs)}
+
+    @debuggable
+    def create_number(self, tokens):
+        """Return a SymEngine number."""
+        return se.sympify(tokens[0])
+
+    @debuggable
+    def create_parameter(self, tokens):
+        """Return a SymEngine Symbol."""
+        param = tokens[0]
+        if param in SPECIAL_PARAMS:
+            return SPECIAL_PARAMS[param]
+        return se.Symbol(param)
+
+    @debuggable
+    def create_function(self, tokens):
+        """Return a SymEngine function."""
+        name, args = tokens
+
+        # Case 1: if the function has a wildcard, don't evaluate it yet (see SympyInterpreter for details)
+        if _contains_wildcard_arg(args):
+            return se.Function(name)(*args)
+
+        # Case 2: if a known function, use either its SymEngine counterpart or the sympy one
+        if (lower_name := name.lower()) in NATIVE_FUNCS:
+            # Some of them (e.g. sgn) return plain Python numbers
+            return se.sympify(NATIVE_FUNCS[lower_name](*args))
+        if lower_name in _SYMPY_FUNC_NAMES:
+            return _call_sympy_function(_SYMPY_FUNC_NAMES[lower_name], *args)
+
+        # Case 3: if nothing else works, just cast to a generic function
+        return se.Function(name)(*args)
+
+
+def parse_to_symengine(expression: str, debug=False) -> T_expr:
+    """Parse given mathematical expression into a SymEngine expression.
+
+    Args:
+        expression: expression to be parsed.
+        debug: flag indicating if SymengineInterpreter should use debug prints. Defaults to False
+            for performance reasons.
+
+    Returns:
+        A SymEngine expression object parsed from `expression`.
+    """
+    return parse(expression, interpreter=SymengineInterpreter(debug=debug))
+
+
+def _substitute(expr: T_expr, replacements: dict[str, T_expr], free_symbols: set[str]) -> T_expr:
+    substitutions = {
+        se.Symbol(symbol): replacement for symbol, replacement in replacements.items() if symbol in free_symbols
+    }
+    if not substitutions:
+        return expr
+    new_expr = _substitute_free_symbols(expr, substitutions)
+    if any(isinstance(replacement, se.Add) for replacement in substitutions.values()):
+        new_expr = _distribute_coefficients(new_expr)
+    return _evaluate_sympy_functions(new_expr)
+
+
+class SymengineBackend:
+    """Backend for manipulating symbolic expressions with SymEngine.
+
+    The expressions are serialized in the same way as by the sympy backend, hence this backend
+    can be used as a drop-in replacement for it, e.g. ``compile_routine(routine, backend=symengine_backend)``.
+    """
+
+    def __init__(self, parse_function=parse_to_symengine):
+        self.parse = parse_function
+
+    def as_expression(self, value: Union[str, int, float]) -> T_expr:
+        """Convert numerical or textual value into an expression."""
+        if isinstance(value, str):
+            return _distribute_coefficients(self.parse(value))
+        # Like sympify, we leave None as it is, which is relied upon e.g. for ports without sizes
+        return se.sympify(value) if value is not None else value
+
+    def parse_constant(self, expr: T_expr) -> T_expr:
+        """Parse the expression, replacing known constants while ignoring case."""
+        return expr.subs(
+            {
+                se.Symbol(variant): constant
+                for symbol_str, constant in MATH_CONSTANTS.items()
+                for variant in (symbol_str.casefold(), symbol_str.upper(), symbol_str.capitalize())
+            }
+        )
+
+    def free_symbols_in(self, expr: T_expr) -> Iterable[str]:
+        """Return an iterable over free symbol names in given expression."""
+        if any(call.get_name() in _SEQUENCE_FUNCS for call in _calls(expr)):
+            return map(str, _free_symbols(expr))
+        return map(str, expr.free_symbols)
+
+    def functions_in(self, expr: T_expr) -> Iterable[str]:
+        """Returns the (non-built-in) functions referenced in the expression."""
+        return [
+            func_name
+            for call in _calls(expr)
+            if (func_name := call.get_name()) not in self.reserved_functions() and func_name not in SYMPY_FUNCS
+        ]
+
+    def reserved_functions(self) -> Iterable[str]:
+        """Return an iterable over all built-in functions."""
+        return BUILT_IN_FUNCTIONS
+
+    def value_of(self, expr: T_expr) -> Optional[Number]:
+        """Compute a numerical value of an expression, return None if it's not possible."""
+        if isinstance(expr, se.Integer):
+            return int(expr)
+        if any(True for _ in self.free_symbols_in(expr)):
+            return None
+        return sympy_backend.value_of(_to_sympy(expr))
+
+    def substitute(self, expr: T_expr, symbol: str, replacement: Union[T_expr, Number]) -> T_expr:
+        """Substitute occurrences of given symbol with an expression or numerical value."""
+        return self.substitute_all(expr, {symbol: replacement})
+
+    def substitute_all(self, expr: T_expr, substitutions: Mapping[str, Union[T_expr, Number]]) -> T_expr:
+        """Simultaneously substitute occurrences of multiple symbols with expressions or numerical values."""
+        return self.substitute_in_all([expr], substitutions)[0]
+
+    def substitute_in_all(
+        self, exprs: Iterable[T_expr], substitutions: Mapping[str, Union[T_expr, Number]]
+    ) -> list[T_expr]:
+        """Simultaneously substitute occurrences of multiple symbols in each of given expressions."""
+        replacements = {symbol: se.sympify(replacement) for symbol, replacement in substitutions.items()}
+        return [_substitute(expr, replacements, set(self.free_symbols_in(expr))) for expr in exprs]
+
+    def rename_function(self, expr: T_expr, old_name: str, new_name: str) -> T_expr:
+        """Rename all instances of given function call."""
+        if old_name in BUILT_IN_FUNCTIONS:
+            raise BartiqCompilationError(
+                f"Attempted to rename the special function {old_name} (to {new_name}); cannot rename special functions."
+            )
+        if new_name in BUILT_IN_FUNCTIONS:
+            raise BartiqCompilationError(
+                f"Attempted to rename the function {old_name} to the special function {new_name}); "
+                " cannot rename functions to special functions."
+            )
+        if not any(call.get_name() == old_name for call in _calls(expr)):
+            return expr
+        return _replace_calls(expr, old_name, lambda call: se.Function(new_name)(*call.args))
+
+    def define_function(self, expr: T_expr, func_name: str, function: Callable) -> T_expr:
+        """Define an undefined function."""
+        # Catch attempt to define special function names
+        if func_name in BUILT_IN_FUNCTIONS:
+            raise BartiqCompilationError(
+                f"Attempted to redefine the special function {func_name}; cannot " "define special functions."
+            )
+        if not any(call.get_name() == func_name for call in _calls(expr)):
+            return expr
+
+        # Trying to evaluate a function which cannot be evaluated symbolically raises TypeError.
+        # This, however, is expected for certain functions (e.g. with conditions)
+        try:
+            new_expr = _replace_calls(expr, func_name, lambda call: se.sympify(function(*call.args)))
+        except TypeError:
+            return expr
+        return _evaluate_sympy_functions(new_expr)
+
+    def is_constant_int(self, expr: T_expr) -> bool:
+        """Return True if a given expression represents a constant int and False otherwise."""
+        try:
+            int(str(expr))
+            return True
+        except ValueError:
+            return False
+
+    def serialize(self, expr: T_expr) -> str:
+        """Return a textual representation of given expression."""
+        return serialize_expression(_to_sympy(expr))
+
+
+symengine_backend = SymengineBackend()
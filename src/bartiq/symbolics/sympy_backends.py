@@ -18,17 +18,20 @@
 
 from __future__ import annotations
 
+import copyreg
 from functools import singledispatchmethod
-from typing import Callable, Iterable, Optional, Union
+from typing import Callable, Iterable, Mapping, Optional, Union
 
 import sympy
-from sympy import Expr, Function, N, Order, Symbol, symbols, sympify
-from sympy.core.function import AppliedUndef
+from sympy import Expr, Function, Lambda, N, Order, Symbol, symbols, sympify
+from sympy.concrete.expr_with_limits import ExprWithLimits
+from sympy.core.function import AppliedUndef, UndefinedFunction
 from typing_extensions import TypeAlias
 
 from ..compilation.types import Number
 from ..errors import BartiqCompilationError
 from .ast_parser import parse
+from .parse_cache import ParseCache
 from .sympy_interpreter import SPECIAL_FUNCS, SympyInterpreter
 from .sympy_interpreter import parse_to_sympy as legacy_parse_to_sympy
 from .sympy_serializer import serialize_expression
@@ -50,6 +53,18 @@ MATH_CONSTANTS = {
 }
 
 
+def _reduce_undefined_function(function: UndefinedFunction) -> tuple[Callable, tuple[str]]:
+    """Reduce user-defined function to its name, so that expressions using it can be pickled.
+
+    By default, pickle tries to look up the function in its module, which never succeeds for functions
+    created by the parser. Pickling is needed e.g. for sending expressions to worker processes.
+    """
+    return Function, (function.__name__,)
+
+
+copyreg.pickle(UndefinedFunction, _reduce_undefined_function)
+
+
 def parse_to_sympy(expression: str, debug=False) -> T_expr:
     """Parse given mathematical expression into a sympy expression.
 
@@ -63,10 +78,31 @@ def parse_to_sympy(expression: str, debug=False) -> T_expr:
     return parse(expression, interpreter=SympyInterpreter(debug=debug))
 
 
+def _substitute_free_symbols(expr: T_expr, replacements: dict[Symbol, Expr]) -> T_expr:
+    free_symbols = expr.free_symbols
+    replacements = {symbol: replacement for symbol, replacement in replacements.items() if symbol in free_symbols}
+    if not replacements:
+        return expr
+    # Bound variables, like summation indices, may have the same names as free symbols, and xreplace would
+    # replace them too. Expressions binding variables are substituted with subs, which leaves them intact.
+    if expr.has(ExprWithLimits, Lambda):
+        return expr.subs(replacements, simultaneous=True)
+    return expr.xreplace(replacements)
+
+
 class SympyBackend:
+    """Backend for manipulating symbolic expressions with sympy.
+
+    Args:
+        parse_function: function used for parsing strings into sympy expressions.
+        parse_cache: cache of parsed expressions. Defaults to a new LRU cache of default size, and
+            caching can be disabled by passing ``ParseCache(maxsize=0)``. The cache can be inspected
+            with ``backend.parse_cache.info()`` and emptied with ``backend.parse_cache.clear()``.
+    """
 
-    def __init__(self, parse_function=parse_to_sympy):
+    def __init__(self, parse_function=parse_to_sympy, parse_cache: Optional[ParseCache[T_expr]] = None):
         self.parse = parse_function
+        self.parse_cache = parse_cache if parse_cache is not None else ParseCache()
 
     @singledispatchmethod
     def _as_expression(self, value: Union[str | int | float]) -> T_expr:
@@ -74,7 +110,8 @@ class SympyBackend:
 
     @_as_expression.register
     def _parse(self, value: str) -> T_expr:
-        return parse_to_sympy(value)
+        # Sympy expressions are immutable, hence the cached ones can be safely shared
+        return self.parse_cache.get_or_parse(value, self.parse)
 
     def as_expression(self, value: Union[str | int | float]) -> T_expr:
         """Convert numerical or textual value into an expression."""
@@ -127,6 +164,19 @@ class SympyBackend:
         """Substitute occurrences of given symbol with an expression or numerical value."""
         return expr.subs(symbols(symbol), replacement) if symbol in self.free_symbols_in(expr) else expr
 
+    def substitute_all(self, expr: T_expr, substitutions: Mapping[str, Union[T_expr, Number]]) -> T_expr:
+        """Simultaneously substitute occurrences of multiple symbols with expressions or numerical values."""
+        return self.substitute_in_all([expr], substitutions)[0]
+
+    def substitute_in_all(
+        self, exprs: Iterable[T_expr], substitutions: Mapping[str, Union[T_expr, Number]]
+    ) -> list[T_expr]:
+        """Simultaneously substitute occurrences of multiple symbols in each of given expressions."""
+        if not substitutions:
+            return list(exprs)
+        replacements = {Symbol(symbol): sympify(replacement) for symbol, replacement in substitutions.items()}
+        return [_substitute_free_symbols(expr, replacements) for expr in exprs]
+
     def rename_function(self, expr: T_expr, old_name: str, new_name: str) -> T_expr:
         """Rename all instances of given function call."""
         if old_name in BUILT_IN_FUNCTIONS:
@@ -17,14 +17,21 @@ from __future__ import annotations
 import re
 from dataclasses import dataclass, field, replace
 from functools import cached_property
-from typing import Any, Callable, Generic, Optional
+from typing import Any, Callable, Generic, Iterable, Mapping, Optional
 
 from typing_extensions import Self
 
 from ..compilation._utilities import parse_value
 from ..compilation.types import NUMBER_TYPES, Number
 from ..errors import BartiqCompilationError
-from .backend import SymbolicBackend, T_expr
+from .backend import (
+    SymbolicBackend,
+    T_expr,
+    free_symbols_in_all,
+    serialize_all,
+    substitute_all,
+    substitute_in_all,
+)
 
 
 class VariableError(Exception):
@@ -168,11 +175,12 @@ class DependentVariable(Generic[T_expr]):
         """Evaluates the expression over all known variable values and defined functions."""
         # Evaluate all expression variable values
         evaluated_expression = self.expression
-        for expression_symbol, expression_variable in self.expression_variables.items():
-            if expression_variable.value is not None:
-                evaluated_expression = self.backend.substitute(
-                    evaluated_expression, expression_symbol, expression_variable.value
-                )
+        if values := {
+            expression_symbol: expression_variable.value
+            for expression_symbol, expression_variable in self.expression_variables.items()
+            if expression_variable.value is not None
+        }:
+            evaluated_expression = substitute_all(self.backend, evaluated_expression, values)
 
         # Evaluate all functions
         for (
@@ -265,6 +273,14 @@ class DependentVariable(Generic[T_expr]):
 
         return replace(self, expression=new_expression, expression_variables=new_expression_variables)
 
+    def substitute_expressions(self, substitution_map: dict[str, T_expr]) -> Self:
+        """Substitutes subvariables with already parsed expressions.
+
+        Unlike `substitute`, the expressions are not converted to strings and parsed back.
+        All the symbols are substituted simultaneously.
+        """
+        return substitute_expressions_in_all([self], substitution_map)[0]  # type: ignore[return-value]
+
     def substitute_series(self, substitution_map: dict[str, str | Number]) -> Self:
         """Applies a series of substitutions."""
         new_variable = self
@@ -384,6 +400,66 @@ class DependentVariable(Generic[T_expr]):
         )
 
 
+def substitute_expressions_in_all(
+    variables: Iterable[DependentVariable[T_expr]], substitution_map: Mapping[str, T_expr]
+) -> list[DependentVariable[T_expr]]:
+    """Substitutes subvariables with already parsed expressions in each of given dependent variables.
+
+    This is equivalent to calling `DependentVariable.substitute_expressions` on every variable, but
+    the substitutions in all the expressions are delegated to the backend at once.
+
+    Args:
+        variables: dependent variables, all of which have to use the same backend.
+        substitution_map: expressions to be substituted, keyed by the symbols they replace.
+
+    Returns:
+        A list of new dependent variables, in the same order as ``variables``.
+    """
+    new_variables = list(variables)
+    # Deal with trivial case
+    indices = [
+        index
+        for index, variable in enumerate(new_variables)
+        if not substitution_map.keys().isdisjoint(variable.expression_variables)
+    ]
+    if not indices:
+        return new_variables
+
+    backend = new_variables[indices[0]].backend
+    new_expressions = substitute_in_all(
+        backend, [new_variables[index].expression for index in indices], substitution_map
+    )
+    for index, new_expression, free_symbols in zip(
+        indices, new_expressions, free_symbols_in_all(backend, new_expressions)
+    ):
+        variable = new_variables[index]
+        new_variables[index] = replace(
+            variable,
+            expression=new_expression,
+            expression_variables={
+                symbol: variable.expression_variables.get(symbol, IndependentVariable(symbol))
+                for symbol in free_symbols
+            },
+            expression_functions={**variable.expression_functions},
+        )
+    return new_variables
+
+
+def serialize_evaluated_expressions(variables: Iterable[DependentVariable[T_expr]]) -> list[str]:
+    """Returns evaluated expressions of given dependent variables, serializing them all at once.
+
+    Args:
+        variables: dependent variables, all of which have to use the same backend.
+
+    Returns:
+        A list of evaluated expression strings, in the same order as ``variables``.
+    """
+    variables = list(variables)
+    if not variables:
+        return []
+    return serialize_all(variables[0].backend, [variable._evaluate_expression() for variable in variables])
+
+
 def _variable_to_str(
     symbol: str,
     value: Optional[Number],
@@ -0,0 +1,179 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import functools
+import os
+
+import pytest
+import sympy
+
+from bartiq import compile_routine
+from bartiq._routine import Routine
+from bartiq.compilation import CompilationCache, PersistentCompilationCache, _cache
+from bartiq.compilation._cache import ProgramCacheEntry, compute_program_key
+from bartiq.symbolics import sympy_backend
+
+from ..utilities import routine_with_passthrough
+
+
+class _Multiplier:
+    def __init__(self, factor):
+        self.factor = factor
+
+    def __call__(self, x):
+        return self.factor * x
+
+
+def _routine(b_x_value="N**2"):
+    return Routine(
+        name="root",
+        input_params=["N"],
+        resources={"X": {"name": "X", "value": "a.X + b.X", "type": "additive"}},
+        linked_params={"N": [("a", "N"), ("b", "N")]},
+        children={
+            "a": {
+                "name": "a",
+                "input_params": ["N"],
+                "resources": {"X": {"name": "X", "value": "2*N", "type": "additive"}},
+            },
+            "b": {
+                "name": "b",
+                "input_params": ["N"],
+                "resources": {"X": {"name": "X", "value": b_x_value, "type": "additive"}},
+            },
+        },
+    )
+
+
+def test_persistent_cache_reuses_results_compiled_by_other_cache_instance(tmp_path):
+    compile_routine(_routine(), cache=PersistentCompilationCache(tmp_path))
+
+    cache = PersistentCompilationCache(tmp_path)
+    compiled_routine = compile_routine(_routine(), cache=cache)
+
+    assert compiled_routine == compile_routine(_routine())
+    assert (cache.hits, cache.misses) == (3, 0)
+
+
+def test_persistent_cache_recompiles_only_edited_routines(tmp_path):
+    compile_routine(_routine(), cache=PersistentCompilationCache(tmp_path))
+
+    cache = PersistentCompilationCache(tmp_path)
+    compiled_routine = compile_routine(_routine("N**3"), cache=cache)
+
+    assert compiled_routine == compile_routine(_routine("N**3"))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_persistent_cache_evicts_least_recently_used_entries(tmp_path):
+    entry = ProgramCacheEntry({"name": "root"})
+    cache = PersistentCompilationCache(tmp_path, max_size=100_000)
+    for key in ["a", "b", "c"]:
+        cache.put(key, entry)
+    entry_size = (tmp_path / "a.pkl").stat().st_size
+    for time, key in enumerate(["b", "a", "c"]):
+        os.utime(tmp_path / f"{key}.pkl", (time, time))
+
+    cache.max_size = 2 * entry_size
+    cache.put("d", entry)
+
+    assert "b" not in cache
+    assert "a" not in cache
+    assert "c" in cache
+    assert "d" in cache
+
+
+def test_persistent_cache_treats_corrupted_entries_as_missing(tmp_path):
+    cache = PersistentCompilationCache(tmp_path)
+    (tmp_path / "a.pkl").write_bytes(b"not a pickle")
+
+    assert cache.get("a") is None
+
+
+def test_persistent_cache_treats_entries_of_missing_classes_as_missing(tmp_path):
+    cache = PersistentCompilationCache(tmp_path)
+    # Pickle of an instance of bartiq.compilation._cache.RemovedEntry, which doesn't exist
+    (tmp_path / "a.pkl").write_bytes(b"\x80\x04c" + b"bartiq.compilation._cache\nRemovedEntry\n" + b")\x81.")
+    (tmp_path / "b.pkl").write_bytes(b"\x80\x04c" + b"bartiq_removed_module\nEntry\n" + b")\x81.")
+
+    assert cache.get("a") is None
+    assert cache.get("b") is None
+
+
+def _double(x):
+    return 2 * x
+
+
+@pytest.mark.parametrize(
+    "functions_map",
+    [
+        {"f": lambda x: 2 * x},
+        {"f": functools.partial(pow, 2)},
+        {"f": _Multiplier(2)},
+    ],
+)
+def test_compiling_with_functions_without_import_path_does_not_use_cache(functions_map):
+    cache = CompilationCache()
+
+    with pytest.warns(UserWarning, match="Compilation cache is not used"):
+        compile_routine(_routine(), functions_map=functions_map, cache=cache)
+
+    assert len(cache) == 0
+
+
+def test_different_lambdas_do_not_share_cache_entries():
+    cache = CompilationCache()
+    routine = _routine("f(N)")
+
+    with pytest.warns(UserWarning):
+        compile_routine(routine, functions_map={"f": lambda x: 2 * x}, cache=cache)
+    with pytest.warns(UserWarning):
+        compiled_routine = compile_routine(routine, functions_map={"f": lambda x: 3 * x}, cache=cache)
+
+    assert compiled_routine == compile_routine(routine, functions_map={"f": lambda x: 3 * x})
+
+
+def test_importable_functions_are_cached():
+    cache = CompilationCache()
+    compile_routine(_routine("f(N)"), functions_map={"f": _double}, cache=cache)
+
+    compiled_routine = compile_routine(_routine("f(N)"), functions_map={"f": _double}, cache=cache)
+
+    assert compiled_routine == compile_routine(_routine("f(N)"), functions_map={"f": _double})
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_program_key_depends_on_bartiq_and_sympy_versions(monkeypatch):
+    def _key():
+        return compute_program_key(_routine(), sympy_backend, None, None, None, False)
+
+    key = _key()
+    monkeypatch.setattr(_cache, "_BARTIQ_VERSION", "0.0.0")
+    bartiq_key = _key()
+    monkeypatch.setattr(sympy, "__version__", "0.0.0")
+    sympy_key = _key()
+
+    assert len({key, bartiq_key, sympy_key}) == 3
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_compiling_with_cache_does_not_modify_routine(cached):
+    cache = CompilationCache()
+    if cached:
+        compile_routine(routine_with_passthrough(), cache=cache)
+    routine = routine_with_passthrough()
+
+    compile_routine(routine, cache=cache)
+
+    assert routine.model_dump() == routine_with_passthrough().model_dump()
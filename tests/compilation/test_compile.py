@@ -20,6 +20,7 @@ import yaml
 
 from bartiq import compile_routine
 from bartiq._routine import Routine
+from bartiq.compilation import CompilationCache
 from bartiq.compilation._symbolic_function import (
     SymbolicFunction,
     define_expression_functions,
@@ -253,6 +254,29 @@ def test_compile_can_use_arbitrary_functions(routine, functions_map, global_func
         assert target.resources[resource_name].value == value
 
 
+@pytest.mark.filterwarnings("ignore:Found the following issues with the provided routine")
+@pytest.mark.parametrize("routine, expected_routine", COMPILE_TEST_DATA)
+def test_compiling_with_workers_gives_the_same_result_as_compiling_in_single_process(routine, expected_routine):
+    compiled_routine = compile_routine(routine, workers=2)
+    assert compiled_routine == expected_routine
+
+
+@pytest.mark.parametrize(
+    "routine, functions_map, global_functions, expected_resource_values",
+    COMPILE_WITH_ARBITRARY_FUNCTIONS_TEST_CASES,
+)
+def test_compiling_with_workers_can_use_arbitrary_functions(
+    routine, functions_map, global_functions, expected_resource_values
+):
+    compiled_routine = compile_routine(
+        routine, global_functions=global_functions, functions_map=functions_map, workers=2
+    )
+
+    for child, resource_name, value in expected_resource_values:
+        target = compiled_routine if child is None else compiled_routine.children[child]
+        assert target.resources[resource_name].value == value
+
+
 COMPILE_ERRORS_TEST_CASES = [
     # Attempt to back out input size parameter to non-root
     (
@@ -377,3 +401,210 @@ COMPILE_ERRORS_TEST_CASES = [
 def test_compile_errors(routine, expected_error):
     with pytest.raises(BartiqCompilationError, match=re.escape(expected_error)):
         compile_routine(routine, precompilation_stages=[], skip_verification=True)
+
+
+@pytest.mark.filterwarnings("ignore:Found the following issues with the provided routine")
+@pytest.mark.parametrize("routine, expected_routine", COMPILE_TEST_DATA)
+def test_compiling_with_cache_reuses_all_routines_of_unchanged_program(routine, expected_routine):
+    cache = CompilationCache()
+    compile_routine(Routine(**routine.model_dump()), cache=cache)
+    number_of_misses = cache.misses
+
+    compiled_routine = compile_routine(Routine(**routine.model_dump()), cache=cache)
+
+    assert compiled_routine == expected_routine
+    assert cache.misses == number_of_misses
+
+
+def _routine_for_incremental_compilation(a_x_value="2*N"):
+    return Routine(
+        name="root",
+        input_params=["N"],
+        ports={
+            "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+            "out_0": {"name": "out_0", "direction": "output", "size": None},
+        },
+        resources={"X": {"name": "X", "value": "a.X + b.X", "type": "additive"}},
+        linked_params={"N": [("a", "N"), ("b", "N")]},
+        children={
+            "a": {
+                "name": "a",
+                "input_params": ["N"],
+                "ports": {
+                    "in_0": {"name": "in_0", "direction": "input", "size": None},
+                    "out_0": {"name": "out_0", "direction": "output", "size": None},
+                },
+                "resources": {"X": {"name": "X", "value": "a_1.X + a_2.X", "type": "additive"}},
+                "linked_params": {"N": [("a_1", "N"), ("a_2", "N")]},
+                "children": {
+                    "a_1": {
+                        "name": "a_1",
+                        "input_params": ["N"],
+                        "ports": {
+                            "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+                            "out_0": {"name": "out_0", "direction": "output", "size": "K + 1"},
+                        },
+                        "resources": {"X": {"name": "X", "value": a_x_value, "type": "additive"}},
+                    },
+                    "a_2": {
+                        "name": "a_2",
+                        "input_params": ["N"],
+                        "ports": {
+                            "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+                            "out_0": {"name": "out_0", "direction": "output", "size": "2*K"},
+                        },
+                        "resources": {"X": {"name": "X", "value": "N + K", "type": "additive"}},
+                    },
+                },
+                "connections": [
+                    {"source": "in_0", "target": "a_1.in_0"},
+                    {"source": "a_1.out_0", "target": "a_2.in_0"},
+                    {"source": "a_2.out_0", "target": "out_0"},
+                ],
+            },
+            "b": {
+                "name": "b",
+                "input_params": ["N"],
+                "resources": {"X": {"name": "X", "value": "N**2", "type": "additive"}},
+            },
+        },
+        connections=[
+            {"source": "in_0", "target": "a.in_0"},
+            {"source": "a.out_0", "target": "out_0"},
+        ],
+    )
+
+
+def test_incremental_compilation_recompiles_only_edited_routine_and_its_ancestors():
+    cache = CompilationCache()
+    compile_routine(_routine_for_incremental_compilation(), cache=cache)
+    assert (cache.hits, cache.misses) == (0, 5)
+
+    compiled_routine = compile_routine(_routine_for_incremental_compilation("3*N + K"), cache=cache)
+
+    # Only a.a_1, a and root should be compiled again
+    assert (cache.hits, cache.misses) == (2, 8)
+    assert compiled_routine == compile_routine(_routine_for_incremental_compilation("3*N + K"))
+
+
+def test_incremental_compilation_recompiles_everything_when_register_sizes_change():
+    cache = CompilationCache()
+    compile_routine(_routine_for_incremental_compilation(), cache=cache)
+
+    routine = _routine_for_incremental_compilation()
+    routine.children["a"].children["a_2"].ports["out_0"].size = "3*K"
+    compiled_routine = compile_routine(routine, cache=cache)
+
+    assert (cache.hits, cache.misses) == (0, 10)
+    routine = _routine_for_incremental_compilation()
+    routine.children["a"].children["a_2"].ports["out_0"].size = "3*K"
+    assert compiled_routine == compile_routine(routine)
+
+
+def test_incremental_compilation_can_use_workers():
+    cache = CompilationCache()
+    compile_routine(_routine_for_incremental_compilation(), cache=cache, workers=2)
+
+    compiled_routine = compile_routine(_routine_for_incremental_compilation("3*N + K"), cache=cache, workers=2)
+
+    assert (cache.hits, cache.misses) == (2, 8)
+    assert compiled_routine == compile_routine(_routine_for_incremental_compilation("3*N + K"))
+
+
+def _repeated_block(name):
+    return {
+        "name": name,
+        "input_params": ["N"],
+        "ports": {
+            "in_0": {"name": "in_0", "direction": "input", "size": None},
+            "out_0": {"name": "out_0", "direction": "output", "size": None},
+        },
+        "resources": {"X": {"name": "X", "value": "a.X + b.X", "type": "additive"}},
+        "linked_params": {"N": [("a", "N"), ("b", "N")]},
+        "children": {
+            "a": {
+                "name": "a",
+                "input_params": ["N"],
+                "ports": {
+                    "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+                    "out_0": {"name": "out_0", "direction": "output", "size": "K + N"},
+                },
+                "resources": {"X": {"name": "X", "value": "N*K", "type": "additive"}},
+            },
+            "b": {
+                "name": "b",
+                "input_params": ["N"],
+                "ports": {
+                    "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+                    "out_0": {"name": "out_0", "direction": "output", "size": "2*K"},
+                },
+                "resources": {"X": {"name": "X", "value": "K + 1", "type": "additive"}},
+            },
+        },
+        "connections": [
+            {"source": "in_0", "target": "a.in_0"},
+            {"source": "a.out_0", "target": "b.in_0"},
+            {"source": "b.out_0", "target": "out_0"},
+        ],
+    }
+
+
+def _routine_with_repeated_subroutines(linked_params):
+    return Routine(
+        name="root",
+        input_params=["N", "M"],
+        ports={
+            "in_0": {"name": "in_0", "direction": "input", "size": "L"},
+            "out_0": {"name": "out_0", "direction": "output", "size": None},
+        },
+        resources={"X": {"name": "X", "value": "c_0.X + c_1.X + c_2.X", "type": "additive"}},
+        linked_params=linked_params,
+        children={f"c_{i}": _repeated_block(f"c_{i}") for i in range(3)},
+        connections=[
+            {"source": "in_0", "target": "c_0.in_0"},
+            {"source": "c_0.out_0", "target": "c_1.in_0"},
+            {"source": "c_1.out_0", "target": "c_2.in_0"},
+            {"source": "c_2.out_0", "target": "out_0"},
+        ],
+    )
+
+
+@pytest.mark.filterwarnings("ignore:Found the following issues with the provided routine")
+@pytest.mark.parametrize("workers", [None, 2])
+@pytest.mark.parametrize(
+    "linked_params, expected_params",
+    [
+        ({"N": [("c_0", "N"), ("c_1", "N")], "M": [("c_2", "N")]}, ["N", "N", "M"]),
+        ({"N": [("c_1", "N")], "M": [("c_0", "N"), ("c_2", "N")]}, ["M", "N", "M"]),
+    ],
+)
+def test_compiling_repeated_subroutines_gives_results_specific_to_each_copy(linked_params, expected_params, workers):
+    compiled_routine = compile_routine(_routine_with_repeated_subroutines(linked_params), workers=workers)
+
+    input_sizes = ["L", "K", "K"]
+    for i, (param, size) in enumerate(zip(expected_params, input_sizes)):
+        child = compiled_routine.children[f"c_{i}"]
+        assert child.input_params == [param]
+        assert child.ports["in_0"].size == size
+        assert child.ports["out_0"].size == BACKEND.serialize(BACKEND.as_expression(f"2*{size} + 2*{param}"))
+        assert child.resources["X"].value == BACKEND.serialize(
+            BACKEND.as_expression(f"{size}*{param} + {size} + {param} + 1")
+        )
+        assert child.children["a"].resources["X"].value == BACKEND.serialize(BACKEND.as_expression(f"{param}*{size}"))
+
+
+@pytest.mark.filterwarnings("ignore:Found the following issues with the provided routine")
+def test_compiling_repeated_subroutines_with_cache_gives_the_same_result():
+    linked_params = {"N": [("c_0", "N"), ("c_1", "N")], "M": [("c_2", "N")]}
+    cache = CompilationCache()
+    compile_routine(_routine_with_repeated_subroutines(linked_params), cache=cache)
+    routine = _routine_with_repeated_subroutines(linked_params)
+    routine.children["c_1"].children["b"].resources["X"].value = "3*K"
+
+    compiled_routine = compile_routine(routine, cache=cache)
+
+    assert compiled_routine.children["c_1"].children["b"].resources["X"].value == "3*K"
+    assert compiled_routine.children["c_2"].children["b"].resources["X"].value == "K + 1"
+    routine = _routine_with_repeated_subroutines(linked_params)
+    routine.children["c_1"].children["b"].resources["X"].value = "3*K"
+    assert compiled_routine == compile_routine(routine)
@@ -216,10 +216,11 @@ MERGE_FUNCTIONS_TEST_CASES = [
         (["a"], {"c": "g(a)", "d": "h(f(a))"}),
     ),
     # Automatic simplification (woooooahhh!)
-    (
+    pytest.param(
         (["x"], {"y": "log(x)"}),
         (["y"], {"z": "exp(y)"}),
         (["x"], {"z": "x"}),
+        marks=pytest.mark.sympy_only,
     ),
     # Allow for merged functions to take same inputs
     (
@@ -325,6 +326,23 @@ COMPILE_FUNCTIONS_TEST_CASES = [
             {"d": "a000 + a001 + a010 + a011 + a100 + a101 + a110 + a111"},
         ),
     ),
+    # Intermediate variable is consumed only by the first function referencing it
+    (
+        [
+            (["a"], {"b": "2*a"}),
+            (["b"], {"c": "b + 1"}),
+            (["b"], {"d": "b + 2"}),
+        ],
+        (["a", "b"], {"c": "2*a + 1", "d": "b + 2"}),
+    ),
+    # Unconsumed outputs of different functions with the same expression are merged
+    (
+        [
+            (["a"], {"x": "0", "b": "a + 1"}),
+            (["b"], {"x": "0", "c": "b**2"}),
+        ],
+        (["a"], {"x": "0", "c": "(a + 1)**2"}),
+    ),
 ]
 
 
@@ -336,6 +354,15 @@ def test_compile_functions(functions, expected_function, backend):
     assert compile_functions(functions) == expected_function
 
 
+def test_compile_functions_lists_outputs_of_later_functions_first(backend):
+    functions = [
+        SymbolicFunction.assemble(["a"], {"b": "a + 1", "x": "a"}, backend),
+        SymbolicFunction.assemble(["b"], {"y": "b", "z": "2*b"}, backend),
+    ]
+
+    assert list(compile_functions(functions).outputs) == ["y", "z", "x"]
+
+
 RENAME_VARIABLES_TEST_CASES = [
     # Null case
     (
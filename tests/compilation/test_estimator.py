@@ -0,0 +1,152 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import pickle
+import re
+import subprocess
+import sys
+
+import pytest
+
+from bartiq.compilation import compile_estimator
+from bartiq.errors import BartiqCompilationError
+
+from ..utilities import (
+    SPECIAL_FUNCTION_EXPRESSIONS,
+    conditional_function,
+    evaluate_at,
+    routine_with_resources,
+)
+from .test_compile import COMPILE_TEST_DATA
+
+
+def _assert_matches_evaluate(routine, values, **kwargs):
+    estimate = compile_estimator(routine, **kwargs)(**values)
+
+    evaluated_routine = evaluate_at(routine, values, **kwargs)
+    expected = {name: resource.value for name, resource in evaluated_routine.resources.items()}
+    expected.update({f"#{name}": port.size for name, port in evaluated_routine.output_ports.items()})
+    assert estimate.keys() == expected.keys()
+    for name, value in estimate.items():
+        assert value == pytest.approx(float(expected[name]))
+
+
+@pytest.mark.parametrize("routine", [expected_routine for _, expected_routine in COMPILE_TEST_DATA[:3]])
+def test_estimator_gives_the_same_results_as_evaluate(routine):
+    estimator = compile_estimator(routine)
+    _assert_matches_evaluate(routine, {name: i + 2 for i, name in enumerate(estimator.inputs)})
+
+
+@pytest.mark.parametrize("value", SPECIAL_FUNCTION_EXPRESSIONS)
+def test_estimator_supports_special_functions(value):
+    _assert_matches_evaluate(routine_with_resources(with_ports=True, X=value), {"N": 12, "M": 5, "K": 3})
+
+
+def test_estimator_does_not_substitute_bound_variables_with_the_same_names_as_parameters():
+    routine = routine_with_resources(with_ports=True, X="sum_over(M**2, M, 1, N) + M")
+
+    assert compile_estimator(routine)(N=4, M=3, K=1)["X"] == 33
+    _assert_matches_evaluate(routine, {"N": 4, "M": 3, "K": 1})
+
+
+def test_estimator_uses_functions_map():
+    routine = routine_with_resources(with_ports=True, X="root.f(N, M) + 1")
+    estimator = compile_estimator(routine, functions_map={"root.f": conditional_function})
+
+    assert estimator(N=1, M=5, K=0)["X"] == -3
+    assert estimator(N=3, M=5, K=0)["X"] == 9
+
+
+def test_estimator_eliminates_common_subexpressions():
+    estimator = compile_estimator(routine_with_resources(with_ports=True, X="sqrt(N + M) * K", Y="sqrt(N + M) + 1"))
+
+    assert estimator.source.count("math.sqrt") == 1
+    assert estimator(N=3, M=1, K=5) == {"X": 10.0, "Y": 3.0, "#out_0": 13}
+
+
+def test_estimator_can_be_pickled():
+    routine = routine_with_resources(with_ports=True, X="root.f(N, M) + log2(K)")
+    estimator = compile_estimator(routine, functions_map={"root.f": conditional_function})
+
+    unpickled_estimator = pickle.loads(pickle.dumps(estimator))
+
+    assert unpickled_estimator(N=3, M=2, K=4) == estimator(N=3, M=2, K=4) == {"X": 7.0, "#out_0": 11}
+
+
+def test_source_of_estimator_does_not_depend_on_sympy():
+    estimator = compile_estimator(routine_with_resources(with_ports=True, X="round(N / 3) + multiplicity(2, M)"))
+    namespace = {}
+
+    exec(estimator.source, namespace)
+
+    assert "sympy" not in estimator.source
+    assert namespace["_estimate"]({"N": 7, "M": 12, "K": 1}, {}) == (4, 9)
+    assert math.isinf(namespace["_multiplicity"](2, 0))
+
+
+@pytest.mark.parametrize(
+    "value, expected_error",
+    [
+        ("root.f(N)", "Cannot compile estimator, since functions ['root.f'] are not defined."),
+        ("N + a.L", "Cannot compile estimator, since expressions depend on unknown ['a.L']."),
+    ],
+)
+def test_compiling_estimator_for_unsupported_expressions_raises_error(value, expected_error):
+    with pytest.raises(BartiqCompilationError, match=re.escape(expected_error)):
+        compile_estimator(routine_with_resources(with_ports=True, X=value))
+
+
+def test_calling_estimator_without_some_parameters_raises_error():
+    estimator = compile_estimator(routine_with_resources(with_ports=True, X="N + M"))
+
+    with pytest.raises(BartiqCompilationError, match=re.escape("No value was given for parameter M")):
+        estimator(N=1, K=2)
+
+
+def test_estimator_can_be_saved_as_module_importable_without_bartiq(tmp_path):
+    estimator = compile_estimator(
+        routine_with_resources(with_ports=True, X="round(N / 3) + sqrt(N + M)", Y="sqrt(N + M)")
+    )
+    estimator.save_module(tmp_path / "estimator.py")
+    script = (
+        "import sys, estimator; "
+        "assert not {'bartiq', 'sympy', 'pydantic'} & set(sys.modules); "
+        "print(estimator.estimate(N=3, M=1, K=2))"
+    )
+
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == str(estimator(N=3, M=1, K=2))
+
+
+def test_module_generated_from_estimator_imports_functions_from_functions_map(tmp_path, monkeypatch):
+    routine = routine_with_resources(with_ports=True, X="root.f(N, M) + 1")
+    estimator = compile_estimator(routine, functions_map={"root.f": math.hypot})
+    estimator.save_module(tmp_path / "estimator_with_functions.py")
+    monkeypatch.syspath_prepend(tmp_path)
+
+    import estimator_with_functions
+
+    assert estimator_with_functions.INPUTS == ("N", "M", "K")
+    assert estimator_with_functions.estimate(N=3, M=4, K=0) == {"X": 6.0, "#out_0": 3}
+
+
+def test_module_cannot_be_generated_for_functions_which_cannot_be_imported():
+    estimator = compile_estimator(
+        routine_with_resources(with_ports=True, X="root.f(N)"), functions_map={"root.f": lambda x: x}
+    )
+
+    with pytest.raises(BartiqCompilationError, match="Cannot import function .*<lambda> used as root.f"):
+        estimator.to_module_source()
@@ -20,7 +20,8 @@ import yaml
 
 from bartiq import compile_routine, evaluate
 from bartiq._routine import Routine
-from bartiq.integrations.qref import qref_to_bartiq
+from bartiq.compilation import EvaluationPlan
+from bartiq.integrations.qref import bartiq_to_qref, qref_to_bartiq
 
 from ..utilities import routine_with_passthrough, routine_with_two_passthroughs
 
@@ -182,3 +183,91 @@ def test_compile_and_evaluate_double_factorization_routine():
 
     for resource_name in expected_resources:
         assert expected_resources[resource_name] == int(evaluated_routine.resources[resource_name].value)
+
+
+@pytest.mark.filterwarnings("ignore:Found the following issues with the provided routine")
+@pytest.mark.parametrize("input_dict, assignments, expected_dict", EVALUTE_TEST_CASES)
+def test_evaluation_plan_gives_the_same_results_as_evaluate(input_dict, assignments, expected_dict, backend):
+    plan = EvaluationPlan(Routine(**input_dict), backend=backend)
+    assert plan.evaluate(assignments) == plan.evaluate(assignments) == Routine(**expected_dict)
+
+
+def test_evaluation_plan_can_be_reused_for_different_assignments(backend):
+    compiled_routine = compile_routine(routine_with_two_passthroughs())
+    plan = EvaluationPlan(compiled_routine, backend=backend)
+
+    for n, m in [(10, 7), (3, 4), (1, 1)]:
+        assignments = [f"N={n}", f"M={m}"]
+        assert plan.evaluate(assignments) == evaluate(compiled_routine, assignments, backend=backend)
+
+
+def test_evaluation_plan_is_not_affected_by_modifying_routine(backend):
+    compiled_routine = compile_routine(routine_with_passthrough(a_out_size="N+2"))
+    plan = EvaluationPlan(compiled_routine, backend=backend)
+    expected_routine = evaluate(compiled_routine, ["N=10"], backend=backend)
+
+    compiled_routine.ports["out_0"].size = "N+3"
+    evaluated_routine = plan.evaluate(["N=10"])
+
+    assert evaluated_routine == expected_routine
+    assert plan.evaluate(["N=10"]) == expected_routine
+
+
+def test_evaluating_all_assignments_at_once_gives_the_same_result_as_evaluating_them_one_by_one(backend):
+    compiled_routine = compile_routine(routine_with_two_passthroughs())
+    assignments = ["N=10", "M=7"]
+
+    evaluated_routine = compiled_routine
+    for assignment in assignments:
+        evaluated_routine = evaluate(evaluated_routine, [assignment], backend=backend)
+
+    assert evaluate(compiled_routine, assignments, backend=backend) == evaluated_routine
+
+
+def test_bound_variables_are_not_substituted_even_if_they_have_the_same_names_as_parameters(backend):
+    routine = Routine(
+        name="root",
+        type=None,
+        input_params=["N", "i"],
+        resources={"a": {"name": "a", "type": "additive", "value": "sum_over(i**2, i, 1, N) + i"}},
+    )
+
+    evaluated_routine = evaluate(compile_routine(routine, backend=backend), ["N=4", "i=3"], backend=backend)
+
+    assert int(evaluated_routine.resources["a"].value) == 33
+
+
+def _routine_with_ports_and_resources():
+    return Routine(
+        name="root",
+        type=None,
+        input_params=["N"],
+        ports={
+            "in": {"name": "in", "direction": "input", "size": "N"},
+            "out": {"name": "out", "direction": "output", "size": None},
+        },
+        children={
+            "a": {
+                "name": "a",
+                "type": None,
+                "ports": {
+                    "in": {"name": "in", "direction": "input", "size": "N"},
+                    "out": {"name": "out", "direction": "output", "size": "2*N"},
+                },
+                "resources": {"T_gates": {"name": "T_gates", "type": "additive", "value": "N**2"}},
+            }
+        },
+        connections=[{"source": "in", "target": "a.in"}, {"source": "a.out", "target": "out"}],
+    )
+
+
+@pytest.mark.filterwarnings("error::UserWarning")
+@pytest.mark.parametrize(
+    "routine",
+    [_routine_with_ports_and_resources(), qref_to_bartiq(bartiq_to_qref(_routine_with_ports_and_resources()))],
+)
+def test_compiling_and_evaluating_routine_emits_no_warnings(routine):
+    evaluated_routine = evaluate(compile_routine(routine), ["N=10"])
+
+    evaluated_routine.model_dump()
+    evaluated_routine.model_dump_json()
@@ -0,0 +1,140 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+import pytest
+
+from bartiq import compile_routine
+from bartiq._routine import Routine
+from bartiq.errors import BartiqCompilationError
+
+from ..utilities import (
+    SPECIAL_FUNCTION_EXPRESSIONS,
+    conditional_function,
+    evaluate_at,
+    routine_with_resources,
+    routine_with_two_passthroughs,
+)
+
+np = pytest.importorskip("numpy")
+
+from bartiq.compilation import evaluate_grid  # noqa: E402
+
+
+def _chained_routine():
+    return Routine(
+        name="root",
+        input_params=["N"],
+        ports={
+            "in_0": {"name": "in_0", "direction": "input", "size": "L"},
+            "out_0": {"name": "out_0", "direction": "output", "size": None},
+        },
+        resources={"X": {"name": "X", "value": "a.X + b.X", "type": "additive"}},
+        linked_params={"N": [("a", "N"), ("b", "N")]},
+        children={
+            "a": {
+                "name": "a",
+                "input_params": ["N"],
+                "ports": {
+                    "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+                    "out_0": {"name": "out_0", "direction": "output", "size": "K + N"},
+                },
+                "resources": {"X": {"name": "X", "value": "N*K", "type": "additive"}},
+            },
+            "b": {
+                "name": "b",
+                "input_params": ["N"],
+                "ports": {
+                    "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+                    "out_0": {"name": "out_0", "direction": "output", "size": "2*K"},
+                },
+                "resources": {"X": {"name": "X", "value": "ceil(log2(K))", "type": "additive"}},
+            },
+        },
+        connections=[
+            {"source": "in_0", "target": "a.in_0"},
+            {"source": "a.out_0", "target": "b.in_0"},
+            {"source": "b.out_0", "target": "out_0"},
+        ],
+    )
+
+
+def _assert_matches_evaluate(routine, grid, assignments, **kwargs):
+    names = list(assignments)
+    values = np.broadcast_arrays(*assignments.values())
+    for index in np.ndindex(*values[0].shape):
+        point = {name: value[index] for name, value in zip(names, values)}
+        evaluated_routine = evaluate_at(routine, point, **kwargs)
+        for subroutine in evaluated_routine.walk():
+            for name, resource in subroutine.resources.items():
+                assert grid[subroutine.absolute_path()][name][index] == pytest.approx(float(resource.value))
+
+
+def test_evaluating_grid_gives_the_same_results_as_evaluating_each_point():
+    compiled_routine = compile_routine(_chained_routine())
+    n_values, l_values = np.meshgrid(np.arange(1, 6), np.arange(1, 4))
+
+    grid = evaluate_grid(compiled_routine, {"N": n_values, "L": l_values})
+
+    assert set(grid) == {"root", "root.a", "root.b"}
+    assert grid["root"]["X"].shape == (3, 5)
+    _assert_matches_evaluate(compiled_routine, grid, {"N": n_values, "L": l_values})
+
+
+def test_evaluating_grid_broadcasts_scalars():
+    compiled_routine = compile_routine(routine_with_two_passthroughs())
+
+    grid = evaluate_grid(compiled_routine, {"N": np.arange(4), "M": 7})
+
+    for resources in grid.values():
+        for values in resources.values():
+            assert values.shape == (4,)
+
+
+@pytest.mark.parametrize("value", SPECIAL_FUNCTION_EXPRESSIONS)
+def test_evaluating_grid_supports_special_functions(value):
+    routine = routine_with_resources(X=value)
+    assignments = {"N": np.arange(1, 9), "M": np.arange(8, 0, -1)}
+
+    grid = evaluate_grid(routine, assignments)
+
+    _assert_matches_evaluate(routine, grid, assignments)
+
+
+def test_evaluating_grid_uses_functions_map():
+    routine = routine_with_resources(X="root.f(N, M) + root.g(N)")
+    functions_map = {"root.f": conditional_function, "root.g": np.exp2}
+    assignments = {"N": np.arange(5), "M": 3}
+
+    grid = evaluate_grid(routine, assignments, functions_map=functions_map)
+
+    np.testing.assert_allclose(grid["root"]["X"], [-3, -2, -1, 6, 7] + np.exp2(np.arange(5)))
+
+
+def test_evaluating_grid_with_unknown_variable_raises_error():
+    with pytest.raises(BartiqCompilationError, match="Cannot set unknown variable K"):
+        evaluate_grid(routine_with_resources(X="N"), {"K": np.arange(3)})
+
+
+@pytest.mark.parametrize(
+    "value, functions_map, expected_error",
+    [
+        ("N + M", None, "Cannot evaluate resource X of root, since no values were assigned to ['M']."),
+        ("root.f(N)", None, "Cannot evaluate resource X of root, since functions ['root.f'] are not defined."),
+    ],
+)
+def test_evaluating_grid_with_missing_values_or_functions_raises_error(value, functions_map, expected_error):
+    with pytest.raises(BartiqCompilationError, match=re.escape(expected_error)):
+        evaluate_grid(routine_with_resources(X=value), {"N": np.arange(3)}, functions_map=functions_map)
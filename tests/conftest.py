@@ -16,13 +16,23 @@ import pytest
 import pytest_diff
 
 from bartiq.compilation._symbolic_function import SymbolicFunction
-from bartiq.symbolics import sympy_backend
+from bartiq.symbolics import polynomial_backend, sympy_backend
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "sympy_only: test case relies on simplifications performed only by sympy")
 
 
 # To add more backends to tests, simply parametrize this fixture.
-@pytest.fixture
-def backend():
+@pytest.fixture(params=["sympy", "symengine", "polynomial"])
+def backend(request):
     """Backend used for manipulating symbolic expressions."""
+    if request.param == "symengine":
+        if request.node.get_closest_marker("sympy_only"):
+            pytest.skip("Test case relies on simplifications performed only by sympy.")
+        return pytest.importorskip("bartiq.symbolics.symengine_backend").symengine_backend
+    if request.param == "polynomial":
+        return polynomial_backend
     return sympy_backend
 
 
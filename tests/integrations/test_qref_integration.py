@@ -16,7 +16,7 @@ import pytest
 from pytest import fixture
 
 from bartiq import Port, Routine
-from bartiq.integrations import bartiq_to_qref, qref_to_bartiq
+from bartiq.integrations import bartiq_to_qref, qref_to_bartiq, qref_to_routine_graph
 
 # Note: fixture example_routine has to be synced with
 # the example_schema_v1 fixture further in this module.
@@ -141,6 +141,12 @@ def test_converting_qref_v1_object_to_routine_give_correct_output(example_routin
     assert qref_to_bartiq(example_serialized_qref_v1_object) == example_routine
 
 
+def test_converting_qref_v1_object_to_routine_graph_gives_correct_output(
+    example_routine, example_serialized_qref_v1_object
+):
+    assert qref_to_routine_graph(example_serialized_qref_v1_object).to_routine() == example_routine
+
+
 def test_conversion_from_bartiq_to_qref_raises_an_error_if_version_is_unsupported(example_routine):
     with pytest.raises(ValueError):
         bartiq_to_qref(example_routine, version="v3")
@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pickle
+
 import pytest
+from qref.schema_v1 import NAME_PATTERN as QREF_NAME_PATTERN
 
-from bartiq._routine import Routine
+from bartiq._routine import NAME_PATTERN, Connection, Resource, Routine
 
 
 class TestFindingChildren:
@@ -50,6 +53,20 @@ class TestFindingChildren:
             root.find_descendant(selector)
             assert selector in str(err_info.errisinstance)
 
+    def test_descendants_can_be_found_after_children_are_modified(self):
+        routine_a = Routine(name="a", type=None, children={"b": Routine(name="b", type=None)})
+        root = Routine(name="root", children={"a": routine_a}, type=None)
+        assert root.find_descendant("a.b") is routine_a.children["b"]
+
+        routine_c = Routine(name="c", type=None, parent=routine_a)
+        routine_a.children["c"] = routine_c
+        del routine_a.children["b"]
+
+        assert root.find_descendant("a.c") is routine_c
+        assert routine_a.find_descendant("c") is routine_c
+        with pytest.raises(ValueError):
+            root.find_descendant("a.b")
+
 
 class TestFindingRelativePathFromAncestor:
     def test_can_find_correct_path_from_direct_parent(self):
@@ -96,6 +113,37 @@ class TestGettingAbsolutePath:
         assert parent.absolute_path() == "root"
         assert parent.absolute_path(exclude_root_name=True) == ""
 
+    def test_absolute_path_changes_after_ancestor_is_renamed(self):
+        child = Routine(name="child", type=None)
+        root = Routine(name="root", type=None, children={"a": Routine(name="a", type=None, children={"child": child})})
+        assert child.absolute_path() == "root.a.child"
+
+        root.children["a"].name = "b"
+        root.name = "new_root"
+
+        assert child.absolute_path() == "new_root.b.child"
+        assert child.absolute_path(exclude_root_name=True) == "b.child"
+
+    def test_absolute_path_changes_after_routine_is_moved_to_other_parent(self):
+        child = Routine(name="child", type=None)
+        root_1 = Routine(name="root_1", type=None, children={"child": child})
+        assert child.absolute_path() == "root_1.child"
+
+        Routine(name="root_2", type=None, children={"child": child})
+
+        assert child.absolute_path() == "root_2.child"
+        assert root_1.absolute_path() == "root_1"
+
+    def test_absolute_path_of_port_contains_path_of_its_parent(self):
+        child = Routine(name="child", type=None, ports={"in_0": {"name": "in_0", "direction": "input", "size": 1}})
+        root = Routine(name="root", type=None, ports={"in_0": {"name": "in_0", "direction": "input", "size": 1}})
+        root.children = {"child": child}
+        child.parent = root
+
+        assert child.ports["in_0"].absolute_path() == "root.child.#in_0"
+        assert child.ports["in_0"].absolute_path(exclude_root_name=True) == "child.#in_0"
+        assert root.ports["in_0"].absolute_path(exclude_root_name=True) == "#in_0"
+
 
 class TestRoutineEquality:
     def _example_routine(self):
@@ -162,6 +210,82 @@ class TestRoutineEquality:
 
         assert routine_1 != routine_2
 
+    def test_equal_routines_have_equal_structural_hashes(self):
+        routine_1 = self._example_routine()
+        routine_2 = pickle.loads(pickle.dumps(routine_1))
+
+        assert routine_1.structural_hash() == routine_2.structural_hash()
+        assert routine_1.structural_hash() != routine_1.children["child_1"].structural_hash()
+
+    @pytest.mark.parametrize(
+        "modify",
+        [
+            lambda routine: setattr(routine.children["child_1"], "type", "other_type"),
+            lambda routine: setattr(routine.children["child_2"].ports["in_0"], "size", 3),
+            lambda routine: routine.children["child_2"].ports["in_0"].meta.update(x=1),
+            lambda routine: routine.children["child_2"].resources.update(
+                T=Resource(name="T", type="additive", value=1)
+            ),
+            lambda routine: routine.children.pop("child_1"),
+            lambda routine: routine.connections.append(
+                Connection(source=routine.children["child_1"].ports["out_0"], target=routine.ports["in_0"])
+            ),
+            lambda routine: routine.input_params.append("N"),
+            lambda routine: routine.local_variables.update(M="N + 1"),
+            lambda routine: routine.linked_params.update(N=[("child_1", "N")]),
+            lambda routine: routine.meta.update(x=1),
+        ],
+    )
+    def test_routines_are_not_equal_after_one_of_them_is_modified(self, modify):
+        routine_1 = self._example_routine()
+        routine_2 = self._example_routine()
+        assert routine_1 == routine_2
+
+        modify(routine_2)
+
+        assert routine_1 != routine_2
+        assert routine_1.structural_hash() != routine_2.structural_hash()
+
+    def _routine_with_nested_values(self):
+        routine = Routine(
+            **self._example_routine().model_dump(exclude={"meta", "linked_params"}),
+            meta={"x": {"y": 1, "z": [1]}},
+            linked_params={"N": [("child_1", "N")]},
+        )
+        routine.children["child_1"].ports["in_0"].meta = {"x": {"y": 1}}
+        return routine
+
+    @pytest.mark.parametrize(
+        "modify",
+        [
+            lambda routine: routine.meta["x"].update(y=2),
+            lambda routine: routine.meta["x"]["z"].append(2),
+            lambda routine: routine.meta["x"].setdefault("w", []).append(1),
+            lambda routine: routine.linked_params["N"].append(("child_2", "N")),
+            lambda routine: routine.children["child_1"].ports["in_0"].meta["x"].update(y=2),
+        ],
+    )
+    def test_routines_are_not_equal_after_value_nested_in_one_of_them_is_modified(self, modify):
+        routine_1 = self._routine_with_nested_values()
+        routine_2 = self._routine_with_nested_values()
+        assert routine_1 == routine_2
+
+        modify(routine_2)
+
+        assert routine_1 != routine_2
+        assert routine_1.structural_hash() != routine_2.structural_hash()
+
+    def test_routine_is_equal_to_its_copy_after_the_same_modification(self):
+        routine_1 = self._example_routine()
+        routine_2 = self._example_routine()
+        assert routine_1 == routine_2
+
+        routine_1.children["child_1"].ports["in_0"].size = 7
+        assert routine_1 != routine_2
+        routine_2.children["child_1"].ports["in_0"].size = 7
+
+        assert routine_1 == routine_2
+
 
 def _dummy_routine_dict(name):
     return {
@@ -335,3 +459,49 @@ class TestRoutineWalkRespectsDepthFirstTopologicalOrder:
         visited_names = [op.name for op in root.walk()]
 
         assert visited_names == ["child", "root"]
+
+    def test_walk_order_is_updated_after_connections_are_modified(self):
+        root = Routine(
+            **_dummy_routine_dict("root"),
+            children={name: _dummy_routine_dict(name) for name in ("a", "b")},
+            connections=[{"source": "a.out_0", "target": "b.in_0"}],
+        )
+        assert [op.name for op in root.walk()] == ["a", "b", "root"]
+
+        root.connections[0] = Connection(
+            source=root.children["b"].ports["out_0"], target=root.children["a"].ports["in_0"], parent=root
+        )
+
+        assert [op.name for op in root.walk()] == ["b", "a", "root"]
+
+    def test_walk_order_is_updated_after_children_are_modified(self):
+        root = Routine(
+            **_dummy_routine_dict("root"),
+            children={name: _dummy_routine_dict(name) for name in ("a", "b")},
+            connections=[{"source": "a.out_0", "target": "b.in_0"}],
+        )
+        list(root.walk())
+
+        new_child = Routine(**_dummy_routine_dict("c"), parent=root)
+        root.children["c"] = new_child
+        root.connections.append(
+            Connection(source=root.children["b"].ports["out_0"], target=new_child.ports["in_0"], parent=root)
+        )
+
+        assert [op.name for op in root.walk()] == ["a", "b", "c", "root"]
+
+    def test_walk_order_of_copied_routine_contains_copied_children(self):
+        root = Routine(
+            **_dummy_routine_dict("root"),
+            children={name: _dummy_routine_dict(name) for name in ("a", "b")},
+            connections=[{"source": "a.out_0", "target": "b.in_0"}],
+        )
+        list(root.walk())
+
+        copied = pickle.loads(pickle.dumps(root))
+
+        assert [id(op) for op in copied.walk()] == [id(copied.children["a"]), id(copied.children["b"]), id(copied)]
+
+
+def test_name_pattern_is_the_same_as_in_qref():
+    assert NAME_PATTERN == QREF_NAME_PATTERN
@@ -111,3 +111,31 @@ def test_routine_serializes_to_expected_dict(expected_dict, example_routine):
 def test_routine_deserializes_to_expected_object(expected_dict):
     recreated_routine = Routine(**expected_dict)
     assert expected_dict == recreated_routine.model_dump(exclude_unset=True)
+
+
+def test_routine_constructed_from_trusted_dict_is_the_same_as_validated_one(expected_dict):
+    routine = Routine.from_trusted_dict(expected_dict)
+
+    assert routine == Routine(**expected_dict)
+    assert routine.model_dump(exclude_unset=True) == expected_dict
+
+
+def test_routine_constructed_from_trusted_dict_has_correct_parents(expected_dict):
+    routine = Routine.from_trusted_dict(expected_dict)
+
+    assert all(child.parent is routine for child in routine.children.values())
+    assert all(connection.parent is routine for connection in routine.connections)
+    assert routine.connections[0].source is routine.children["child_1"].ports["out_0"]
+    assert routine.children["child_2"].ports["in_0"].absolute_path() == "root.child_2.#in_0"
+    assert routine.children["child_1"].resources["N_toffs"].parent is routine.children["child_1"]
+
+
+def test_modifying_routine_constructed_from_trusted_dict_does_not_modify_the_dict(expected_dict):
+    routine = Routine.from_trusted_dict(expected_dict)
+
+    routine.children["child_1"].resources.clear()
+    routine.children["child_2"].ports["in_0"].size = 2
+    routine.connections.clear()
+
+    assert Routine(**expected_dict).model_dump(exclude_unset=True) == expected_dict
+    assert expected_dict["connections"] == [{"source": "child_1.out_0", "target": "child_2.in_0"}]
@@ -0,0 +1,80 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from bartiq.symbolics import sympy_backend
+from bartiq.symbolics.backend import (
+    free_symbols_in_all,
+    serialize_all,
+    substitute_all,
+    substitute_in_all,
+)
+
+
+class _SingleExpressionBackend:
+    """Backend implementing only single-expression methods, used for testing fallbacks of batch operations."""
+
+    def __getattr__(self, name):
+        if name in ("substitute_all", "substitute_in_all", "free_symbols_in_all", "serialize_all"):
+            raise AttributeError(name)
+        return getattr(sympy_backend, name)
+
+
+@pytest.fixture(params=["native", "fallback"])
+def batch_backend(request, backend):
+    return backend if request.param == "native" else _SingleExpressionBackend()
+
+
+@pytest.mark.parametrize(
+    "expression, substitutions, expected",
+    [
+        ("x + 2*y", {"x": "y", "y": "x"}, "2*x + y"),
+        ("a*b + c", {"a": "b + 1", "b": "2", "d": "3"}, "c + 2*(b + 1)"),
+        ("ceil(N/2) + max(M, 3)", {"N": "7", "M": "a*b"}, "4 + max(3, a*b)"),
+        ("x", {}, "x"),
+    ],
+)
+def test_symbols_are_substituted_simultaneously(batch_backend, expression, substitutions, expected):
+    expr = batch_backend.as_expression(expression)
+    substitutions = {symbol: batch_backend.as_expression(value) for symbol, value in substitutions.items()}
+
+    result = substitute_all(batch_backend, expr, substitutions)
+
+    assert batch_backend.serialize(result) == batch_backend.serialize(batch_backend.as_expression(expected))
+
+
+def test_substituting_in_all_expressions_gives_the_same_results_as_substituting_in_each(batch_backend):
+    exprs = [batch_backend.as_expression(expression) for expression in ["x*y", "x + z", "w", "2"]]
+    substitutions = {"x": 3, "y": batch_backend.as_expression("x + 1")}
+
+    assert substitute_in_all(batch_backend, exprs, substitutions) == [
+        substitute_all(batch_backend, expr, substitutions) for expr in exprs
+    ]
+
+
+def test_free_symbols_and_serialized_expressions_are_computed_for_all_expressions(batch_backend):
+    expressions = ["x*y + f(z)", "ceil(a/2)", "3"]
+    exprs = [batch_backend.as_expression(expression) for expression in expressions]
+
+    assert free_symbols_in_all(batch_backend, exprs) == [{"x", "y", "z"}, {"a"}, set()]
+    assert serialize_all(batch_backend, exprs) == [batch_backend.serialize(expr) for expr in exprs]
+
+
+def test_summation_index_is_not_substituted(batch_backend):
+    expr = batch_backend.as_expression("sum_over(i**2, i, 1, N) + i")
+
+    result = substitute_all(batch_backend, expr, {"N": 4, "i": 3})
+
+    assert batch_backend.value_of(result) == 33
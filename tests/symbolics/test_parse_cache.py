@@ -0,0 +1,99 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+
+import pytest
+
+from bartiq.symbolics.parse_cache import ParseCache, ParseCacheInfo
+
+
+class _CountingParser:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, expression):
+        self.calls.append(expression)
+        return expression.upper()
+
+
+def test_strings_are_parsed_only_once():
+    cache, parse = ParseCache(), _CountingParser()
+
+    results = [cache.get_or_parse(expression, parse) for expression in ["a", "b", "a", "a", "b"]]
+
+    assert results == ["A", "B", "A", "A", "B"]
+    assert parse.calls == ["a", "b"]
+    assert cache.info() == ParseCacheInfo(hits=3, misses=2, evictions=0, maxsize=8192, currsize=2)
+    assert cache.info().hit_rate == 0.6
+
+
+@pytest.mark.parametrize("eviction, expected_contents", [("lru", {"a", "c"}), ("fifo", {"b", "c"})])
+def test_expressions_are_evicted_according_to_policy(eviction, expected_contents):
+    cache, parse = ParseCache(maxsize=2, eviction=eviction), _CountingParser()
+
+    for expression in ["a", "b", "a", "c"]:
+        cache.get_or_parse(expression, parse)
+
+    assert {expression for expression in "abc" if expression in cache} == expected_contents
+    assert cache.info().evictions == 1
+
+
+def test_cache_of_size_zero_only_counts_lookups():
+    cache, parse = ParseCache(maxsize=0), _CountingParser()
+
+    for _ in range(3):
+        cache.get_or_parse("a", parse)
+
+    assert parse.calls == ["a", "a", "a"]
+    assert len(cache) == 0
+    assert cache.info().misses == 3
+
+
+def test_failed_parses_are_not_cached():
+    cache = ParseCache()
+
+    def _parse(expression):
+        raise ValueError(expression)
+
+    with pytest.raises(ValueError):
+        cache.get_or_parse("a", _parse)
+
+    assert "a" not in cache
+    assert cache.get_or_parse("a", str.upper) == "A"
+
+
+def test_clearing_cache_removes_expressions_and_statistics():
+    cache = ParseCache()
+    cache.get_or_parse("a", str.upper)
+    cache.get_or_parse("a", str.upper)
+
+    cache.clear()
+
+    assert cache.info() == ParseCacheInfo(hits=0, misses=0, evictions=0, maxsize=8192, currsize=0)
+
+
+def test_pickled_cache_retains_configuration_but_not_expressions():
+    cache = ParseCache(maxsize=10, eviction="fifo")
+    cache.get_or_parse("a", str.upper)
+
+    unpickled = pickle.loads(pickle.dumps(cache))
+
+    assert (unpickled.maxsize, unpickled.eviction, len(unpickled)) == (10, "fifo", 0)
+
+
+@pytest.mark.parametrize("kwargs", [{"maxsize": -1}, {"eviction": "random"}])
+def test_invalid_cache_configuration_is_rejected(kwargs):
+    with pytest.raises(ValueError):
+        ParseCache(**kwargs)
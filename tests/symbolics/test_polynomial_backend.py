@@ -0,0 +1,184 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import subprocess
+import sys
+
+import pytest
+import sympy
+
+from bartiq.errors import BartiqCompilationError
+from bartiq.symbolics import (
+    polynomial_backend,
+    sympy_backend,
+    sympy_backends,
+    sympy_interpreter,
+)
+from bartiq.symbolics.polynomial_backend import (
+    _EPSILON,
+    _SPECIAL_PARAM_NAMES,
+    BUILT_IN_FUNCTIONS,
+    NUM_DIGITS_PRECISION,
+    Polynomial,
+)
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "M*N + 2*N + M + 2 + N**2",
+        "x/2 - 3*y/4 + 1/3",
+        "N/(2*M)",
+        "ceil(log2(N)) + floor(N/3)",
+        "max(a, b, 3) + min(2, b)",
+        "3*2**N",
+        "0.5*N + 1.5",
+        "M*N**(-2)",
+        "sqrt(4*x)",
+        "#out_0*x.y + f(x)",
+        "N % 3 + N // 2",
+        "round(N/3) + multiplicity(2, M) + abs(x)",
+        "ceil(log(N + 1, 2))*heaviside(x - 3) + log(6, 2)",
+        "1e-7*x + 2*y**(-0.5)",
+        "x + z**(-2)",
+    ],
+)
+def test_serialized_polynomials_are_the_same_as_for_sympy_backend(expression):
+    expr = polynomial_backend.as_expression(expression)
+
+    assert isinstance(expr, Polynomial)
+    assert polynomial_backend.serialize(expr) == sympy_backend.serialize(sympy_backend.as_expression(expression))
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("(a + b)*(a - b)", "a ^ 2 - b ^ 2"),
+        ("(a + b)/c", "a/c + b/c"),
+        ("(x + 1)**2 - 2*x", "x ^ 2 + 1"),
+        ("1/(a + b) + 2/(b + a)", "3/(a + b)"),
+        ("sqrt(x + 1)**2", "x + 1"),
+        ("max(a, max(b, 2), 1, a)", "Max(2, a, b)"),
+    ],
+)
+def test_polynomials_are_expanded_and_simplified(expression, expected):
+    assert polynomial_backend.serialize(polynomial_backend.as_expression(expression)) == expected
+
+
+@pytest.mark.parametrize(
+    "expression, expected_value",
+    [
+        ("ceil(log2(N)) + floor(N/5)", 6),
+        ("max(N, 3)*min(N, 3)", 36),
+        ("round(N/5)", 2),
+        ("mod(N, 5) + multiplicity(2, N)", 4),
+        ("sqrt(N + 4)", 4),
+        ("N/8", 1.5),
+        ("log2(N)", 3.58496250072116),
+        ("ceil(log(N + 4, 2)) + heaviside(N - 12)", 4.5),
+    ],
+)
+def test_substituting_all_symbols_evaluates_expression(expression, expected_value):
+    expr = polynomial_backend.substitute(polynomial_backend.as_expression(expression), "N", 12)
+
+    assert polynomial_backend.value_of(expr) == expected_value
+
+
+@pytest.mark.parametrize("exponent", [3, 29, 31, 39])
+def test_rounding_functions_are_exact_for_values_close_to_integers(exponent):
+    expr = polynomial_backend.substitute(
+        polynomial_backend.as_expression("ceil(log(N, 2)) + floor(log(N, 2))"), "N", 2**exponent
+    )
+
+    assert polynomial_backend.value_of(expr) == 2 * exponent
+
+
+def test_expressions_which_are_not_polynomials_fall_back_to_sympy():
+    expr = polynomial_backend.as_expression("sin(x) + sum_over(i, i, 1, N)")
+
+    assert isinstance(expr, sympy.Expr)
+    assert set(polynomial_backend.free_symbols_in(expr)) == {"x", "N"}
+    assert polynomial_backend.value_of(polynomial_backend.substitute(expr, "x", 0)) is None
+
+
+def test_sympy_expressions_simplifying_to_polynomials_are_converted_back():
+    expr = polynomial_backend.as_expression("exp(log(x)) + y")
+
+    assert isinstance(expr, Polynomial)
+    assert polynomial_backend.serialize(expr) == "x + y"
+
+
+def test_defining_function_evaluates_it_and_enclosing_special_functions():
+    expr = polynomial_backend.as_expression("ceil(f(x, 2)) + f(3, 1)")
+
+    expr = polynomial_backend.define_function(expr, "f", lambda a, b: a / b)
+
+    assert polynomial_backend.serialize(expr) == "ceiling(x/2) + 3"
+
+
+def test_defining_function_with_conditions_leaves_symbolic_calls_untouched():
+    expr = polynomial_backend.as_expression("f(x) + f(3)")
+
+    expr = polynomial_backend.define_function(expr, "f", lambda a: a if a > 2 else -a)
+
+    assert polynomial_backend.serialize(expr) == "f(3) + f(x)"
+
+
+def test_renaming_function_renames_nested_calls():
+    expr = polynomial_backend.as_expression("a.f(a.f(x) + 1)*ceil(a.f(y))")
+
+    expr = polynomial_backend.rename_function(expr, "a.f", "g")
+
+    assert set(polynomial_backend.functions_in(expr)) == {"g"}
+    assert polynomial_backend.serialize(expr) == "ceiling(g(y))*g(g(x) + 1)"
+
+
+@pytest.mark.parametrize(
+    "expression, old_name, new_name",
+    [("ceil(x)", "ceil", "my_ceil"), ("f(a, b, c)", "f", "max")],
+)
+def test_attempt_to_rename_builtin_function_or_to_builtin_function_fails(expression, old_name, new_name):
+    expr = polynomial_backend.as_expression(expression)
+
+    with pytest.raises(BartiqCompilationError):
+        polynomial_backend.rename_function(expr, old_name, new_name)
+
+
+def test_polynomials_can_be_pickled():
+    expr = polynomial_backend.as_expression("ceil(log2(N))*f(M) + sqrt(N + 1)")
+
+    assert pickle.loads(pickle.dumps(expr)) == expr
+
+
+def test_constants_copied_from_sympy_modules_are_up_to_date():
+    assert NUM_DIGITS_PRECISION == sympy_backends.NUM_DIGITS_PRECISION
+    assert BUILT_IN_FUNCTIONS == sympy_backends.BUILT_IN_FUNCTIONS
+    assert _SPECIAL_PARAM_NAMES == set(sympy_interpreter.SPECIAL_PARAMS)
+    assert _EPSILON == sympy_interpreter.EPSILON
+
+
+def test_polynomials_are_manipulated_without_importing_sympy():
+    code = (
+        "import sys\n"
+        "from bartiq.symbolics import polynomial_backend as backend\n"
+        "expr = backend.as_expression('ceil(log2(N))*M + max(a, b)/2 + f(x)**2 + prod(a, b) + 0.1*N')\n"
+        "expr = backend.substitute_all(expr, {'N': 8, 'M': backend.as_expression('K + 1')})\n"
+        "backend.serialize(expr)\n"
+        "print('sympy' in sys.modules)"
+    )
+
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "False"
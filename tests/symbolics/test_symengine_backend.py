@@ -0,0 +1,85 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from bartiq.errors import BartiqCompilationError
+from bartiq.symbolics import sympy_backend
+
+symengine_backend = pytest.importorskip("bartiq.symbolics.symengine_backend").symengine_backend
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "a + 2*b",
+        "ceiling(log2(N)) + floor(sqrt(M))",
+        "Mod(N, 3)*K",
+        "round(N/3) + multiplicity(2, M)",
+        "sum_over(i**2, i, 1, N)",
+        "prod_over(i, i, 1, M) + Heaviside(N - 1)",
+        "max(N, 4) + min(K, 2)",
+        "f(a, b) + log10(N)",
+    ],
+)
+def test_serialized_expressions_are_the_same_as_for_sympy_backend(expression):
+    assert symengine_backend.serialize(symengine_backend.as_expression(expression)) == sympy_backend.serialize(
+        sympy_backend.as_expression(expression)
+    )
+
+
+def test_bound_variable_of_sum_is_not_a_free_symbol():
+    expr = symengine_backend.as_expression("sum_over(i*a, i, 1, N)")
+
+    assert set(symengine_backend.free_symbols_in(expr)) == {"a", "N"}
+
+
+@pytest.mark.parametrize(
+    "expression, expected_value",
+    [
+        ("round(N/3)", 4),
+        ("mod(N, 5)", 2),
+        ("multiplicity(2, N)", 2),
+        ("sum_over(i, i, 1, N)", 78),
+    ],
+)
+def test_substituting_all_symbols_evaluates_functions_unsupported_by_symengine(expression, expected_value):
+    expr = symengine_backend.substitute(symengine_backend.as_expression(expression), "N", 12)
+
+    assert symengine_backend.value_of(expr) == expected_value
+
+
+def test_value_of_returns_none_if_numerical_evaluation_is_not_possible():
+    expr = symengine_backend.as_expression("log2(N)")
+
+    assert symengine_backend.value_of(expr) is None
+
+
+def test_defining_function_evaluates_it_for_numeric_arguments():
+    expr = symengine_backend.as_expression("f(2, 3) + f(x, 1)")
+
+    expr = symengine_backend.define_function(expr, "f", lambda a, b: a * b)
+
+    assert expr == symengine_backend.as_expression("6 + x")
+
+
+@pytest.mark.parametrize(
+    "expression, old_name, new_name",
+    [("exp(x)", "exp", "my_exp"), ("f(a, b, c)", "f", "exp"), ("f(x) + round(x)", "round", "g")],
+)
+def test_attempt_to_rename_builtin_function_or_to_builtin_function_fails(expression, old_name, new_name):
+    expr = symengine_backend.as_expression(expression)
+
+    with pytest.raises(BartiqCompilationError):
+        symengine_backend.rename_function(expr, old_name, new_name)
@@ -15,6 +15,8 @@ from sympy import E, cos, exp, pi, sin, sqrt, sympify
 
 from bartiq.errors import BartiqCompilationError
 from bartiq.symbolics import sympy_backend
+from bartiq.symbolics.parse_cache import ParseCache
+from bartiq.symbolics.sympy_backends import SympyBackend
 
 
 @pytest.mark.parametrize(
@@ -90,3 +92,12 @@ def test_attempt_to_define_builtin_function_fails():
 
     with pytest.raises(BartiqCompilationError):
         sympy_backend.define_function(expr, "cos", _f)
+
+
+def test_parsed_expressions_are_cached():
+    backend = SympyBackend(parse_cache=ParseCache(maxsize=16))
+
+    first, second = backend.as_expression("x + y"), backend.as_expression("x + y")
+
+    assert first is second
+    assert (backend.parse_cache.info().hits, backend.parse_cache.info().misses) == (1, 1)
@@ -0,0 +1,155 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+from bartiq import Routine
+from bartiq.graph import RoutineGraph
+from bartiq.routing import get_port_source, get_port_target, get_route
+from bartiq.serialization import dump_json
+
+from .utilities import routine_with_passthrough, routine_with_two_passthroughs
+
+
+def _load_routines():
+    with open(Path(__file__).parent / "compilation/data/compile_test_data.yaml") as f:
+        return [Routine(**original) for original, _ in yaml.safe_load(f)]
+
+
+ROUTINES = [routine_with_passthrough(), routine_with_two_passthroughs(), *_load_routines()]
+
+
+def _all_ports(routine):
+    return [port for descendant in routine.walk() for port in descendant.ports.values()]
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_converted_to_graph_and_back_is_unchanged(routine):
+    assert RoutineGraph.from_routine(routine).to_routine() == routine
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_graph_created_from_dict_represents_the_same_routine(routine):
+    file = io.StringIO()
+    dump_json(routine, file)
+
+    assert RoutineGraph.from_dict(routine.model_dump()).to_routine() == routine
+    assert RoutineGraph.from_dict(json.loads(file.getvalue())).to_routine() == routine
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_graph_walk_visits_routines_in_the_same_order_as_routine_walk(routine):
+    graph = RoutineGraph.from_routine(routine)
+
+    assert [graph.path(index) for index in graph.walk()] == [r.absolute_path() for r in routine.walk()]
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routes_in_graph_are_the_same_as_in_routine(routine):
+    graph = RoutineGraph.from_routine(routine)
+
+    for port in _all_ports(routine):
+        index = graph.port(graph.find(port.parent.absolute_path(exclude_root_name=True)), port.name)
+
+        assert [graph.port_path(p) for p in graph.route(index)] == [p.absolute_path() for p in get_route(port, True)]
+        assert [graph.port_path(p) for p in graph.route(index, forward=False)] == [
+            p.absolute_path() for p in get_route(port, False)
+        ]
+        assert graph.port_path(graph.port_source(index)) == get_port_source(port).absolute_path()
+        assert graph.port_path(graph.port_target(index)) == get_port_target(port).absolute_path()
+
+
+def test_children_of_each_routine_have_consecutive_indices():
+    graph = RoutineGraph.from_routine(routine_with_passthrough())
+
+    assert graph.children(0) == range(1, 4)
+    assert [graph.name(child) for child in graph.children(0)] == ["a", "b", "c"]
+    assert all(graph.parent(child) == 0 and graph.is_leaf(child) for child in graph.children(0))
+    assert graph.parent(0) is None
+
+
+def test_subroutine_can_be_converted_back_to_routine():
+    routine = routine_with_passthrough()
+    graph = RoutineGraph.from_routine(routine)
+
+    subroutine = graph.to_routine(graph.find("b"))
+
+    assert subroutine.parent is None
+    assert subroutine.model_dump() == routine.children["b"].model_dump()
+
+
+def test_finding_nonexistent_descendant_raises_an_error():
+    graph = RoutineGraph.from_routine(routine_with_passthrough())
+
+    with pytest.raises(ValueError, match="Child b.x not found."):
+        graph.find("b.x")
+
+
+def test_graph_walk_raises_an_error_if_children_form_a_cycle():
+    routine_dict = routine_with_passthrough().model_dump()
+    routine_dict["connections"].append({"source": "c.out_0", "target": "a.in_0"})
+    graph = RoutineGraph.from_routine(Routine(**routine_dict))
+
+    with pytest.raises(ValueError, match="A cycle occurred while sorting children of routine root."):
+        list(graph.walk())
+
+
+def _wide_routine(n_children):
+    children = {
+        f"child_{i}": Routine(
+            name=f"child_{i}",
+            type="gate",
+            ports={
+                "in": {"name": "in", "direction": "input", "size": 1},
+                "out": {"name": "out", "direction": "output", "size": 1},
+            },
+            resources={"T_gates": {"name": "T_gates", "type": "additive", "value": 1}},
+        )
+        for i in range(n_children)
+    }
+    connections = [{"source": f"child_{i}.out", "target": f"child_{i + 1}.in"} for i in range(n_children - 1)]
+    return Routine(name="root", type=None, children=children, connections=connections)
+
+
+def _deep_size(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(key, seen) + _deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    if hasattr(obj, "__dict__"):
+        size += _deep_size(vars(obj), seen)
+    return size
+
+
+def test_graph_uses_an_order_of_magnitude_less_memory_than_routine():
+    routine = _wide_routine(1000)
+
+    assert RoutineGraph.from_routine(routine).nbytes * 10 < _deep_size(routine)
+
+
+def test_graph_created_from_dict_uses_an_order_of_magnitude_less_memory_than_routine():
+    routine = _wide_routine(1000)
+
+    assert RoutineGraph.from_dict(routine.model_dump()).nbytes * 10 < _deep_size(routine)
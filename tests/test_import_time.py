@@ -0,0 +1,80 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_DEPENDENCIES = ["sympy", "symengine", "pyparsing", "qref", "numpy", "ipywidgets"]
+# Subpackages of bartiq which are needed only for manipulating expressions, and which import heavy dependencies
+HEAVY_SUBPACKAGES = ["bartiq.compilation", "bartiq.symbolics", "bartiq.integrations", "bartiq.precompilation"]
+
+
+def _run_in_fresh_interpreter(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *options, "-c", code], capture_output=True, text=True, check=True)
+
+
+def _imported_modules(code: str, modules: list[str]) -> list[str]:
+    """Return those of given modules which are imported after running code in a fresh interpreter."""
+    result = _run_in_fresh_interpreter(
+        f"{code}\nimport json, sys\nprint(json.dumps(sorted(set(sys.modules) & {set(modules)!r})))"
+    )
+    return json.loads(result.stdout)
+
+
+def test_importing_bartiq_does_not_import_heavy_dependencies_nor_subpackages():
+    assert _imported_modules("import bartiq", HEAVY_DEPENDENCIES + HEAVY_SUBPACKAGES) == []
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "import bartiq.compilation, bartiq.symbolics, bartiq.integrations",
+        "from bartiq import Routine; Routine.model_validate_json(Routine(name='root', type=None).model_dump_json())",
+    ],
+)
+def test_loading_routines_does_not_import_heavy_dependencies(code):
+    assert _imported_modules(code, HEAVY_DEPENDENCIES) == []
+
+
+def test_heavy_dependencies_are_imported_on_first_use():
+    result = _run_in_fresh_interpreter(
+        "import sys, bartiq; assert 'sympy' not in sys.modules; bartiq.compile_routine; print('sympy' in sys.modules)"
+    )
+
+    assert result.stdout.strip() == "True"
+
+
+@pytest.mark.parametrize(
+    "module, attribute, dependency, extra",
+    [
+        ("bartiq.compilation", "evaluate_grid", "numpy", "grid"),
+        ("bartiq.symbolics", "symengine_backend", "symengine", "symengine"),
+    ],
+)
+def test_using_feature_without_its_optional_dependency_raises_error_naming_extra(module, attribute, dependency, extra):
+    # Setting a module to None in sys.modules makes importing it fail, as if it wasn't installed
+    result = _run_in_fresh_interpreter(
+        f"import sys; sys.modules[{dependency!r}] = None\n"
+        f"import {module}\n"
+        f"assert {attribute!r} not in {module}.__all__\n"
+        "try:\n"
+        f"    {module}.{attribute}\n"
+        "except ImportError as error:\n"
+        "    print(error)"
+    )
+
+    assert f'pip install "bartiq[{extra}]"' in result.stdout
@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import pickle
+from copy import deepcopy
+
 import pytest
 
-from bartiq._routine import Routine
+from bartiq._routine import Connection, Routine
 from bartiq.routing import get_port_source, get_port_target, join_paths
 
 from .utilities import routine_with_passthrough
@@ -191,3 +194,37 @@ def test_get_port_target(parent_path, port_name, target_port_path, routine):
     port_parent = routine.find_descendant(parent_path)
     port = port_parent.ports[port_name]
     assert get_port_target(port).absolute_path(exclude_root_name=True) == target_port_path
+
+
+def test_port_target_reflects_modified_connections():
+    routine = _simple_routine()
+    port = routine.children["a"].ports["out_0"]
+    assert get_port_target(port) is routine.children["b"].ports["in_0"]
+
+    routine.connections.pop(1)
+    assert get_port_target(port) is port
+
+    routine.connections.append(Connection(source=port, target=routine.ports["out_0"], parent=routine))
+    assert get_port_target(port) is routine.ports["out_0"]
+
+    routine.connections[-1].target = routine.children["b"].ports["in_0"]
+    assert get_port_target(port) is routine.children["b"].ports["in_0"]
+
+
+def test_port_source_reflects_reassigned_connections():
+    routine = _simple_routine()
+    port = routine.children["b"].ports["in_0"]
+
+    routine.connections = [connection for connection in routine.connections if connection.target is not port]
+
+    assert get_port_source(port) is port
+
+
+@pytest.mark.parametrize("copy_routine", [deepcopy, lambda routine: pickle.loads(pickle.dumps(routine))])
+def test_port_source_in_copied_routine_is_found_in_the_copy(copy_routine):
+    routine = _nested_routine()
+    get_port_source(routine.children["b"].ports["in_0"])
+
+    copied = copy_routine(routine)
+
+    assert get_port_source(copied.children["b"].ports["in_0"]) is copied.children["a"].children["c"].ports["out_0"]
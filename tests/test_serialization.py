@@ -0,0 +1,177 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import sys
+
+import pytest
+
+from bartiq import Routine, compile_routine
+from bartiq.serialization import dump_binary, dump_json, load_binary, load_json
+
+from .test_graph import ROUTINES, _wide_routine
+
+# Deep enough to exceed the recursion limit if reading or writing were recursive
+DEPTH = 2 * sys.getrecursionlimit()
+
+
+def _dumped(routine):
+    file = io.StringIO()
+    dump_json(routine, file)
+    return file.getvalue()
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_is_dumped_to_canonical_json(routine):
+    assert _dumped(routine) == json.dumps(routine.model_dump(), sort_keys=True)
+
+
+@pytest.mark.parametrize("trusted", [False, True])
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_dumped_routine_is_loaded_unchanged(routine, trusted):
+    assert load_json(io.StringIO(_dumped(routine)), trusted=trusted) == routine
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_can_be_loaded_from_json_with_any_formatting_and_order_of_fields(routine, monkeypatch):
+    # Small chunks make values span multiple chunks
+    monkeypatch.setattr("bartiq.serialization._CHUNK_SIZE", 5)
+    text = json.dumps(routine.model_dump(), indent=4)
+
+    assert load_json(io.StringIO(text)) == routine
+
+
+def test_loaded_routine_has_correctly_linked_parents():
+    routine = load_json(io.StringIO(_dumped(ROUTINES[0])))
+
+    assert all(child.parent is routine for child in routine.children.values())
+    assert all(connection.parent is routine for connection in routine.connections)
+    assert routine.connections[0].target.parent.parent is routine
+
+
+def test_deep_routine_can_be_dumped_and_loaded():
+    routine = Routine(name="leaf", type=None)
+    for i in range(DEPTH):
+        routine = Routine(name=f"r_{i}", type=None, children={routine.name: routine})
+
+    loaded = load_json(io.StringIO(_dumped(routine)))
+
+    for _ in range(DEPTH):
+        (loaded,) = loaded.children.values()
+    assert loaded.name == "leaf"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"name": "root", "type": null',
+        '{"name": "root", "type": null} {}',
+        '{"name": "root" "type": null}',
+        '{"name": "root", "children": {"a": {"name": "a"}',
+        '{"name": "root", 1: null}',
+    ],
+)
+def test_loading_invalid_json_raises_an_error(text):
+    with pytest.raises(ValueError):
+        load_json(io.StringIO(text))
+
+
+def test_loading_invalid_routine_raises_an_error():
+    with pytest.raises(ValueError):
+        load_json(io.StringIO('{"name": "invalid name", "type": null}'))
+
+
+def _dumped_binary(routine, compression=None):
+    file = io.BytesIO()
+    dump_binary(routine, file, compression)
+    return file.getvalue()
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_dumped_to_binary_format_is_loaded_unchanged(routine, compression):
+    loaded = load_binary(io.BytesIO(_dumped_binary(routine, compression)))
+
+    assert loaded == routine
+    assert loaded.model_dump() == routine.model_dump()
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_loaded_from_binary_format_compiles_like_original_one(routine):
+    loaded = load_binary(io.BytesIO(_dumped_binary(routine)))
+
+    assert compile_routine(loaded) == compile_routine(routine)
+
+
+def test_routine_loaded_from_binary_format_has_correctly_linked_parents():
+    routine = load_binary(io.BytesIO(_dumped_binary(ROUTINES[0])))
+
+    assert all(child.parent is routine for child in routine.children.values())
+    assert routine.connections[0].target.parent.parent is routine
+
+
+def test_values_of_all_types_are_preserved_in_binary_format():
+    routine = Routine(
+        name="root",
+        type=None,
+        ports={"in": {"name": "in", "direction": "input", "size": None}},
+        resources={
+            "a": {"name": "a", "type": "additive", "value": -(2**70)},
+            "b": {"name": "b", "type": "additive", "value": 0.125},
+            "c": {"name": "c", "type": "qubits", "value": "N + 1"},
+        },
+        meta={"π": [1, None]},
+    )
+
+    assert load_binary(io.BytesIO(_dumped_binary(routine))).model_dump() == routine.model_dump()
+
+
+def test_deep_routine_can_be_dumped_and_loaded_in_binary_format():
+    routine = Routine(name="leaf", type=None)
+    for i in range(DEPTH):
+        routine = Routine(name=f"r_{i}", type=None, children={routine.name: routine})
+
+    loaded = load_binary(io.BytesIO(_dumped_binary(routine)))
+
+    for _ in range(DEPTH):
+        (loaded,) = loaded.children.values()
+    assert loaded.name == "leaf"
+
+
+def test_binary_format_is_smaller_than_json():
+    routine = _wide_routine(1000)
+
+    assert 3 * len(_dumped_binary(routine)) < len(_dumped(routine))
+    assert 10 * len(_dumped_binary(routine, "lzma")) < len(_dumped(routine))
+
+
+def test_dumping_with_unsupported_compression_raises_an_error():
+    with pytest.raises(ValueError, match="Unsupported compression"):
+        dump_binary(ROUTINES[0], io.BytesIO(), "zip")
+
+
+@pytest.mark.parametrize(
+    "data, match",
+    [
+        (b"", "Not a file"),
+        (b'{"name": "root"}', "Not a file"),
+        (b"BRTQ\x01\x00", "Unsupported version"),
+        (b"BRTQ\x03\x00", "Unsupported version"),
+        (b"BRTQ\x02\x07", "Unsupported compression"),
+    ],
+)
+def test_loading_invalid_binary_file_raises_an_error(data, match):
+    with pytest.raises(ValueError, match=match):
+        load_binary(io.BytesIO(data))
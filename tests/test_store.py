@@ -0,0 +1,155 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+
+import pytest
+
+from bartiq import Routine, compile_routine
+from bartiq.store import RoutineStore, dump_store
+
+from .test_graph import ROUTINES, _wide_routine
+from .utilities import routine_with_passthrough
+
+
+@pytest.fixture
+def open_store(tmp_path):
+    stores = []
+
+    def _open_store(routine):
+        path = tmp_path / "routine.bin"
+        dump_store(routine, path)
+        stores.append(store := RoutineStore(path))
+        return store
+
+    yield _open_store
+    for store in stores:
+        store.close()
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_loaded_from_store_is_unchanged(routine, open_store):
+    loaded = open_store(routine).root.load()
+
+    assert loaded == routine
+    assert loaded.model_dump() == routine.model_dump()
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_routine_loaded_from_store_compiles_like_original_one(routine, open_store):
+    loaded = open_store(routine).root.load()
+
+    assert compile_routine(loaded) == compile_routine(routine)
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_stored_subroutines_are_loaded_unchanged(routine, open_store):
+    store = open_store(routine)
+
+    for stored in store.root.walk():
+        expected = routine.find_descendant(stored.absolute_path(exclude_root_name=True))
+        loaded = stored.load()
+
+        assert loaded.parent is None
+        assert loaded.model_dump() == expected.model_dump()
+
+
+@pytest.mark.parametrize("routine", ROUTINES)
+def test_stored_routines_have_the_same_fields_as_original_ones(routine, open_store):
+    store = open_store(routine)
+
+    assert sorted(stored.absolute_path() for stored in store.root.walk()) == sorted(
+        r.absolute_path() for r in routine.walk()
+    )
+    for stored in store.root.walk():
+        original = routine.find_descendant(stored.absolute_path(exclude_root_name=True))
+        dumped = original.model_dump()
+
+        assert stored.type == original.type
+        assert list(stored.children) == list(original.children)
+        assert stored.is_leaf == original.is_leaf
+        assert {name: port.model_dump() for name, port in stored.ports.items()} == dumped["ports"]
+        assert {name: resource.model_dump() for name, resource in stored.resources.items()} == dumped["resources"]
+        assert sorted(stored.connections, key=lambda c: (c["source"], c["target"])) == dumped["connections"]
+        assert stored.local_variables == original.local_variables
+        assert stored.meta == original.meta
+
+
+def test_routine_without_children_is_loaded_without_connections_to_them(open_store):
+    routine = routine_with_passthrough()
+    store = open_store(routine)
+
+    loaded = store.root.load(include_children=False)
+
+    assert loaded.children == {}
+    assert loaded.connections == []
+    assert loaded.model_dump(exclude={"children", "connections"}) == routine.model_dump(
+        exclude={"children", "connections"}
+    )
+
+
+def test_only_accessed_routines_are_read_from_store(open_store):
+    store = open_store(_wide_routine(100))
+
+    stored = store.root.find_descendant("child_42")
+
+    assert stored.resources["T_gates"].value == 1
+    assert "_record" not in vars(store.root.children["child_41"])
+    assert len(store) == 101
+
+
+def test_finding_nonexistent_descendant_raises_an_error(open_store):
+    store = open_store(routine_with_passthrough())
+
+    assert store.root.find_descendant("") is store.root
+    assert store.root.find_descendant("b").parent is store.root
+    with pytest.raises(ValueError, match="Child b.x not found."):
+        store.root.find_descendant("b.x")
+
+
+def test_deep_routine_can_be_stored_and_loaded(open_store):
+    routine = Routine(name="leaf", type=None)
+    for i in range(2 * sys.getrecursionlimit()):
+        routine = Routine(name=f"r_{i}", type=None, children={routine.name: routine})
+
+    loaded = open_store(routine).root.load()
+
+    assert loaded == routine
+
+
+def test_store_can_be_used_as_context_manager(tmp_path):
+    path = tmp_path / "routine.bin"
+    dump_store(routine_with_passthrough(), path)
+
+    with RoutineStore(path) as store:
+        loaded = store.root.load()
+
+    assert loaded == routine_with_passthrough()
+
+
+@pytest.mark.parametrize(
+    "data, match",
+    [
+        (b"", "Not a file"),
+        (b"BRTQ" + bytes(40), "Not a file"),
+        (b"BRTS\x00" + bytes(40), "version"),
+        (b"BRTS\x02" + bytes(40), "version"),
+    ],
+)
+def test_opening_invalid_store_raises_an_error(data, match, tmp_path):
+    path = tmp_path / "routine.bin"
+    path.write_bytes(data)
+
+    with pytest.raises(ValueError, match=match):
+        RoutineStore(path)
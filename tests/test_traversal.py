@@ -0,0 +1,102 @@
+# Copyright 2024 PsiQuantum, Corp.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+
+import pytest
+
+from bartiq import Routine
+from bartiq._traversal import post_order, pre_order
+from bartiq.integrations.qref import _bartiq_routine_to_qref_v1_dict
+from bartiq.precompilation.stages import _propagate_linked_params
+
+TREE = {"root": ["a", "b"], "a": ["c", "d"], "b": ["e"], "c": [], "d": [], "e": []}
+
+# Deep enough to exceed the recursion limit if any of the traversals were recursive
+DEPTH = 2 * sys.getrecursionlimit()
+
+
+def _children(node):
+    return TREE[node]
+
+
+def test_pre_order_visits_parents_before_children():
+    assert list(pre_order("root", _children)) == ["root", "a", "c", "d", "b", "e"]
+
+
+def test_post_order_visits_parents_after_children():
+    assert list(post_order("root", _children)) == ["c", "d", "a", "e", "b", "root"]
+
+
+def test_pre_order_uses_children_of_node_as_modified_while_it_was_visited():
+    tree = {"root": ["a"], "a": [], "b": []}
+    visited = []
+
+    for node in pre_order("root", tree.__getitem__):
+        visited.append(node)
+        if node == "a":
+            tree["a"].append("b")
+
+    assert visited == ["root", "a", "b"]
+
+
+@pytest.fixture
+def deep_routine():
+    routine = Routine(name="leaf", type=None, input_params=["x"])
+    for i in range(DEPTH):
+        routine = Routine(name=f"r_{i}", type=None, children={routine.name: routine})
+    return routine
+
+
+def _leaf(routine):
+    while routine.children:
+        (routine,) = routine.children.values()
+    return routine
+
+
+def test_walking_deep_routine_visits_all_routines_bottom_up(deep_routine):
+    visited = list(deep_routine.walk())
+
+    assert len(visited) == DEPTH + 1
+    assert visited[0] is _leaf(deep_routine)
+    assert visited[-1] is deep_routine
+
+
+def test_leaf_of_deep_routine_can_be_found_by_its_path(deep_routine):
+    leaf = _leaf(deep_routine)
+
+    path = leaf.absolute_path(exclude_root_name=True)
+
+    assert path.count(".") == DEPTH - 1
+    assert deep_routine.find_descendant(path) is leaf
+    assert leaf.relative_path_from(deep_routine.children[f"r_{DEPTH - 2}"]) == path.split(".", 1)[1]
+
+
+def test_linked_params_can_be_propagated_through_deep_routine(deep_routine):
+    leaf = _leaf(deep_routine)
+    deep_routine.input_params = ["x"]
+    deep_routine.linked_params = {"x": [(leaf.absolute_path(exclude_root_name=True), "x")]}
+
+    _propagate_linked_params(deep_routine)
+
+    assert leaf.parent.linked_params == {"leaf.x": [("leaf", "x")]}
+
+
+def test_deep_routine_can_be_converted_to_qref_dictionary(deep_routine):
+    program = _bartiq_routine_to_qref_v1_dict(deep_routine)
+
+    for _ in range(DEPTH):
+        (program,) = program["children"]
+
+    assert program["name"] == "leaf"
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bartiq import evaluate
 from bartiq._routine import Routine
 
 
@@ -115,3 +116,44 @@ def routine_with_two_passthroughs():
             {"source": "c.out_1", "target": "out_1"},
         ],
     )
+
+
+# Expressions in parameters N and M using special functions, which compiled evaluators have to translate
+SPECIAL_FUNCTION_EXPRESSIONS = [
+    "round(N / 3)",
+    "max(N, M, 4)",
+    "min(N, 2) + M",
+    "multiplicity(2, N)",
+    "ceil(log2(N)) + floor(sqrt(M))",
+    "sum_over(i**2, i, 1, N)",
+    "prod_over(i, i, 1, M)",
+    "mod(N, 3) * M",
+    "(N + M)**2 + 3*(N + M) + exp(N + M)",
+]
+
+
+def routine_with_resources(with_ports=False, **resources):
+    """Leaf routine with parameters N and M and given resources, used for testing.
+
+    If `with_ports` is True, the routine also has an input port of size K and an output port of size 2*K + N.
+    """
+    ports = {
+        "in_0": {"name": "in_0", "direction": "input", "size": "K"},
+        "out_0": {"name": "out_0", "direction": "output", "size": "2*K + N"},
+    }
+    return Routine(
+        name="root",
+        input_params=["N", "M"],
+        ports=ports if with_ports else {},
+        resources={name: {"name": name, "value": value, "type": "other"} for name, value in resources.items()},
+    )
+
+
+def conditional_function(a, b):
+    """Function which can't be evaluated symbolically, used for testing functions_map."""
+    return a + b if a > 2 else a - b
+
+
+def evaluate_at(routine, values, **kwargs):
+    """Evaluate routine for given values of its parameters, passed as a dictionary."""
+    return evaluate(routine, [f"{name}={value}" for name, value in values.items()], **kwargs)